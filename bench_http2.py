@@ -0,0 +1,229 @@
+"""Compare BitrixClient over HTTP/1.1 and HTTP/2 against a local stand-in portal.
+
+The stand-in speaks TLS with ALPN (h2 and http/1.1), answers every REST call
+with a small JSON payload after --latency-ms, and delays the first response on
+each new connection by --handshake-ms to mimic a remote TCP+TLS setup.
+
+    pip install "httpx[http2]"
+    python bench_http2.py --requests 500 --concurrency 1,10,50
+
+Needs the openssl CLI for a throwaway certificate. --no-server-h2 makes the
+stand-in offer only http/1.1, which exercises the client's fallback.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+
+from bitrix import BitrixClient
+
+RESPONSE = json.dumps({"result": {"ok": True}, "time": {"operating": 0}}).encode("utf-8")
+
+
+class StandInPortal:
+    def __init__(self, latency_s: float, handshake_s: float, offer_h2: bool):
+        self.latency_s = latency_s
+        self.handshake_s = handshake_s
+        self.offer_h2 = offer_h2
+        self.connections = 0
+        self.requests = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        await asyncio.sleep(self.handshake_s)
+        ssl_object = writer.get_extra_info("ssl_object")
+        protocol = ssl_object.selected_alpn_protocol() if ssl_object is not None else None
+        try:
+            if protocol == "h2":
+                await self._serve_h2(reader, writer)
+            else:
+                await self._serve_h1(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_h1(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while True:
+            head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+            lines = head.split("\r\n")
+            method = lines[0].split(" ", 1)[0]
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(":")
+                if name:
+                    headers[name.strip().lower()] = value.strip()
+            if "content-length" in headers:
+                await reader.readexactly(int(headers["content-length"]))
+            elif headers.get("transfer-encoding", "").lower() == "chunked":
+                while True:
+                    size = int((await reader.readline()).split(b";", 1)[0], 16)
+                    await reader.readexactly(size + 2)
+                    if size == 0:
+                        break
+            self.requests += 1
+            await asyncio.sleep(self.latency_s)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(RESPONSE)}\r\n\r\n".encode("ascii")
+                + (b"" if method == "HEAD" else RESPONSE)
+            )
+            await writer.drain()
+
+    async def _serve_h2(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        import h2.config
+        import h2.connection
+        import h2.events
+        import h2.exceptions
+
+        conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        methods: dict[int, str] = {}
+        responders: set[asyncio.Task] = set()
+
+        async def respond(stream_id: int, method: str) -> None:
+            await asyncio.sleep(self.latency_s)
+            try:
+                conn.send_headers(
+                    stream_id,
+                    [
+                        (":status", "200"),
+                        ("content-type", "application/json"),
+                        ("content-length", str(len(RESPONSE))),
+                    ],
+                    end_stream=method == "HEAD",
+                )
+                if method != "HEAD":
+                    conn.send_data(stream_id, RESPONSE, end_stream=True)
+            except h2.exceptions.ProtocolError:
+                return
+            writer.write(conn.data_to_send())
+
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    methods[event.stream_id] = dict(event.headers).get(":method", "GET")
+                elif isinstance(event, h2.events.DataReceived):
+                    conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    self.requests += 1
+                    task = asyncio.create_task(respond(event.stream_id, methods.pop(event.stream_id, "POST")))
+                    responders.add(task)
+                    task.add_done_callback(responders.discard)
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    return
+            writer.write(conn.data_to_send())
+            await writer.drain()
+
+
+def make_certificate(directory: str) -> tuple[str, str]:
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", key, "-out", cert, "-days", "1",
+            "-subj", "/CN=localhost",
+            "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def percentile(samples: list[float], q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_level(
+    portal: StandInPortal,
+    webhook: str,
+    http2: bool,
+    concurrency: int,
+    total: int,
+) -> dict[str, Any]:
+    # Singleflight off and a unique parameter per call: every call is a real request.
+    client = BitrixClient(webhook, http2=http2, rate_limit_rps=0, singleflight=False, dns_cache_ttl_s=0)
+    connections_before = portal.connections
+    latencies: list[float] = []
+    counter = iter(range(total))
+
+    async def worker() -> None:
+        for n in counter:
+            started = time.perf_counter()
+            await client.call("server.time", [("n", str(n))])
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    protocol = client.metrics()["pools"]["control"]["protocol"]
+    await client.aclose()
+    return {
+        "mode": "h2" if http2 else "h1",
+        "protocol": protocol,
+        "concurrency": concurrency,
+        "rps": total / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "connections": portal.connections - connections_before,
+    }
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", default="1,10,50")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--handshake-ms", type=float, default=30.0)
+    parser.add_argument("--no-server-h2", action="store_true", help="offer only http/1.1 to test fallback")
+    args = parser.parse_args()
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = make_certificate(tmp)
+        # httpx honours SSL_CERT_FILE, so the client trusts the stand-in like a real portal.
+        os.environ["SSL_CERT_FILE"] = cert
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+        context.set_alpn_protocols(["http/1.1"] if args.no_server_h2 else ["h2", "http/1.1"])
+        portal = StandInPortal(args.latency_ms / 1000.0, args.handshake_ms / 1000.0, not args.no_server_h2)
+        server = await asyncio.start_server(portal.handle, "127.0.0.1", 0, ssl=context)
+        port = server.sockets[0].getsockname()[1]
+        webhook = f"https://localhost:{port}/rest/1/bench/"
+
+        rows = []
+        async with server:
+            for http2 in (False, True):
+                for level in levels:
+                    rows.append(await run_level(portal, webhook, http2, level, args.requests))
+
+    print(f"{'mode':<5}{'proto':<10}{'conc':>6}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'conns':>7}")
+    for row in rows:
+        print(
+            f"{row['mode']:<5}{row['protocol'] or '-':<10}{row['concurrency']:>6}{row['rps']:>10.1f}"
+            f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['connections']:>7}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,13 +1,29 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import datetime as dt
+import hashlib
+import heapq
+import importlib.util
+import inspect
+import itertools
 import logging
+import os
+import random
+import re
+import socket
+import tempfile
 import time
-from dataclasses import dataclass
+import uuid
+from collections import deque
+from contextlib import AbstractAsyncContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any
+from typing import Any, AsyncIterator, Awaitable, Callable, Container, Iterable, Iterator, Protocol, TypeVar, Union
 from urllib.parse import urlencode
 
+import httpcore
 import httpx
 
 log = logging.getLogger(__name__)
@@ -17,64 +33,1983 @@ log = logging.getLogger(__name__)
 class BitrixError(Exception):
     message: str
     details: str = ""
+    # Set when the error came from an HTTP response the portal could not answer in JSON.
+    status_code: int | None = None
+    retry_after: float | None = None
+
+
+# Bitrix REST `batch` accepts at most 50 commands per request.
+BATCH_MAX_COMMANDS = 50
+# user.get returns at most one page (50 users) per command.
+USER_GET_PAGE_SIZE = 50
+# tasks.task.list pages are 50 tasks as well; a filter takes this many creator IDs at once.
+TASK_LIST_PAGE_SIZE = 50
+TASK_SELECT_FIELDS = ("ID", "TITLE", "STATUS", "REAL_STATUS", "DEADLINE", "CREATED_DATE", "RESPONSIBLE_ID")
+# Extra fields the task mirror needs to attribute tasks and move its watermark.
+TASK_SYNC_FIELDS = (*TASK_SELECT_FIELDS, "CREATED_BY", "CHANGED_DATE")
+
+CallData = Union[list[tuple[str, str]], dict[str, str]]
+BatchCommand = tuple[str, CallData]
+# A request body is either ready bytes or a factory of a fresh async stream,
+# so streamed bodies can be replayed when a request is re-queued.
+BodyFactory = Callable[[], AsyncIterator[bytes]]
+RequestBody = Union[bytes, BodyFactory]
+# Opens the caller's upload-scheduler slot; entered by whatever actually sends the upload.
+UploadSlot = Callable[[], AbstractAsyncContextManager[Any]]
+
+# Raw bytes per streamed fileContent chunk; a multiple of 3 keeps base64 unpadded between chunks.
+FILE_CONTENT_CHUNK_BYTES = 3 * 64 * 1024
+
+
+FORM_CONTENT_TYPE = "application/x-www-form-urlencoded"
+
+
+def _form_part(boundary: str, field: str, value: str = "") -> bytes:
+    return f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"\r\n\r\n{value}'.encode("utf-8")
+
+
+def file_content_body_parts(folder_id: int, name: str, boundary: str) -> tuple[bytes, bytes]:
+    """multipart/form-data around the base64 file: the bytes before it and after it.
+
+    Unlike a urlencoded form, a multipart field carries base64 as is, so the
+    body length follows from the file size alone (see `file_content_body_length`).
+    """
+    fields = [
+        ("id", str(int(folder_id))),
+        ("data[NAME]", name),
+        ("generateUniqueName", "true"),
+        ("fileContent[0]", name),
+    ]
+    head = b"".join(_form_part(boundary, field, value) + b"\r\n" for field, value in fields)
+    # The file itself is the last field, streamed chunk by chunk.
+    head += _form_part(boundary, "fileContent[1]")
+    return head, f"\r\n--{boundary}--\r\n".encode("ascii")
+
+
+def file_content_body_length(head: bytes, tail: bytes, size_bytes: int) -> int:
+    return len(head) + 4 * ((size_bytes + 2) // 3) + len(tail)
+
+
+async def iter_file_chunks(local_path: str, chunk_size: int = FILE_CONTENT_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    with open(local_path, "rb") as file_obj:
+        while True:
+            data = await asyncio.to_thread(file_obj.read, chunk_size)
+            if not data:
+                return
+            yield data
+
+
+async def iter_file_content_body(head: bytes, chunks: AsyncIterator[bytes], tail: bytes) -> AsyncIterator[bytes]:
+    """Yield `head`, the base64 form of `chunks` a chunk at a time, then `tail`."""
+    yield head
+    carry = b""
+    async for data in chunks:
+        if carry:
+            data = carry + data
+        cut = len(data) - len(data) % 3
+        carry = data[cut:]
+        if cut:
+            yield base64.b64encode(data[:cut])
+    if carry:
+        yield base64.b64encode(carry)
+    yield tail
+
+
+# Error code Bitrix returns (with HTTP 503) when the webhook exceeds its request rate.
+QUERY_LIMIT_EXCEEDED = "QUERY_LIMIT_EXCEEDED"
+
+
+class _TokenBucket:
+    """Client-side mirror of the portal's leaky bucket.
+
+    Callers queue in FIFO order on the lock, so a burst is drained fairly
+    instead of failing. When the portal still answers QUERY_LIMIT_EXCEEDED
+    the bucket is emptied and the refill rate is halved, then recovers
+    additively on successful requests.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(0.0, float(rate))
+        self.capacity = max(1.0, float(capacity))
+        self.current_rate = self.rate
+        self.min_rate = self.rate / 8.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+        self.acquired = 0
+        self.total_wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.limit_hits = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.current_rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        if not self.enabled:
+            return 0.0
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._lock:
+                while True:
+                    self._refill()
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        break
+                    await asyncio.sleep((1.0 - self._tokens) / self.current_rate)
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait_s += waited
+        self.max_wait_s = max(self.max_wait_s, waited)
+        return waited
+
+    def penalize(self) -> None:
+        if not self.enabled:
+            return
+        self.limit_hits += 1
+        self._refill()
+        self._tokens = 0.0
+        self.current_rate = max(self.min_rate, self.current_rate / 2.0)
+
+    def reward(self) -> None:
+        if self.enabled and self.current_rate < self.rate:
+            self.current_rate = min(self.rate, self.current_rate + self.rate * 0.05)
+
+    def stats(self) -> dict[str, Any]:
+        self._refill()
+        return {
+            "enabled": self.enabled,
+            "rate": self.rate,
+            "current_rate": round(self.current_rate, 3),
+            "capacity": self.capacity,
+            "tokens": round(self._tokens, 3),
+            "waiting": self.waiting,
+            "acquired": self.acquired,
+            "total_wait_s": round(self.total_wait_s, 3),
+            "avg_wait_s": round(self.total_wait_s / self.acquired, 4) if self.acquired else 0.0,
+            "max_wait_s": round(self.max_wait_s, 3),
+            "limit_hits": self.limit_hits,
+        }
+
+
+# Per-method server time budget: Bitrix blocks a method for the rest of the
+# window once its accumulated `operating` time reaches the limit.
+OPERATION_TIME_LIMIT = "OPERATION_TIME_LIMIT"
+OPERATING_WINDOW_S = 600.0
+
+OPERATING_BUDGET_EXHAUSTED = "operating_budget_exhausted"
+
+# Raised without touching the network while a circuit is open.
+CIRCUIT_OPEN = "circuit_open"
+
+PRIORITY_HIGH = "high"
+PRIORITY_LOW = "low"
+
+# Connection pools: quick JSON calls and bulk upload bodies never share sockets.
+LANE_CONTROL = "control"
+LANE_UPLOAD = "upload"
+
+# Once a pool negotiates HTTP/2, its gate admits this many requests per connection.
+HTTP2_STREAMS_PER_CONNECTION = 16
+
+
+@dataclass
+class _MethodBudget:
+    operating_s: float = 0.0
+    reset_at: float = 0.0
+    blocked_until: float = 0.0
+    calls: int = 0
+    deferred: int = 0
+    slowed: int = 0
+
+
+class _OperatingBudget:
+    """Tracks `time.operating` per REST method as reported by the portal."""
+
+    def __init__(self, limit_s: float, slowdown_ratio: float, defer_ratio: float, max_delay_s: float = 2.0):
+        self.limit_s = max(0.0, float(limit_s))
+        self.slowdown_ratio = slowdown_ratio
+        self.defer_ratio = max(defer_ratio, slowdown_ratio)
+        self.max_delay_s = max_delay_s
+        self._methods: dict[str, _MethodBudget] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit_s > 0
+
+    def _budget(self, method: str) -> _MethodBudget:
+        budget = self._methods.get(method)
+        if budget is None:
+            budget = _MethodBudget()
+            self._methods[method] = budget
+        return budget
+
+    def record(self, method: str, time_block: Any) -> None:
+        if not isinstance(time_block, dict):
+            return
+        operating = time_block.get("operating")
+        if operating is None:
+            return
+        budget = self._budget(method)
+        budget.calls += 1
+        try:
+            budget.operating_s = float(operating)
+        except (TypeError, ValueError):
+            return
+        try:
+            budget.reset_at = float(time_block.get("operating_reset_at") or 0.0)
+        except (TypeError, ValueError):
+            budget.reset_at = 0.0
+
+    def mark_blocked(self, method: str) -> None:
+        budget = self._budget(method)
+        now = time.time()
+        budget.blocked_until = budget.reset_at if budget.reset_at > now else now + OPERATING_WINDOW_S
+        budget.operating_s = max(budget.operating_s, self.limit_s)
+
+    def usage(self, method: str) -> float:
+        budget = self._methods.get(method)
+        if budget is None or not self.enabled:
+            return 0.0
+        now = time.time()
+        if budget.blocked_until > now:
+            return 1.0
+        if budget.reset_at and budget.reset_at <= now:
+            return 0.0
+        return min(1.0, budget.operating_s / self.limit_s)
+
+    async def admit(self, method: str, priority: str) -> None:
+        if not self.enabled:
+            return
+        usage = self.usage(method)
+        if priority != PRIORITY_LOW or usage < self.slowdown_ratio:
+            return
+        budget = self._budget(method)
+        if usage >= self.defer_ratio:
+            budget.deferred += 1
+            raise BitrixError(
+                OPERATING_BUDGET_EXHAUSTED,
+                f"{method} used {usage:.0%} of its operating time; low-priority call deferred",
+            )
+        span = max(1e-6, self.defer_ratio - self.slowdown_ratio)
+        delay = self.max_delay_s * (usage - self.slowdown_ratio) / span
+        budget.slowed += 1
+        await asyncio.sleep(delay)
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        out: dict[str, dict[str, Any]] = {}
+        for method, budget in sorted(self._methods.items()):
+            out[method] = {
+                "operating_s": round(budget.operating_s, 3),
+                "limit_s": self.limit_s,
+                "usage": round(self.usage(method), 3),
+                "reset_at": budget.reset_at or None,
+                "blocked_until": budget.blocked_until or None,
+                "calls": budget.calls,
+                "slowed": budget.slowed,
+                "deferred": budget.deferred,
+            }
+        return out
+
+
+@dataclass
+class _Circuit:
+    failures: int = 0
+    opened_at: float = 0.0
+    cooldown_s: float = 0.0
+    probing: bool = False
+    trips: int = 0
+    rejected: int = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at > 0
+
+
+class _CircuitBreaker:
+    """Per-endpoint breaker: closed -> open after N consecutive failures -> half-open.
+
+    Only transport errors and non-JSON 5xx answers count as failures; a Bitrix
+    JSON error means the endpoint is alive. Once the cooldown passes, a single
+    probe request goes through; its failure reopens the circuit with a doubled
+    cooldown (up to max_cooldown_s).
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown_s: float = 30.0, max_cooldown_s: float = 300.0):
+        self.failure_threshold = max(0, int(failure_threshold))
+        self.cooldown_s = max(1.0, float(cooldown_s))
+        self.max_cooldown_s = max(self.cooldown_s, float(max_cooldown_s))
+        self._circuits: dict[str, _Circuit] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    def _circuit(self, key: str) -> _Circuit:
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = _Circuit()
+            self._circuits[key] = circuit
+        return circuit
+
+    def retry_in(self, key: str) -> float:
+        circuit = self._circuits.get(key)
+        if circuit is None or not circuit.is_open:
+            return 0.0
+        return max(0.0, circuit.opened_at + circuit.cooldown_s - time.monotonic())
+
+    def before(self, key: str) -> None:
+        if not self.enabled:
+            return
+        circuit = self._circuit(key)
+        if not circuit.is_open:
+            return
+        if circuit.probing or self.retry_in(key) > 0:
+            circuit.rejected += 1
+            raise BitrixError(
+                CIRCUIT_OPEN,
+                f"{key}: {circuit.failures} consecutive failures, next probe in {self.retry_in(key):.0f}s",
+            )
+        circuit.probing = True
+        log.info("Bitrix circuit %s half-open: sending a probe request", key)
+
+    def success(self, key: str) -> None:
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            return
+        if circuit.is_open:
+            log.info("Bitrix circuit %s closed: probe succeeded", key)
+        circuit.failures = 0
+        circuit.opened_at = 0.0
+        circuit.cooldown_s = 0.0
+        circuit.probing = False
+
+    def failure(self, key: str) -> None:
+        if not self.enabled:
+            return
+        circuit = self._circuit(key)
+        circuit.failures += 1
+        if circuit.probing:
+            circuit.probing = False
+            circuit.cooldown_s = min(self.max_cooldown_s, circuit.cooldown_s * 2)
+            circuit.opened_at = time.monotonic()
+            log.warning("Bitrix circuit %s probe failed, open for %.0fs", key, circuit.cooldown_s)
+        elif not circuit.is_open and circuit.failures >= self.failure_threshold:
+            circuit.trips += 1
+            circuit.cooldown_s = self.cooldown_s
+            circuit.opened_at = time.monotonic()
+            log.warning(
+                "Bitrix circuit %s open for %.0fs after %s consecutive failures",
+                key,
+                circuit.cooldown_s,
+                circuit.failures,
+            )
+
+    def release(self, key: str) -> None:
+        # Cancelled before an outcome: let the next request probe instead.
+        circuit = self._circuits.get(key)
+        if circuit is not None:
+            circuit.probing = False
+
+    def open_circuits(self) -> dict[str, float]:
+        return {key: self.retry_in(key) for key, circuit in self._circuits.items() if circuit.is_open}
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        return {
+            key: {
+                "open": circuit.is_open,
+                "failures": circuit.failures,
+                "retry_in_s": round(self.retry_in(key), 1),
+                "trips": circuit.trips,
+                "rejected": circuit.rejected,
+            }
+            for key, circuit in sorted(self._circuits.items())
+        }
+
+
+class _PoolGate:
+    """Admission to one httpx pool, sized to its max_connections.
+
+    httpx queues pool waiters in arrival order; the gate keeps that queue on
+    our side instead, so lower `priority` values are served first and the
+    wait is measurable.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self.in_use = 0
+        self.peak = 0
+        self.acquired = 0
+        self.waited = 0
+        self.wait_total_s = 0.0
+        self.wait_max_s = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def _take(self) -> None:
+        self.in_use += 1
+        self.acquired += 1
+        self.peak = max(self.peak, self.in_use)
+
+    def try_acquire(self) -> bool:
+        if self.in_use >= self.limit:
+            return False
+        self._take()
+        return True
+
+    def enqueue(self, priority: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        if self.try_acquire():
+            future.set_result(None)
+        else:
+            heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        return future
+
+    def abandon(self, future: asyncio.Future) -> None:
+        if future.done() and not future.cancelled():
+            self.release()
+            return
+        future.cancel()
+        self._waiters = [entry for entry in self._waiters if entry[2] is not future]
+        heapq.heapify(self._waiters)
+
+    def record_wait(self, wait_s: float) -> None:
+        self.waited += 1
+        self.wait_total_s += wait_s
+        self.wait_max_s = max(self.wait_max_s, wait_s)
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_use < self.limit:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._take()
+            future.set_result(None)
+
+    def release(self) -> None:
+        self.in_use = max(0, self.in_use - 1)
+        self._wake()
+
+    def resize(self, limit: int) -> None:
+        self.limit = max(1, int(limit))
+        self._wake()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_use": self.in_use,
+            "peak": self.peak,
+            "waiting": sum(1 for *_, future in self._waiters if not future.done()),
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "wait_avg_ms": int(self.wait_total_s / self.waited * 1000) if self.waited else 0,
+            "wait_max_ms": int(self.wait_max_s * 1000),
+        }
+
+
+class _DnsCache:
+    """Resolved addresses per host, shared by both pools.
+
+    A failed lookup falls back to the expired entry, so a DNS hiccup does not
+    take the portal down with it.
+    """
+
+    def __init__(self, ttl_s: float):
+        self.ttl_s = max(0.0, float(ttl_s))
+        self._entries: dict[tuple[str, int], tuple[float, list[str]]] = {}
+        self._lookups: dict[tuple[str, int], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_served = 0
+
+    async def resolve(self, host: str, port: int) -> list[str]:
+        key = (host, port)
+        cached = self._entries.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self.hits += 1
+            return cached[1]
+        # Connections opened together (warm-up, bursts) share one lookup.
+        lookup = self._lookups.get(key)
+        if lookup is None:
+            self.misses += 1
+            lookup = asyncio.ensure_future(
+                asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            )
+            self._lookups[key] = lookup
+            lookup.add_done_callback(lambda _t: self._lookups.pop(key, None))
+        try:
+            infos = await asyncio.shield(lookup)
+        except OSError:
+            if cached is None:
+                raise
+            self.stale_served += 1
+            log.warning("DNS lookup for %s failed, reusing cached addresses", host)
+            return cached[1]
+        addresses = list(dict.fromkeys(str(info[4][0]) for info in infos))
+        self._entries[key] = (time.monotonic() + self.ttl_s, addresses)
+        return addresses
+
+    def forget(self, host: str, port: int) -> None:
+        self._entries.pop((host, port), None)
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "ttl_s": self.ttl_s,
+            "hosts": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_served": self.stale_served,
+        }
+
+
+class _CachingBackend(httpcore.AsyncNetworkBackend):
+    # Only the TCP connect sees the cached address; TLS still verifies the hostname.
+    def __init__(self, inner: httpcore.AsyncNetworkBackend, cache: _DnsCache):
+        self._inner = inner
+        self._cache = cache
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None = None,
+        local_address: str | None = None,
+        socket_options: Any = None,
+    ) -> httpcore.AsyncNetworkStream:
+        try:
+            addresses = await self._cache.resolve(host, port)
+        except OSError as exc:
+            raise httpcore.ConnectError(str(exc)) from exc
+        last_exc: Exception | None = None
+        for address in addresses:
+            try:
+                return await self._inner.connect_tcp(
+                    address,
+                    port,
+                    timeout=timeout,
+                    local_address=local_address,
+                    socket_options=socket_options,
+                )
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as exc:
+                last_exc = exc
+        self._cache.forget(host, port)
+        if last_exc is None:
+            raise httpcore.ConnectError(f"No addresses resolved for {host}")
+        raise last_exc
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: float | None = None,
+        socket_options: Any = None,
+    ) -> httpcore.AsyncNetworkStream:
+        return await self._inner.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._inner.sleep(seconds)
+
+
+# httpcore takes a custom network backend since 0.17; without it the DNS cache stays off.
+DNS_CACHE_SUPPORTED = "network_backend" in inspect.signature(httpcore.AsyncConnectionPool).parameters
+
+_HTTPCORE_ERRORS: tuple[tuple[type[Exception], type[httpx.TransportError]], ...] = (
+    (httpcore.ConnectTimeout, httpx.ConnectTimeout),
+    (httpcore.ReadTimeout, httpx.ReadTimeout),
+    (httpcore.WriteTimeout, httpx.WriteTimeout),
+    (httpcore.PoolTimeout, httpx.PoolTimeout),
+    (httpcore.TimeoutException, httpx.TimeoutException),
+    (httpcore.ConnectError, httpx.ConnectError),
+    (httpcore.ReadError, httpx.ReadError),
+    (httpcore.WriteError, httpx.WriteError),
+    (httpcore.NetworkError, httpx.NetworkError),
+    (httpcore.ProxyError, httpx.ProxyError),
+    (httpcore.UnsupportedProtocol, httpx.UnsupportedProtocol),
+    (httpcore.RemoteProtocolError, httpx.RemoteProtocolError),
+    (httpcore.LocalProtocolError, httpx.LocalProtocolError),
+    (httpcore.ProtocolError, httpx.ProtocolError),
+)
+
+
+@contextmanager
+def _httpx_errors() -> Iterator[None]:
+    # Retry classification only knows httpx exceptions.
+    try:
+        yield
+    except Exception as exc:
+        for source, target in _HTTPCORE_ERRORS:
+            if isinstance(exc, source):
+                raise target(str(exc)) from exc
+        raise
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream: Any):
+        self._stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with _httpx_errors():
+            async for part in self._stream:
+                yield part
+
+    async def aclose(self) -> None:
+        if hasattr(self._stream, "aclose"):
+            with _httpx_errors():
+                await self._stream.aclose()
+
+
+class _DnsCachingTransport(httpx.AsyncBaseTransport):
+    """httpx transport over an httpcore pool that connects through `_DnsCache`.
+
+    Uses only the public httpcore pool API; proxies from the environment are
+    still mounted by httpx itself and resolve as usual.
+    """
+
+    def __init__(self, cache: _DnsCache, limits: httpx.Limits, http2: bool):
+        self._pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http2=http2,
+            network_backend=_CachingBackend(httpcore.AnyIOBackend(), cache),
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _httpx_errors():
+            response = await self._pool.handle_async_request(core_request)
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self._pool.aclose()
+
+
+def _origin(url: str) -> str:
+    parsed = httpx.URL(url)
+    return f"{parsed.scheme}://{parsed.netloc.decode('ascii')}/"
+
+
+# Portal capabilities detected by probe_capabilities() or learned from live traffic.
+CAP_ORDER_CREATED_DATE = "tasks.order_created_date"
+CAP_FIELD_CASE = "tasks.field_case"
+CAP_UPLOAD_FILE_CONTENT = "disk.upload.file_content"
+CAP_UPLOAD_URL = "disk.upload.upload_url"
+
+_BOOL_CAPABILITIES = frozenset({CAP_ORDER_CREATED_DATE, CAP_UPLOAD_FILE_CONTENT, CAP_UPLOAD_URL})
+_STRATEGY_CAPABILITIES = {"fileContent": CAP_UPLOAD_FILE_CONTENT, "uploadUrl": CAP_UPLOAD_URL}
+
+# Failures that say nothing about what the portal supports.
+_TRANSIENT_ERRORS = frozenset(
+    {CIRCUIT_OPEN, OPERATION_TIME_LIMIT, QUERY_LIMIT_EXCEEDED, OPERATING_BUDGET_EXHAUSTED, "INTERNAL_SERVER_ERROR"}
+)
+
+
+def is_order_rejection(exc: BitrixError) -> bool:
+    """The portal answered that it cannot sort by the requested field.
+
+    Only such an answer may be stored as a missing capability: an outage while
+    probing must not disable CREATED_DATE ordering for good.
+    """
+    if exc.status_code is not None or exc.message in _TRANSIENT_ERRORS:
+        return False
+    text = f"{exc.message} {exc.details}".upper()
+    return exc.message == "ERROR_CORE" or "ORDER" in text or "CREATED_DATE" in text
+
+
+def _camel_field(name: str) -> str:
+    head, *rest = name.lower().split("_")
+    return head + "".join(part.capitalize() for part in rest)
+
+
+def encode_capability(value: bool | str) -> str:
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return str(value)
+
+
+def decode_capability(name: str, raw: str) -> bool | str:
+    if name in _BOOL_CAPABILITIES:
+        return raw == "1"
+    return raw
+
+
+# Fixed per-request cost of an upload, expressed in bytes, for per-byte latency normalization.
+UPLOAD_LATENCY_OVERHEAD_BYTES = 256 * 1024
+
+
+class _LatencyModel:
+    """Per-key latency estimates (EWMA + windowed quantile) used to size request timeouts.
+
+    Keys are REST methods, or `upload:<strategy>` with samples in seconds per
+    byte. A timed-out request is recorded at its timeout, so a slowing portal
+    pushes the estimate up instead of timing out forever.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        quantile: float = 0.99,
+        safety: float = 3.0,
+        floor_s: float = 2.0,
+        min_samples: int = 20,
+        window: int = 256,
+        alpha: float = 0.2,
+    ):
+        self.enabled = enabled
+        self.quantile = min(max(quantile, 0.5), 1.0)
+        self.safety = max(1.0, safety)
+        self.floor_s = max(0.1, floor_s)
+        self.min_samples = max(1, int(min_samples))
+        self.window = max(self.min_samples, int(window))
+        self.alpha = alpha
+        self._samples: dict[str, deque[float]] = {}
+        self._ewma: dict[str, float] = {}
+
+    def observe(self, key: str, value: float) -> None:
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = deque(maxlen=self.window)
+            self._samples[key] = samples
+        samples.append(value)
+        previous = self._ewma.get(key)
+        self._ewma[key] = value if previous is None else previous + self.alpha * (value - previous)
+
+    def estimate(self, key: str, quantile: float | None = None) -> float | None:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        q = self.quantile if quantile is None else quantile
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def timeout(self, key: str, ceiling_s: float, scale: float = 1.0) -> float:
+        """p<quantile> x safety, clamped to [floor_s, ceiling_s]; the ceiling until enough samples."""
+        if not self.enabled:
+            return ceiling_s
+        estimate = self.estimate(key)
+        if estimate is None:
+            return ceiling_s
+        return min(ceiling_s, max(self.floor_s, estimate * scale * self.safety))
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        out: dict[str, dict[str, Any]] = {}
+        for key, samples in sorted(self._samples.items()):
+            out[key] = {
+                "samples": len(samples),
+                "ewma": self._ewma.get(key),
+                "quantile": self.estimate(key),
+            }
+        return out
+
+
+class _RatioBudget:
+    """Every request earns `ratio` of a token; an extra request (hedge, retry) spends a whole one.
+
+    Extra requests therefore stay below `ratio` of the traffic on average, with
+    at most `burst` of them back to back.
+    """
+
+    def __init__(self, ratio: float, burst: float = 10.0):
+        self.ratio = max(0.0, float(ratio))
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst if self.ratio > 0 else 0.0
+
+    def earn(self) -> None:
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+T = TypeVar("T")
+
+# Status codes worth retrying. A 500/502/504 may hide a write the upstream already
+# processed (a proxy answers 502 after forwarding), so those only for reads.
+RETRY_STATUS_ANY = frozenset({429, 503})
+RETRY_STATUS_IDEMPOTENT = frozenset({500, 502, 504})
+# Bitrix error codes that describe a transient portal condition.
+RETRY_ERROR_IDEMPOTENT = frozenset({"INTERNAL_SERVER_ERROR"})
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        from email.utils import parsedate_to_datetime
+
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """Single retry decision point for every Bitrix request.
+
+    Errors are classified by type: httpx exception class, HTTP status, Bitrix
+    error code. Failures before the request reached the portal (connect, pool)
+    are retried for any method. Failures after that (read timeout, 500/504)
+    only for idempotent ones, so a write is never sent twice. The delay is
+    full-jitter exponential backoff, but never shorter than `Retry-After`.
+    Retries share a process-wide budget of `budget_ratio` x requests.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay_s: float = 0.5,
+        max_delay_s: float = 10.0,
+        budget_ratio: float = 0.1,
+        max_retry_after_s: float = 60.0,
+    ):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay_s = max(0.0, float(base_delay_s))
+        self.max_delay_s = max(self.base_delay_s, float(max_delay_s))
+        self.max_retry_after_s = max_retry_after_s
+        self._budget = _RatioBudget(budget_ratio)
+        self.retries = 0
+        self.denied_by_budget = 0
+
+    def record_request(self) -> None:
+        self._budget.earn()
+
+    @staticmethod
+    def _root(exc: BaseException) -> BaseException:
+        # "All disk upload strategies failed" wraps the last strategy error as __cause__.
+        while isinstance(exc, BitrixError) and exc.status_code is None and exc.__cause__ is not None:
+            exc = exc.__cause__
+        return exc
+
+    def outcome_unknown(self, exc: BaseException) -> bool:
+        """The portal may have processed the request anyway (retryable only as idempotent)."""
+        return self.classify(exc, True) is not None and self.classify(exc, False) is None
+
+    def classify(self, exc: BaseException, idempotent: bool) -> str | None:
+        """Return why the error is retryable, or None."""
+        exc = self._root(exc)
+        if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return "connect"
+        if isinstance(exc, httpx.TransportError):
+            return "transport" if idempotent else None
+        if isinstance(exc, BitrixError):
+            if exc.message in (CIRCUIT_OPEN, OPERATION_TIME_LIMIT, QUERY_LIMIT_EXCEEDED, OPERATING_BUDGET_EXHAUSTED):
+                # Already handled by the breaker, the operating budget or the rate limiter.
+                return None
+            if exc.status_code in RETRY_STATUS_ANY:
+                return f"http_{exc.status_code}"
+            if idempotent and exc.status_code in RETRY_STATUS_IDEMPOTENT:
+                return f"http_{exc.status_code}"
+            if idempotent and exc.message in RETRY_ERROR_IDEMPOTENT:
+                return exc.message
+        return None
+
+    def next_delay(self, exc: BaseException, attempt: int, idempotent: bool = True) -> float | None:
+        """Delay before attempt+1, or None when the error must be raised."""
+        if self.classify(exc, idempotent) is None:
+            return None
+        if not self._budget.try_spend():
+            self.denied_by_budget += 1
+            return None
+        self.retries += 1
+        delay = random.uniform(0.0, min(self.max_delay_s, self.base_delay_s * (2 ** (attempt - 1))))
+        root = self._root(exc)
+        retry_after = root.retry_after if isinstance(root, BitrixError) else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_retry_after_s))
+        return delay
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "denied_by_budget": self.denied_by_budget,
+            "budget_tokens": round(self._budget.tokens, 2),
+        }
+
+
+def _timeout_seconds(timeout: float | httpx.Timeout) -> float:
+    if isinstance(timeout, httpx.Timeout):
+        return float(timeout.read or 0.0)
+    return float(timeout)
+
+
+# Size buckets for upload strategy statistics: <=256 KB, <=1 MB, <=4 MB, <=16 MB, larger.
+UPLOAD_SIZE_BUCKETS = (256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+# Historical cut-over; only used to order strategies until a bucket has its own statistics.
+UPLOAD_DEFAULT_SMALL_BYTES = 2 * 1024 * 1024
+
+
+def upload_size_bucket(size_bytes: int) -> int:
+    for index, limit in enumerate(UPLOAD_SIZE_BUCKETS):
+        if size_bytes <= limit:
+            return index
+    return len(UPLOAD_SIZE_BUCKETS)
+
+
+@dataclass
+class _StrategyStats:
+    successes: float = 0.0
+    failures: float = 0.0
+    ewma_ms: float | None = None
+
+    @property
+    def success_rate(self) -> float:
+        # Beta(1, 1) prior: an unseen strategy counts as 50% reliable.
+        return (self.successes + 1.0) / (self.successes + self.failures + 2.0)
+
+
+class _StrategySelector:
+    """Orders upload strategies per size bucket by expected time to a successful upload.
+
+    Counts decay on every outcome, so a strategy that recovers on the portal
+    wins its place back; `explore_ratio` of the uploads try the runner-up first.
+    """
+
+    def __init__(self, explore_ratio: float = 0.05, decay: float = 0.95, alpha: float = 0.3):
+        self.explore_ratio = min(max(0.0, float(explore_ratio)), 1.0)
+        self.decay = decay
+        self.alpha = alpha
+        self.explorations = 0
+        self._stats: dict[tuple[str, int], _StrategyStats] = {}
+
+    def load(self, rows: list[tuple[str, int, float, float, float | None]]) -> None:
+        for strategy, bucket, successes, failures, ewma_ms in rows:
+            self._stats[(strategy, int(bucket))] = _StrategyStats(float(successes), float(failures), ewma_ms)
+
+    def stats(self, strategy: str, bucket: int) -> _StrategyStats:
+        key = (strategy, bucket)
+        item = self._stats.get(key)
+        if item is None:
+            item = _StrategyStats()
+            self._stats[key] = item
+        return item
+
+    def _expected_ms(self, strategy: str, bucket: int, default_rank: int) -> float:
+        item = self._stats.get((strategy, bucket))
+        # Without samples keep the historical order: the default first choice looks twice as fast.
+        ewma_ms = item.ewma_ms if item is not None and item.ewma_ms is not None else 1000.0 * (default_rank + 1)
+        success_rate = item.success_rate if item is not None else 0.5
+        return ewma_ms / success_rate
+
+    def order(self, size_bytes: int, default_order: list[str]) -> list[str]:
+        bucket = upload_size_bucket(size_bytes)
+        ranked = sorted(
+            default_order,
+            key=lambda name: self._expected_ms(name, bucket, default_order.index(name)),
+        )
+        if len(ranked) > 1 and self.explore_ratio > 0 and random.random() < self.explore_ratio:
+            self.explorations += 1
+            ranked[0], ranked[1] = ranked[1], ranked[0]
+        return ranked
+
+    def record(self, strategy: str, size_bytes: int, ok: bool, elapsed_ms: float) -> tuple[int, _StrategyStats]:
+        bucket = upload_size_bucket(size_bytes)
+        item = self.stats(strategy, bucket)
+        item.successes *= self.decay
+        item.failures *= self.decay
+        if ok:
+            item.successes += 1.0
+        else:
+            item.failures += 1.0
+        # Failures usually end in a timeout, so their latency counts against the strategy too.
+        if item.ewma_ms is None:
+            item.ewma_ms = float(elapsed_ms)
+        else:
+            item.ewma_ms += self.alpha * (float(elapsed_ms) - item.ewma_ms)
+        return bucket, item
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        out: dict[str, dict[str, Any]] = {}
+        for (strategy, bucket), item in sorted(self._stats.items()):
+            out[f"{strategy}/b{bucket}"] = {
+                "successes": round(item.successes, 2),
+                "failures": round(item.failures, 2),
+                "success_rate": round(item.success_rate, 3),
+                "ewma_ms": round(item.ewma_ms) if item.ewma_ms is not None else None,
+            }
+        return out
+
+
+# Content-addressed keys of the Disk upload index (see UploadIndex).
+DEDUP_KEY_SHA256 = "sha256:"
+DEDUP_KEY_TELEGRAM = "tg:"
+# How far back find_landed_upload() looks, on top of the attempt start (portal clock skew).
+LANDED_UPLOAD_SLACK_S = 300.0
+
+
+def sha256_content_key(local_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(local_path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(FILE_CONTENT_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return DEDUP_KEY_SHA256 + digest.hexdigest()
+
+
+def telegram_content_key(file_unique_id: str) -> str:
+    return DEDUP_KEY_TELEGRAM + file_unique_id
+
+
+class UploadIndex(Protocol):
+    """Persistent content key -> Disk file ID map (implemented by usermap.UserMap).
+
+    The methods are coroutines so a disk-backed index never blocks the event loop.
+    """
+
+    async def afind_disk_upload(self, keys: list[str], folder_id: int, max_age_s: float) -> tuple[int, float] | None: ...
+
+    async def aremember_disk_upload(self, keys: list[str], folder_id: int, file_id: int) -> None: ...
+
+    async def aforget_disk_upload(self, file_id: int) -> None: ...
+
+
+# Read-only REST verbs that are safe to share between concurrent callers.
+_READ_ONLY_VERBS = frozenset({"get", "list", "fields", "getfields", "getlist", "search", "getchildren", "current"})
+_READ_ONLY_METHODS = frozenset({"profile", "server.time", "methods", "scope", "app.info"})
+
+
+def is_read_only_method(method: str) -> bool:
+    if method in _READ_ONLY_METHODS:
+        return True
+    verb = method.rsplit(".", 1)[-1].lower()
+    return "." in method and verb in _READ_ONLY_VERBS
+
+
+def _call_key(method: str, data: CallData) -> tuple[str, tuple[tuple[str, str], ...]]:
+    if isinstance(data, dict):
+        items = sorted((str(k), str(v)) for k, v in data.items())
+    else:
+        # Order matters for repeated keys (select[], order[...]), so keep it.
+        items = [(str(k), str(v)) for k, v in data]
+    return method, tuple(items)
+
+
+@dataclass
+class _PendingCall:
+    method: str
+    data: CallData
+    timeout: float | httpx.Timeout | None
+    future: asyncio.Future = field(repr=False)
+
+
+@dataclass
+class _UploadFlight:
+    key: tuple[int, str]
+    task: asyncio.Task = field(repr=False)
+    waiters: int = 0
+    finished: bool = False
 
 
 class BitrixClient:
     def __init__(
         self,
-        webhook_base: str,
-        timeout: float = 20.0,
-        upload_timeout: float = 90.0,
-        upload_url_timeout: float = 25.0,
-        small_upload_probe_timeout: float = 4.0,
-        small_upload_final_timeout: float = 5.0,
-    ):
-        self.webhook_base = webhook_base
-        self.timeout = timeout
-        self.upload_timeout = upload_timeout
-        self.upload_url_timeout = upload_url_timeout
-        self.small_upload_probe_timeout = small_upload_probe_timeout
-        self.small_upload_final_timeout = small_upload_final_timeout
-        self._http = httpx.AsyncClient(
-            timeout=self.timeout,
-            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
-            http2=False,
+        webhook_base: str,
+        timeout: float = 20.0,
+        upload_timeout: float = 90.0,
+        upload_url_timeout: float = 25.0,
+        small_upload_probe_timeout: float = 4.0,
+        small_upload_final_timeout: float = 5.0,
+        batch_window_ms: float = 0.0,
+        rate_limit_rps: float = 2.0,
+        rate_limit_burst: int = 50,
+        rate_limit_max_retries: int = 3,
+        operating_limit_s: float = 480.0,
+        operating_slowdown_ratio: float = 0.5,
+        operating_defer_ratio: float = 0.8,
+        singleflight: bool = True,
+        capability_listener: Callable[[str, bool | str], None] | None = None,
+        upload_index: UploadIndex | None = None,
+        upload_strategy_explore: float = 0.05,
+        strategy_stats_listener: Callable[[str, int, float, float, float | None], None] | None = None,
+        dedup_verify_s: float = 3600.0,
+        dedup_ttl_s: float = 30 * 24 * 3600.0,
+        adaptive_timeouts: bool = True,
+        timeout_quantile: float = 0.99,
+        timeout_safety: float = 3.0,
+        timeout_floor_s: float = 2.0,
+        timeout_min_samples: int = 20,
+        hedging: bool = False,
+        hedge_quantile: float = 0.95,
+        hedge_budget_ratio: float = 0.1,
+        circuit_failures: int = 5,
+        circuit_cooldown_s: float = 30.0,
+        circuit_max_cooldown_s: float = 300.0,
+        retry_policy: RetryPolicy | None = None,
+        control_max_connections: int = 20,
+        control_keepalive_s: float = 30.0,
+        upload_max_connections: int = 8,
+        upload_keepalive_s: float = 10.0,
+        dns_cache_ttl_s: float = 300.0,
+        http2: bool = False,
+    ):
+        self.webhook_base = webhook_base
+        self.timeout = timeout
+        self.upload_timeout = upload_timeout
+        self.upload_url_timeout = upload_url_timeout
+        self.small_upload_probe_timeout = small_upload_probe_timeout
+        self.small_upload_final_timeout = small_upload_final_timeout
+        # Coalescing window for concurrent call()s; 0 disables micro-batching.
+        self.batch_window_s = max(0.0, float(batch_window_ms)) / 1000.0
+        self._pending_calls: list[_PendingCall] = []
+        self._batch_flush_handle: asyncio.TimerHandle | None = None
+        self._background_tasks: set[asyncio.Task] = set()
+        # One bucket per client; the bot keeps a single client per process.
+        self._rate_limiter = _TokenBucket(rate_limit_rps, rate_limit_burst)
+        self.rate_limit_max_retries = max(0, int(rate_limit_max_retries))
+        self._operating = _OperatingBudget(operating_limit_s, operating_slowdown_ratio, operating_defer_ratio)
+        # Identical concurrent reads share one request; the shared payload must be treated as read-only.
+        self.singleflight = singleflight
+        self._inflight: dict[tuple[Any, ...], asyncio.Task] = {}
+        self.singleflight_hits = 0
+        self.singleflight_misses = 0
+        # Missing key = unknown; the client only skips a request when a capability is known False.
+        self.capabilities: dict[str, bool | str] = {}
+        self.capability_listener = capability_listener
+        # Index entries older than dedup_verify_s are checked with disk.file.get before reuse.
+        self.upload_index = upload_index
+        self.dedup_verify_s = max(0.0, float(dedup_verify_s))
+        self.dedup_ttl_s = max(0.0, float(dedup_ttl_s))
+        self._upload_inflight: dict[tuple[int, str], _UploadFlight] = {}
+        # Files uploaded by this process and not yet attached to a task -> how many callers hold them.
+        self._upload_holders: dict[int, int] = {}
+        self._strategy_selector = _StrategySelector(upload_strategy_explore)
+        self.strategy_stats_listener = strategy_stats_listener
+        # The static timeouts above act as ceilings for the adaptive ones.
+        self._latency = _LatencyModel(
+            adaptive_timeouts, timeout_quantile, timeout_safety, timeout_floor_s, timeout_min_samples
+        )
+        # Opt-in: a second identical attempt once the first outlives the observed p<hedge_quantile>.
+        self.hedging = hedging
+        self.hedge_quantile = min(max(hedge_quantile, 0.5), 0.999)
+        self._hedge_budget = _RatioBudget(hedge_budget_ratio)
+        self.hedges_started = 0
+        self.hedges_won = 0
+        self.hedges_denied = 0
+        self._breaker = _CircuitBreaker(circuit_failures, circuit_cooldown_s, circuit_max_cooldown_s)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.dedup_hits = 0
+        self.dedup_misses = 0
+        # Control calls may borrow a free upload connection and jump the upload
+        # queue; uploads never touch the control pool.
+        self._pools = {
+            LANE_CONTROL: _PoolGate(control_max_connections),
+            LANE_UPLOAD: _PoolGate(upload_max_connections),
+        }
+        self.control_borrowed = 0
+        # HTTP/2 is offered via ALPN; a portal that answers HTTP/1.1 keeps the plain pools.
+        if http2 and importlib.util.find_spec("h2") is None:
+            log.warning("BITRIX_HTTP2 requires the h2 package (pip install 'httpx[http2]'); using HTTP/1.1")
+            http2 = False
+        self.http2 = http2
+        self._pool_limits = {lane: gate.limit for lane, gate in self._pools.items()}
+        self._protocols: dict[str, str | None] = {LANE_CONTROL: None, LANE_UPLOAD: None}
+        self._dns = _DnsCache(dns_cache_ttl_s) if dns_cache_ttl_s > 0 else None
+        if self._dns is not None and not DNS_CACHE_SUPPORTED:
+            log.warning("DNS cache needs httpcore>=0.17; resolving per connection")
+            self._dns = None
+        self._http = self._build_http(
+            self.timeout,
+            httpx.Limits(
+                max_keepalive_connections=self._pools[LANE_CONTROL].limit,
+                max_connections=self._pools[LANE_CONTROL].limit,
+                keepalive_expiry=max(0.0, float(control_keepalive_s)),
+            ),
+        )
+        self._upload_http = self._build_http(
+            self.upload_timeout,
+            httpx.Limits(
+                max_keepalive_connections=self._pools[LANE_UPLOAD].limit,
+                max_connections=self._pools[LANE_UPLOAD].limit,
+                keepalive_expiry=max(0.0, float(upload_keepalive_s)),
+            ),
+        )
+        self._webhook_origin = _origin(webhook_base)
+        # uploadUrl may point at another host; heartbeats follow the last one seen.
+        self._upload_origin = self._webhook_origin
+        self._last_used = {LANE_CONTROL: 0.0, LANE_UPLOAD: 0.0}
+        self.connections_warmed = 0
+        self.heartbeats = 0
+
+    def _build_http(self, timeout: float, limits: httpx.Limits) -> httpx.AsyncClient:
+        transport = _DnsCachingTransport(self._dns, limits, self.http2) if self._dns is not None else None
+        return httpx.AsyncClient(timeout=timeout, limits=limits, http2=self.http2, transport=transport)
+
+    @staticmethod
+    def _exc_brief(exc: Exception) -> str:
+        text = str(exc).strip()
+        if text:
+            return f"{exc.__class__.__name__}: {text}"
+        return exc.__class__.__name__
+
+    @staticmethod
+    def _parse_payload(response: httpx.Response) -> dict[str, Any]:
+        try:
+            payload = response.json()
+        except Exception:
+            raise BitrixError(
+                f"Bitrix returned non-JSON response (HTTP {response.status_code})",
+                response.text,
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+            )
+
+        if "error" in payload:
+            raise BitrixError(
+                payload.get("error", "bitrix_error"),
+                payload.get("error_description", ""),
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
+            )
+        return payload
+
+    def unavailable_for(self) -> float | None:
+        """Seconds until the next recovery probe if any endpoint circuit is open, else None."""
+        open_circuits = self._breaker.open_circuits()
+        if not open_circuits:
+            return None
+        return max(open_circuits.values())
+
+    async def _acquire_connection(self, lane: str) -> str:
+        """Wait for a connection slot; returns the lane whose pool to use."""
+        control = self._pools[LANE_CONTROL]
+        upload = self._pools[LANE_UPLOAD]
+        if lane == LANE_UPLOAD:
+            candidates = {LANE_UPLOAD: upload.enqueue(1)}
+        elif control.try_acquire():
+            return LANE_CONTROL
+        elif upload.try_acquire():
+            self.control_borrowed += 1
+            return LANE_UPLOAD
+        else:
+            candidates = {LANE_CONTROL: control.enqueue(0), LANE_UPLOAD: upload.enqueue(0)}
+        started = time.monotonic()
+        queued = not any(future.done() for future in candidates.values())
+        granted: str | None = None
+        try:
+            await asyncio.wait(candidates.values(), return_when=asyncio.FIRST_COMPLETED)
+            for name, future in candidates.items():
+                if future.done() and not future.cancelled():
+                    granted = name
+                    break
+        finally:
+            for name, future in candidates.items():
+                if name != granted:
+                    self._pools[name].abandon(future)
+        if granted is None:
+            raise RuntimeError("connection pool wait finished without a grant")
+        if queued:
+            self._pools[granted].record_wait(time.monotonic() - started)
+        if lane == LANE_CONTROL and granted == LANE_UPLOAD:
+            self.control_borrowed += 1
+        return granted
+
+    async def aclose(self) -> None:
+        await asyncio.gather(self._http.aclose(), self._upload_http.aclose(), return_exceptions=True)
+
+    def _note_protocol(self, lane: str, http_version: str) -> None:
+        if self._protocols[lane] == http_version:
+            return
+        self._protocols[lane] = http_version
+        if not self.http2:
+            return
+        base = self._pool_limits[lane]
+        limit = base * HTTP2_STREAMS_PER_CONNECTION if http_version == "HTTP/2" else base
+        self._pools[lane].resize(limit)
+        log.info("Bitrix %s pool negotiated %s, admitting %s concurrent requests", lane, http_version, limit)
+
+    async def _touch(self, lane: str, origin: str, count: int) -> int:
+        """Open or refresh up to `count` keep-alive connections of one pool without queuing."""
+        gate = self._pools[lane]
+        http = self._upload_http if lane == LANE_UPLOAD else self._http
+
+        async def one() -> bool:
+            if not gate.try_acquire():
+                return False
+            try:
+                # Any HTTP answer means the TCP/TLS session is up and pooled.
+                response = await http.head(origin, timeout=min(self.timeout, 10.0))
+                self._note_protocol(lane, response.http_version)
+                return True
+            except httpx.HTTPError as exc:
+                log.debug("Bitrix %s connection warm-up failed: %s", lane, self._exc_brief(exc))
+                return False
+            finally:
+                gate.release()
+
+        results = await asyncio.gather(*(one() for _ in range(max(0, count))))
+        self._last_used[lane] = time.monotonic()
+        return sum(results)
+
+    async def warm_up(self, control_connections: int = 2, upload_connections: int = 1) -> dict[str, int]:
+        """Resolve the portal and open connections in both pools before the first real request."""
+        started = time.monotonic()
+        control, upload = await asyncio.gather(
+            self._touch(LANE_CONTROL, self._webhook_origin, control_connections),
+            self._touch(LANE_UPLOAD, self._upload_origin, upload_connections),
+        )
+        self.connections_warmed += control + upload
+        log.info(
+            "Bitrix connections warmed control=%s/%s upload=%s/%s elapsed_ms=%s",
+            control,
+            control_connections,
+            upload,
+            upload_connections,
+            int((time.monotonic() - started) * 1000),
+        )
+        return {LANE_CONTROL: control, LANE_UPLOAD: upload}
+
+    async def heartbeat(self, interval_s: float, control_connections: int = 2, upload_connections: int = 1) -> None:
+        """Touch pools that sat idle for a whole interval so keep-alive sockets survive quiet hours."""
+        targets = ((LANE_CONTROL, control_connections), (LANE_UPLOAD, upload_connections))
+        while True:
+            await asyncio.sleep(interval_s)
+            now = time.monotonic()
+            for lane, count in targets:
+                if count <= 0 or self._pools[lane].in_use or now - self._last_used[lane] < interval_s:
+                    continue
+                origin = self._upload_origin if lane == LANE_UPLOAD else self._webhook_origin
+                await self._touch(lane, origin, count)
+                self.heartbeats += 1
+
+    async def _guarded_post(
+        self,
+        circuit_key: str,
+        url: str,
+        lane: str = LANE_CONTROL,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        self._breaker.before(circuit_key)
+        self.retry_policy.record_request()
+        try:
+            pool = await self._acquire_connection(lane)
+        except BaseException:
+            self._breaker.release(circuit_key)
+            raise
+        http = self._upload_http if pool == LANE_UPLOAD else self._http
+        try:
+            response = await http.post(url, **kwargs)
+        except httpx.TransportError:
+            self._breaker.failure(circuit_key)
+            raise
+        except BaseException:
+            self._breaker.release(circuit_key)
+            raise
+        finally:
+            self._pools[pool].release()
+            self._last_used[pool] = time.monotonic()
+        self._note_protocol(pool, response.http_version)
+        if response.status_code >= 500:
+            try:
+                response.json()
+            except ValueError:
+                self._breaker.failure(circuit_key)
+                return response
+        self._breaker.success(circuit_key)
+        return response
+
+    async def _post_rest(
+        self,
+        method: str,
+        content: RequestBody,
+        timeout: float | httpx.Timeout,
+        content_length: int | None = None,
+        latency_key: str | None = None,
+        lane: str = LANE_CONTROL,
+        content_type: str = FORM_CONTENT_TYPE,
+    ) -> dict[str, Any]:
+        # Single exit point for webhook REST traffic: every request takes a
+        # rate-limit token, and QUERY_LIMIT_EXCEEDED is absorbed by re-queuing.
+        url = f"{self.webhook_base}{method}"
+        headers = {"Content-Type": content_type}
+        if content_length is not None:
+            # Without it httpx streams an async body with chunked transfer encoding.
+            headers["Content-Length"] = str(content_length)
+        for attempt in range(self.rate_limit_max_retries + 1):
+            waited = await self._rate_limiter.acquire()
+            if waited >= 1.0:
+                log.debug("Bitrix rate limiter wait method=%s waited_s=%.2f", method, waited)
+            started = time.monotonic()
+            try:
+                response = await self._guarded_post(
+                    method,
+                    url,
+                    lane=lane,
+                    content=content() if callable(content) else content,
+                    headers=headers,
+                    timeout=timeout,
+                )
+            except httpx.TimeoutException:
+                if latency_key is not None:
+                    self._latency.observe(latency_key, _timeout_seconds(timeout))
+                raise
+            if latency_key is not None:
+                self._latency.observe(latency_key, time.monotonic() - started)
+            try:
+                payload = self._parse_payload(response)
+            except BitrixError as exc:
+                if exc.message == OPERATION_TIME_LIMIT:
+                    self._operating.mark_blocked(method)
+                if exc.message != QUERY_LIMIT_EXCEEDED or not self._rate_limiter.enabled:
+                    raise
+                self._rate_limiter.penalize()
+                if attempt >= self.rate_limit_max_retries:
+                    raise
+                log.warning(
+                    "Bitrix %s method=%s attempt=%s/%s, re-queuing at rate=%.2f/s",
+                    QUERY_LIMIT_EXCEEDED,
+                    method,
+                    attempt + 1,
+                    self.rate_limit_max_retries + 1,
+                    self._rate_limiter.current_rate,
+                )
+                continue
+            self._rate_limiter.reward()
+            self._operating.record(method, payload.get("time"))
+            return payload
+        raise BitrixError(QUERY_LIMIT_EXCEEDED, method)
+
+    async def _request(
+        self,
+        method: str,
+        data: CallData,
+        timeout: float | httpx.Timeout | None = None,
+    ) -> dict[str, Any]:
+        encoded = urlencode(data).encode("utf-8")
+        request_timeout = timeout
+        if request_timeout is None and is_read_only_method(method):
+            request_timeout = self._latency.timeout(method, self.timeout)
+        elif request_timeout is None:
+            # A write cut short may already be applied on the portal, and the user's retry
+            # would duplicate it: writes keep the full static timeout.
+            request_timeout = self.timeout
+        return await self._post_rest(method, encoded, request_timeout, latency_key=method)
+
+    # --- capabilities ------------------------------------------------------
+
+    def load_capabilities(self, stored: dict[str, str]) -> None:
+        for name, raw in stored.items():
+            self.capabilities[name] = decode_capability(name, raw)
+
+    def load_strategy_stats(self, rows: list[tuple[str, int, float, float, float | None]]) -> None:
+        self._strategy_selector.load(rows)
+
+    def _record_strategy_outcome(self, strategy: str, size_bytes: int, ok: bool, elapsed_ms: float) -> None:
+        bucket, item = self._strategy_selector.record(strategy, size_bytes, ok, elapsed_ms)
+        log.info(
+            "Upload strategy stats strategy=%s bucket=%s success_rate=%.2f ewma_ms=%s",
+            strategy,
+            bucket,
+            item.success_rate,
+            int(item.ewma_ms or 0),
         )
+        if self.strategy_stats_listener is not None:
+            try:
+                self.strategy_stats_listener(strategy, bucket, item.successes, item.failures, item.ewma_ms)
+            except Exception:
+                log.exception("Cannot persist upload strategy stats %s/%s", strategy, bucket)
+
+    def set_capability(self, name: str, value: bool | str) -> None:
+        if self.capabilities.get(name) == value:
+            return
+        log.info("Bitrix capability %s=%s", name, value)
+        self.capabilities[name] = value
+        if self.capability_listener is not None:
+            try:
+                self.capability_listener(name, value)
+            except Exception:
+                log.exception("Cannot persist Bitrix capability %s", name)
+
+    def _task_select(self, fields: Iterable[str]) -> list[tuple[str, str]]:
+        """select[] in the field case the portal answered with; both spellings until it is probed."""
+        field_case = self.capabilities.get(CAP_FIELD_CASE)
+        select: list[tuple[str, str]] = []
+        for name in fields:
+            if field_case != "camel":
+                select.append(("select[]", name))
+            if field_case != "upper":
+                select.append(("select[]", _camel_field(name)))
+        return select
 
     @staticmethod
-    def _exc_brief(exc: Exception) -> str:
-        text = str(exc).strip()
-        if text:
-            return f"{exc.__class__.__name__}: {text}"
-        return exc.__class__.__name__
+    def _detect_field_case(payload: dict[str, Any] | None) -> str | None:
+        result = (payload or {}).get("result")
+        tasks = result.get("tasks") if isinstance(result, dict) else result
+        for item in tasks if isinstance(tasks, list) else []:
+            if isinstance(item, dict):
+                if "id" in item or "title" in item:
+                    return "camel"
+                if "ID" in item or "TITLE" in item:
+                    return "upper"
+        return None
+
+    async def _probe_upload_strategy(self, folder_id: int, strategy_name: str) -> bool | None:
+        strategy = self._upload_via_file_content if strategy_name == "fileContent" else self._upload_via_upload_url
+        fd, probe_path = tempfile.mkstemp(prefix="bitrix_probe_", suffix=".txt")
+        try:
+            with os.fdopen(fd, "wb") as file_obj:
+                file_obj.write(b"capability probe\n")
+            try:
+                file_id = await strategy(
+                    folder_id=folder_id,
+                    local_path=probe_path,
+                    name=".task_bot_probe.txt",
+                    timeout_s=self.upload_url_timeout,
+                )
+            except BitrixError as exc:
+                log.info("Bitrix capability probe strategy=%s failed: %s", strategy_name, self._exc_brief(exc))
+                return False
+            except httpx.HTTPError:
+                # Network trouble says nothing about the portal's capabilities.
+                return None
+            try:
+                await self.delete_disk_file(file_id)
+            except Exception as exc:
+                log.warning("Cannot delete capability probe file id=%s: %s", file_id, self._exc_brief(exc))
+            return True
+        finally:
+            try:
+                os.remove(probe_path)
+            except OSError:
+                pass
+
+    async def probe_capabilities(self, upload_folder_id: int | None = None) -> dict[str, bool | str]:
+        found: dict[str, bool | str] = {}
+        # Both spellings on purpose: the answer tells which one the portal uses.
+        select = [("select[]", "ID"), ("select[]", "TITLE"), ("select[]", "id"), ("select[]", "title")]
+        payload: dict[str, Any] | None = None
+        try:
+            try:
+                payload = await self._request(
+                    "tasks.task.list",
+                    [("order[CREATED_DATE]", "desc"), *select, ("start", "-1")],
+                )
+                found[CAP_ORDER_CREATED_DATE] = True
+            except BitrixError as exc:
+                if not is_order_rejection(exc):
+                    raise
+                found[CAP_ORDER_CREATED_DATE] = False
+                payload = await self._request(
+                    "tasks.task.list",
+                    [("order[ID]", "desc"), *select, ("start", "-1")],
+                )
+        except (BitrixError, httpx.HTTPError) as exc:
+            log.warning("Bitrix capability probe tasks.task.list failed: %s", self._exc_brief(exc))
+
+        field_case = self._detect_field_case(payload)
+        if field_case:
+            found[CAP_FIELD_CASE] = field_case
+
+        if upload_folder_id is not None:
+            for strategy_name, cap_name in _STRATEGY_CAPABILITIES.items():
+                works = await self._probe_upload_strategy(int(upload_folder_id), strategy_name)
+                if works is not None:
+                    found[cap_name] = works
+
+        for name, value in found.items():
+            self.set_capability(name, value)
+        return found
+
+    def operating_budgets(self) -> dict[str, dict[str, Any]]:
+        return self._operating.snapshot()
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "rate_limit": self._rate_limiter.stats(),
+            "operating": self._operating.snapshot(),
+            "singleflight": {
+                "enabled": self.singleflight,
+                "hits": self.singleflight_hits,
+                "misses": self.singleflight_misses,
+                "inflight": len(self._inflight),
+            },
+            "dedup": {
+                "enabled": self.upload_index is not None,
+                "hits": self.dedup_hits,
+                "misses": self.dedup_misses,
+                "inflight": len(self._upload_inflight),
+                "held": len(self._upload_holders),
+            },
+            "latency": self._latency.snapshot(),
+            "circuits": self._breaker.snapshot(),
+            "pools": {
+                LANE_CONTROL: {**self._pools[LANE_CONTROL].snapshot(), "protocol": self._protocols[LANE_CONTROL]},
+                LANE_UPLOAD: {**self._pools[LANE_UPLOAD].snapshot(), "protocol": self._protocols[LANE_UPLOAD]},
+                "http2": self.http2,
+                "control_borrowed": self.control_borrowed,
+            },
+            "connections": {
+                "warmed": self.connections_warmed,
+                "heartbeats": self.heartbeats,
+                "dns": self._dns.snapshot() if self._dns is not None else None,
+            },
+            "retry": self.retry_policy.stats(),
+            "hedging": {
+                "enabled": self.hedging,
+                "started": self.hedges_started,
+                "won": self.hedges_won,
+                "denied_by_budget": self.hedges_denied,
+                "budget_tokens": round(self._hedge_budget.tokens, 2),
+            },
+            "upload_strategies": {
+                "explorations": self._strategy_selector.explorations,
+                "stats": self._strategy_selector.snapshot(),
+            },
+        }
 
     async def call(
         self,
         method: str,
-        data: list[tuple[str, str]] | dict[str, str],
+        data: CallData,
         timeout: float | httpx.Timeout | None = None,
+        priority: str = PRIORITY_HIGH,
     ) -> dict[str, Any]:
-        url = f"{self.webhook_base}{method}"
-        encoded = urlencode(data).encode("utf-8")
-        request_timeout = timeout if timeout is not None else self.timeout
-        response = await self._http.post(
-            url,
-            content=encoded,
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            timeout=request_timeout,
+        if not (self.singleflight and is_read_only_method(method)):
+            return await self._dispatch(method, data, timeout, priority)
+
+        # A caller only joins a flight with its own priority and timeout: a high-priority call
+        # must not inherit a low-priority deferral or a shorter deadline.
+        key = (*_call_key(method, data), priority, None if timeout is None else _timeout_seconds(timeout))
+        task = self._inflight.get(key)
+        if task is not None:
+            self.singleflight_hits += 1
+        else:
+            self.singleflight_misses += 1
+            task = asyncio.get_running_loop().create_task(self._dispatch(method, data, timeout, priority))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        # shield(): one caller giving up must not cancel the request for the others.
+        return await asyncio.shield(task)
+
+    async def _dispatch(
+        self,
+        method: str,
+        data: CallData,
+        timeout: float | httpx.Timeout | None,
+        priority: str,
+    ) -> dict[str, Any]:
+        return await self._retrying(
+            method,
+            is_read_only_method(method),
+            lambda: self._dispatch_once(method, data, timeout, priority),
         )
 
+    async def _retrying(self, method: str, idempotent: bool, attempt_once: Callable[[], Awaitable[T]]) -> T:
+        attempt = 1
+        while True:
+            try:
+                return await attempt_once()
+            except Exception as exc:
+                delay = None
+                if attempt < self.retry_policy.max_attempts:
+                    delay = self.retry_policy.next_delay(exc, attempt, idempotent)
+                if delay is None:
+                    raise
+                log.warning(
+                    "Bitrix retry method=%s attempt=%s/%s in %.2fs: %s",
+                    method,
+                    attempt,
+                    self.retry_policy.max_attempts,
+                    delay,
+                    self._exc_brief(exc),
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _dispatch_once(
+        self,
+        method: str,
+        data: CallData,
+        timeout: float | httpx.Timeout | None,
+        priority: str,
+    ) -> dict[str, Any]:
+        await self._operating.admit(method, priority)
+        if self.batch_window_s > 0 and method != "batch":
+            return await self._call_coalesced(method, data, timeout)
+        if is_read_only_method(method):
+            return await self._hedged(method, lambda: self._request(method, data, timeout))
+        return await self._request(method, data, timeout)
+
+    # --- hedging -----------------------------------------------------------
+
+    async def _hedged(
+        self,
+        latency_key: str,
+        attempt: Callable[[], Awaitable[T]],
+        scale: float = 1.0,
+        discard: Callable[[T], Awaitable[None]] | None = None,
+    ) -> T:
+        """Run attempt(); start a second one if the first is slower than the hedge quantile.
+
+        The first successful result wins and the other attempt is cancelled. With
+        `discard` (uploads) the loser is left to finish instead, because cancelling
+        a request the portal already accepted would leave an untracked file; its
+        result is then passed to discard().
+        """
+        if not self.hedging:
+            return await attempt()
+        self._hedge_budget.earn()
+        estimate = self._latency.estimate(latency_key, self.hedge_quantile)
+        if estimate is None:
+            return await attempt()
+
+        loop = asyncio.get_running_loop()
+        first = loop.create_task(attempt())
         try:
-            payload = response.json()
-        except Exception:
-            raise BitrixError(
-                f"Bitrix returned non-JSON response (HTTP {response.status_code})",
-                response.text,
+            done, _ = await asyncio.wait({first}, timeout=estimate * scale)
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+        if done:
+            return first.result()
+        if not self._hedge_budget.try_spend():
+            self.hedges_denied += 1
+            return await first
+
+        self.hedges_started += 1
+        log.debug("Bitrix hedged request key=%s after %.3fs", latency_key, estimate * scale)
+        second = loop.create_task(attempt())
+        pending: set[asyncio.Task] = {first, second}
+        winner: asyncio.Task | None = None
+        error: BaseException | None = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        winner = winner or task
+                    else:
+                        error = task.exception()
+        finally:
+            for task in pending:
+                if discard is None:
+                    task.cancel()
+                else:
+                    task.add_done_callback(lambda t: self._discard_result(t, discard))
+        # Both attempts may have finished in the same wakeup.
+        if discard is not None:
+            for task in (first, second):
+                if task is not winner and task.done() and task not in pending:
+                    self._discard_result(task, discard)
+        if winner is None:
+            assert error is not None
+            raise error
+        if winner is second:
+            self.hedges_won += 1
+        return winner.result()
+
+    def _discard_result(self, task: asyncio.Task, discard: Callable[[Any], Awaitable[None]]) -> None:
+        if task.cancelled() or task.exception() is not None:
+            return
+        cleanup = asyncio.get_running_loop().create_task(discard(task.result()))
+        self._background_tasks.add(cleanup)
+        cleanup.add_done_callback(self._background_tasks.discard)
+
+    async def _delete_hedged_upload(self, file_id: int) -> None:
+        try:
+            await self.call("disk.file.delete", [("id", str(int(file_id)))])
+            log.info("Deleted duplicate disk file_id=%s left by a hedged upload", file_id)
+        except Exception as exc:
+            log.warning("Cannot delete duplicate hedged upload file_id=%s: %s", file_id, self._exc_brief(exc))
+
+    # --- batch -------------------------------------------------------------
+
+    @staticmethod
+    def _batch_node(result: dict[str, Any], key: str) -> dict[str, Any]:
+        # PHP serializes an empty associative array as [], so accept both shapes.
+        node = result.get(key)
+        return node if isinstance(node, dict) else {}
+
+    @staticmethod
+    def _max_timeout(
+        timeouts: list[float | httpx.Timeout | None],
+        default: float | None = None,
+    ) -> float | httpx.Timeout | None:
+        # None leaves the choice to the latency model in _request().
+        best: float | httpx.Timeout | None = default
+        best_read = default or 0.0
+        for value in timeouts:
+            if value is None:
+                continue
+            read = value.read if isinstance(value, httpx.Timeout) else float(value)
+            if read is not None and read > best_read:
+                best, best_read = value, read
+        return best
+
+    async def _batch_chunk(
+        self,
+        commands: list[BatchCommand],
+        halt: bool,
+        timeout: float | httpx.Timeout | None,
+    ) -> list[dict[str, Any] | BitrixError]:
+        keys = [f"c{idx}" for idx in range(len(commands))]
+        data: list[tuple[str, str]] = [("halt", "1" if halt else "0")]
+        for key, (method, params) in zip(keys, commands):
+            query = urlencode(params)
+            data.append((f"cmd[{key}]", f"{method}?{query}" if query else method))
+
+        payload = await self._request("batch", data, timeout=timeout)
+        result = payload.get("result")
+        if not isinstance(result, dict):
+            raise BitrixError("Cannot parse batch response", str(payload))
+
+        results = self._batch_node(result, "result")
+        errors = self._batch_node(result, "result_error")
+        totals = self._batch_node(result, "result_total")
+        nexts = self._batch_node(result, "result_next")
+        times = self._batch_node(result, "result_time")
+
+        out: list[dict[str, Any] | BitrixError] = []
+        for key, (method, _params) in zip(keys, commands):
+            error = errors.get(key)
+            if error is not None:
+                if isinstance(error, dict):
+                    if error.get("error") == OPERATION_TIME_LIMIT:
+                        # Same as a single call: the portal has blocked this method, not the batch.
+                        self._operating.mark_blocked(method)
+                    out.append(BitrixError(error.get("error", "bitrix_error"), error.get("error_description", "")))
+                else:
+                    out.append(BitrixError("bitrix_error", str(error)))
+                continue
+            if key not in results:
+                out.append(BitrixError("batch_command_skipped", f"{method} was not executed (halt={int(halt)})"))
+                continue
+            item: dict[str, Any] = {"result": results[key]}
+            for name, node in (("total", totals), ("next", nexts), ("time", times)):
+                if key in node:
+                    item[name] = node[key]
+            self._operating.record(method, item.get("time"))
+            out.append(item)
+        return out
+
+    async def _batch_dispatch(
+        self,
+        commands: list[BatchCommand],
+        halt: bool,
+        timeout: float | httpx.Timeout | None,
+        priority: str,
+    ) -> list[dict[str, Any] | BitrixError]:
+        # The path call() takes through _dispatch(): operating-budget admission and
+        # the retry policy here, rate limiter and breaker under _request("batch").
+        methods = {method for method, _params in commands}
+
+        async def attempt_once() -> list[dict[str, Any] | BitrixError]:
+            # The method closest to its operating limit decides whether a low-priority batch waits.
+            await self._operating.admit(max(methods, key=self._operating.usage), priority)
+            return await self._batch_chunk(commands, halt=halt, timeout=timeout)
+
+        return await self._retrying("batch", all(map(is_read_only_method, methods)), attempt_once)
+
+    async def batch(
+        self,
+        commands: list[BatchCommand],
+        halt: bool = False,
+        timeout: float | httpx.Timeout | None = None,
+        priority: str = PRIORITY_HIGH,
+    ) -> list[dict[str, Any] | BitrixError]:
+        # Each element mirrors what call() would return for the same command,
+        # or carries the BitrixError that command failed with.
+        out: list[dict[str, Any] | BitrixError] = []
+        for start in range(0, len(commands), BATCH_MAX_COMMANDS):
+            chunk = commands[start:start + BATCH_MAX_COMMANDS]
+            out.extend(await self._batch_dispatch(chunk, halt, timeout, priority))
+            if halt and any(isinstance(item, BitrixError) for item in out):
+                rest = commands[start + len(chunk):]
+                out.extend(
+                    BitrixError("batch_command_skipped", f"{method} was not executed (halt=1)")
+                    for method, _params in rest
+                )
+                break
+        return out
+
+    async def _call_coalesced(
+        self,
+        method: str,
+        data: CallData,
+        timeout: float | httpx.Timeout | None,
+    ) -> dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        pending = _PendingCall(method=method, data=data, timeout=timeout, future=loop.create_future())
+        self._pending_calls.append(pending)
+        if len(self._pending_calls) >= BATCH_MAX_COMMANDS:
+            self._flush_pending_calls()
+        elif self._batch_flush_handle is None:
+            self._batch_flush_handle = loop.call_later(self.batch_window_s, self._flush_pending_calls)
+        return await pending.future
+
+    def _flush_pending_calls(self) -> None:
+        if self._batch_flush_handle is not None:
+            self._batch_flush_handle.cancel()
+            self._batch_flush_handle = None
+        pending, self._pending_calls = self._pending_calls, []
+        if not pending:
+            return
+        task = asyncio.get_running_loop().create_task(self._send_coalesced(pending))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    async def _send_coalesced(self, pending: list[_PendingCall]) -> None:
+        if len(pending) == 1:
+            # Nothing to merge with: skip the batch envelope.
+            only = pending[0]
+            try:
+                payload = await self._request(only.method, only.data, timeout=only.timeout)
+            except Exception as exc:
+                if not only.future.done():
+                    only.future.set_exception(exc)
+            else:
+                if not only.future.done():
+                    only.future.set_result(payload)
+            return
+
+        timeout = self._max_timeout([item.timeout for item in pending])
+        try:
+            results = await self._batch_chunk(
+                [(item.method, item.data) for item in pending],
+                halt=False,
+                timeout=timeout,
             )
+        except Exception as exc:
+            for item in pending:
+                if not item.future.done():
+                    item.future.set_exception(exc)
+            return
 
-        if "error" in payload:
-            raise BitrixError(payload.get("error", "bitrix_error"), payload.get("error_description", ""))
-        return payload
+        log.debug("Bitrix coalesced batch size=%s methods=%s", len(pending), [item.method for item in pending])
+        for item, result in zip(pending, results):
+            if item.future.done():
+                continue
+            if isinstance(result, BitrixError):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
 
     @staticmethod
     def _extract_disk_file_id(payload: dict[str, Any]) -> int | None:
@@ -105,6 +2040,21 @@ class BitrixClient:
 
         return None
 
+    @staticmethod
+    def _upload_http_timeout(timeout_s: float) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=min(20.0, timeout_s),
+            read=timeout_s,
+            write=timeout_s,
+            pool=min(20.0, timeout_s),
+        )
+
+    @staticmethod
+    def _file_content_parts(folder_id: int, name: str) -> tuple[bytes, bytes, str]:
+        boundary = uuid.uuid4().hex
+        head, tail = file_content_body_parts(folder_id, name, boundary)
+        return head, tail, f"multipart/form-data; boundary={boundary}"
+
     async def _upload_via_file_content(
         self,
         folder_id: int,
@@ -112,46 +2062,83 @@ class BitrixClient:
         name: str,
         timeout_s: float | None = None,
     ) -> int:
-        with open(local_path, "rb") as file_obj:
-            encoded = base64.b64encode(file_obj.read()).decode("ascii")
-
-        data: list[tuple[str, str]] = [
-            ("id", str(int(folder_id))),
-            ("data[NAME]", name),
-            ("generateUniqueName", "true"),
-            ("fileContent[0]", name),
-            ("fileContent[1]", encoded),
-        ]
-        encoded_data = urlencode(data).encode("utf-8")
+        head, tail, content_type = self._file_content_parts(folder_id, name)
+        try:
+            content_length: int | None = file_content_body_length(head, tail, os.path.getsize(local_path))
+        except OSError:
+            content_length = None
+
+        def body() -> AsyncIterator[bytes]:
+            return iter_file_content_body(head, iter_file_chunks(local_path), tail)
+
         effective_timeout = timeout_s if timeout_s is not None else self.upload_timeout
-        timeout = httpx.Timeout(
-            connect=min(20.0, effective_timeout),
-            read=effective_timeout,
-            write=effective_timeout,
-            pool=min(20.0, effective_timeout),
-        )
-        response = await self._http.post(
-            f"{self.webhook_base}disk.folder.uploadfile",
-            content=encoded_data,
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-            timeout=timeout,
+        timeout = self._upload_http_timeout(effective_timeout)
+        payload = await self._post_rest(
+            "disk.folder.uploadfile",
+            body,
+            timeout,
+            content_length=content_length,
+            content_type=content_type,
+            lane=LANE_UPLOAD,
         )
 
-        try:
-            payload = response.json()
-        except Exception:
-            raise BitrixError(
-                f"Bitrix returned non-JSON response (HTTP {response.status_code})",
-                response.text,
-            )
-        if "error" in payload:
-            raise BitrixError(payload.get("error", "bitrix_error"), payload.get("error_description", ""))
-
         file_id = self._extract_disk_file_id(payload)
         if file_id is not None:
             return file_id
         raise BitrixError("Cannot parse disk file id from fileContent response", str(payload))
 
+    async def upload_stream_to_folder(
+        self,
+        folder_id: int,
+        name: str,
+        open_stream: BodyFactory,
+        timeout_s: float | None = None,
+        content_keys: list[str] | None = None,
+        dedup_lookup: bool = True,
+    ) -> int:
+        # fileContent upload from an arbitrary byte stream (e.g. a Telegram download)
+        # without touching local disk. The encoded length is unknown, so the body is chunked.
+        keys = list(content_keys or [])
+        if dedup_lookup:
+            file_id = await self.find_uploaded(folder_id, keys)
+            if file_id is not None:
+                return file_id
+        head, tail, content_type = self._file_content_parts(folder_id, name)
+        digests: list[Any] = []
+
+        async def _hashed(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+            digest = hashlib.sha256()
+            async for chunk in chunks:
+                digest.update(chunk)
+                yield chunk
+            digests.append(digest)
+
+        def body() -> AsyncIterator[bytes]:
+            digests.clear()
+            return iter_file_content_body(head, _hashed(open_stream()), tail)
+
+        effective_timeout = timeout_s if timeout_s is not None else self.upload_timeout
+        started = time.monotonic()
+        payload = await self._post_rest(
+            "disk.folder.uploadfile",
+            body,
+            self._upload_http_timeout(effective_timeout),
+            content_type=content_type,
+            lane=LANE_UPLOAD,
+        )
+        file_id = self._extract_disk_file_id(payload)
+        if file_id is None:
+            raise BitrixError("Cannot parse disk file id from fileContent response", str(payload))
+        log.info(
+            "Bitrix disk upload strategy=fileContent(stream) success file=%s elapsed_ms=%s",
+            name,
+            int((time.monotonic() - started) * 1000),
+        )
+        if digests:
+            keys.append(DEDUP_KEY_SHA256 + digests[-1].hexdigest())
+        await self.remember_uploaded(folder_id, keys, file_id)
+        return self._hold_upload(file_id)
+
     async def _upload_via_upload_url(
         self,
         folder_id: int,
@@ -160,12 +2147,7 @@ class BitrixClient:
         timeout_s: float | None = None,
     ) -> int:
         effective_timeout = timeout_s if timeout_s is not None else self.upload_url_timeout
-        timeout = httpx.Timeout(
-            connect=min(20.0, effective_timeout),
-            read=effective_timeout,
-            write=effective_timeout,
-            pool=min(20.0, effective_timeout),
-        )
+        timeout = self._upload_http_timeout(effective_timeout)
 
         # Step 1: request an upload slot from Bitrix Disk.
         payload = await self.call(
@@ -191,9 +2173,12 @@ class BitrixClient:
             raise BitrixError("Upload URL or field is missing in Bitrix response", str(payload))
 
         # Step 2: upload binary to the signed URL returned by Step 1.
+        self._upload_origin = _origin(str(upload_url))
         with open(local_path, "rb") as file_obj:
-            response = await self._http.post(
+            response = await self._guarded_post(
+                "disk.upload_url",
                 str(upload_url),
+                lane=LANE_UPLOAD,
                 files={str(field_name): (name, file_obj)},
                 timeout=timeout,
             )
@@ -204,6 +2189,8 @@ class BitrixClient:
             raise BitrixError(
                 f"Bitrix upload URL returned non-JSON response (HTTP {response.status_code})",
                 response.text,
+                status_code=response.status_code,
+                retry_after=parse_retry_after(response.headers.get("Retry-After")),
             )
 
         if "error" in upload_payload:
@@ -218,6 +2205,119 @@ class BitrixClient:
 
         raise BitrixError("Cannot parse disk file id from upload response", str(upload_payload))
 
+    async def _disk_file_alive(self, file_id: int) -> bool | None:
+        """True/False when the portal answered, None when it could not be asked."""
+        try:
+            payload = await self.call("disk.file.get", [("id", str(int(file_id)))])
+        except BitrixError as exc:
+            text = f"{exc.message} {exc.details}".upper()
+            if "NOT_FOUND" in text or "ACCESS_DENIED" in text:
+                return False
+            return None
+        except Exception:
+            return None
+        result = payload.get("result")
+        if not isinstance(result, dict):
+            return False
+        # DELETED_TYPE != 0 means the file sits in the recycle bin.
+        return str(result.get("DELETED_TYPE") or "0") == "0"
+
+    async def find_uploaded(self, folder_id: int, content_keys: list[str]) -> int | None:
+        if self.upload_index is None or not content_keys:
+            return None
+        found = await self.upload_index.afind_disk_upload(content_keys, folder_id, self.dedup_ttl_s)
+        if found is None:
+            self.dedup_misses += 1
+            return None
+        file_id, age_s = found
+        if age_s > self.dedup_verify_s:
+            alive = await self._disk_file_alive(file_id)
+            if alive is None:
+                return None
+            if not alive:
+                log.info("Dedup entry dropped: disk file_id=%s no longer exists", file_id)
+                await self.upload_index.aforget_disk_upload(file_id)
+                self.dedup_misses += 1
+                return None
+            await self.upload_index.aremember_disk_upload(content_keys, folder_id, file_id)
+        self.dedup_hits += 1
+        if file_id in self._upload_holders:
+            # Still held by the draft that uploaded it: that draft must not delete it now.
+            self._upload_holders[file_id] += 1
+        return file_id
+
+    async def find_landed_upload(
+        self,
+        folder_id: int,
+        name: str,
+        size_bytes: int,
+        since: float,
+        content_keys: list[str] | None = None,
+    ) -> int | None:
+        """A file an interrupted upload stored anyway, or None if the folder has none.
+
+        Matches files of the same size created since `since` (epoch seconds) and
+        named `name` or, after generateUniqueName, `name (N)`. A match is held and
+        indexed like a fresh upload. Errors propagate: then nobody knows.
+        """
+        moment = dt.datetime.fromtimestamp(since - LANDED_UPLOAD_SLACK_S).astimezone()
+        payload = await self.call(
+            "disk.folder.getchildren",
+            [("id", str(int(folder_id))), ("filter[>=CREATE_TIME]", moment.isoformat(timespec="seconds"))],
+        )
+        stem, ext = os.path.splitext(name)
+        pattern = re.compile(re.escape(stem) + r"(?: \(\d+\))?" + re.escape(ext))
+        result = payload.get("result")
+        for item in result if isinstance(result, list) else []:
+            if not isinstance(item, dict) or not pattern.fullmatch(str(item.get("NAME") or "")):
+                continue
+            try:
+                if int(item.get("SIZE")) != int(size_bytes):
+                    continue
+                created = dt.datetime.fromisoformat(str(item.get("CREATE_TIME")))
+                file_id = int(item.get("ID"))
+            except (TypeError, ValueError):
+                continue
+            if created.timestamp() < since - LANDED_UPLOAD_SLACK_S:
+                continue
+            log.info("Bitrix disk upload file=%s landed despite the error: disk file_id=%s", name, file_id)
+            await self.remember_uploaded(folder_id, list(content_keys or []), file_id)
+            return self._hold_upload(file_id)
+        return None
+
+    def _hold_upload(self, file_id: int) -> int:
+        self._upload_holders[file_id] = self._upload_holders.get(file_id, 0) + 1
+        return file_id
+
+    def adopt_uploads(self, file_ids: Iterable[int]) -> None:
+        """The files are attached to a task now: no draft may delete them any more."""
+        for file_id in file_ids:
+            self._upload_holders.pop(int(file_id), None)
+
+    async def release_upload(self, file_id: int) -> bool:
+        """Drop one hold on a file uploaded for an abandoned draft; delete it once nobody holds it.
+
+        Files this process did not upload (dedup hits on older files) and files
+        already attached to a task are never deleted. Returns True if deleted.
+        """
+        holders = self._upload_holders.get(int(file_id))
+        if holders is None:
+            return False
+        if holders > 1:
+            self._upload_holders[int(file_id)] = holders - 1
+            return False
+        del self._upload_holders[int(file_id)]
+        await self.delete_disk_file(int(file_id))
+        return True
+
+    async def remember_uploaded(self, folder_id: int, content_keys: list[str], file_id: int) -> None:
+        if self.upload_index is None or not content_keys:
+            return
+        try:
+            await self.upload_index.aremember_disk_upload(content_keys, folder_id, file_id)
+        except Exception as exc:
+            log.warning("Cannot store dedup entry file_id=%s: %s", file_id, self._exc_brief(exc))
+
     async def upload_to_folder(
         self,
         folder_id: int,
@@ -225,49 +2325,158 @@ class BitrixClient:
         filename: str | None = None,
         upload_attempt: int | None = None,
         upload_max_attempts: int | None = None,
+        content_keys: list[str] | None = None,
+        dedup_lookup: bool = True,
+        slot: UploadSlot | None = None,
+    ) -> int:
+        # dedup_lookup=False: the caller already looked content_keys up via find_uploaded().
+        keys = list(content_keys or [])
+        if self.upload_index is None:
+            return self._hold_upload(
+                await self._upload_flight(slot, folder_id, local_path, filename, upload_attempt, upload_max_attempts)
+            )
+
+        sha_key = next((key for key in keys if key.startswith(DEDUP_KEY_SHA256)), None)
+        if sha_key is None:
+            sha_key = await asyncio.to_thread(sha256_content_key, local_path)
+            keys.append(sha_key)
+        if dedup_lookup:
+            file_id = await self.find_uploaded(folder_id, keys)
+            if file_id is not None:
+                log.info("Bitrix disk upload skipped file=%s: same content already in disk file_id=%s", filename, file_id)
+                return file_id
+
+        # Copies of one file uploading at the same time (e.g. twice in one ticket) share an upload.
+        flight_key = (int(folder_id), sha_key)
+        flight = self._upload_inflight.get(flight_key)
+        if flight is None:
+            task = asyncio.get_running_loop().create_task(
+                self._upload_flight(slot, folder_id, local_path, filename, upload_attempt, upload_max_attempts)
+            )
+            flight = _UploadFlight(flight_key, task)
+            self._upload_inflight[flight_key] = flight
+            task.add_done_callback(lambda _t, f=flight: self._end_upload_flight(f))
+        flight.waiters += 1
+        try:
+            # shield(): one caller giving up must not cancel the upload for the others.
+            file_id = await asyncio.shield(flight.task)
+            await self.remember_uploaded(folder_id, keys, file_id)
+        except BaseException:
+            self._leave_upload_flight(flight)
+            raise
+        flight.waiters -= 1
+        # Every caller of a shared flight holds the file: one cancelled draft cannot delete it for the rest.
+        return self._hold_upload(file_id)
+
+    async def _upload_flight(
+        self,
+        slot: UploadSlot | None,
+        folder_id: int,
+        local_path: str,
+        filename: str | None,
+        upload_attempt: int | None,
+        upload_max_attempts: int | None,
+    ) -> int:
+        # The slot is taken here, not by the callers, so it is held exactly as long as the upload runs.
+        async with slot() if slot is not None else nullcontext():
+            return await self._upload_with_strategies(folder_id, local_path, filename, upload_attempt, upload_max_attempts)
+
+    def _leave_upload_flight(self, flight: _UploadFlight) -> None:
+        flight.waiters -= 1
+        if flight.waiters > 0:
+            return
+        # The last caller is gone: stop the upload, or delete the file it already stored.
+        # Later callers start a fresh flight instead of joining a cancelled one.
+        if self._upload_inflight.get(flight.key) is flight:
+            del self._upload_inflight[flight.key]
+        if flight.finished:
+            self._discard_result(flight.task, self._delete_abandoned_upload)
+        elif not flight.task.done():
+            flight.task.cancel()
+        # Otherwise _end_upload_flight() is already scheduled and sees no waiters.
+
+    def _end_upload_flight(self, flight: _UploadFlight) -> None:
+        flight.finished = True
+        if self._upload_inflight.get(flight.key) is flight:
+            del self._upload_inflight[flight.key]
+        if flight.waiters == 0:
+            # Finished after every caller left, too late for the cancel to stop it.
+            self._discard_result(flight.task, self._delete_abandoned_upload)
+
+    async def _delete_abandoned_upload(self, file_id: int) -> None:
+        try:
+            await self.delete_disk_file(file_id)
+            log.info("Deleted disk file_id=%s uploaded for callers that gave up", file_id)
+        except Exception as exc:
+            log.warning("Cannot delete abandoned upload file_id=%s: %s", file_id, self._exc_brief(exc))
+
+    async def _upload_with_strategies(
+        self,
+        folder_id: int,
+        local_path: str,
+        filename: str | None = None,
+        upload_attempt: int | None = None,
+        upload_max_attempts: int | None = None,
     ) -> int:
         name = filename or Path(local_path).name
         size_bytes = Path(local_path).stat().st_size
 
-        # For small files prefer fileContent to avoid waiting on unstable signed upload URL.
-        small_file = size_bytes <= 2 * 1024 * 1024
+        # Small files get short fileContent-style timeouts so mid attempts catch recovery windows fast.
+        small_file = size_bytes <= UPLOAD_DEFAULT_SMALL_BYTES
         on_last_attempt = bool(
             upload_attempt is not None
             and upload_max_attempts is not None
             and upload_attempt >= upload_max_attempts
         )
+        methods = {"fileContent": self._upload_via_file_content, "uploadUrl": self._upload_via_upload_url}
+        default_order = ["fileContent", "uploadUrl"] if small_file else ["uploadUrl", "fileContent"]
+        # Drop strategies the portal is known not to support; keep the ladder if that leaves nothing.
+        supported = [
+            name for name in default_order
+            if self.capabilities.get(_STRATEGY_CAPABILITIES[name]) is not False
+        ]
+        order = self._strategy_selector.order(size_bytes, supported or default_order)
+
         if small_file:
             if on_last_attempt:
-                # Final attempt: still probe fileContent first, then try uploadUrl as fallback.
-                final_fc_timeout = min(self.upload_timeout, self.small_upload_final_timeout)
-                final_url_timeout = min(self.upload_url_timeout, self.small_upload_final_timeout)
-                strategies = (
-                    ("fileContent", self._upload_via_file_content, final_fc_timeout),
-                    ("uploadUrl", self._upload_via_upload_url, final_url_timeout),
-                )
+                # Final attempt: try every strategy with the final timeouts.
+                timeouts = {
+                    "fileContent": min(self.upload_timeout, self.small_upload_final_timeout),
+                    "uploadUrl": min(self.upload_url_timeout, self.small_upload_final_timeout),
+                }
             else:
-                # Early and mid attempts: fast fileContent probes to quickly catch recovery windows.
-                quick_fc_timeout = min(self.upload_timeout, self.small_upload_probe_timeout)
-                strategies = (
-                    ("fileContent", self._upload_via_file_content, quick_fc_timeout),
-                )
+                # Early and mid attempts: one quick probe of the best strategy.
+                timeouts = {
+                    "fileContent": min(self.upload_timeout, self.small_upload_probe_timeout),
+                    "uploadUrl": self.upload_url_timeout,
+                }
+                order = order[:1]
         else:
-            strategies = (
-                ("uploadUrl", self._upload_via_upload_url, self.upload_timeout),
-                ("fileContent", self._upload_via_file_content, self.upload_timeout),
-            )
+            timeouts = {"fileContent": self.upload_timeout, "uploadUrl": self.upload_timeout}
+        strategies = tuple((name, methods[name], timeouts[name]) for name in order)
+        log.debug("Bitrix disk upload file=%s size=%sB strategy order=%s", name, size_bytes, order)
 
         failures: list[str] = []
+        last_error: Exception | None = None
+        scale = size_bytes + UPLOAD_LATENCY_OVERHEAD_BYTES
         for strategy_name, strategy, timeout_s in strategies:
+            # Per-byte estimate scaled to this file: large files keep proportionally longer timeouts.
+            latency_key = f"upload:{strategy_name}"
+            timeout_s = self._latency.timeout(latency_key, timeout_s, scale=scale)
             started = time.monotonic()
+
+            def run(strategy=strategy, timeout_s=timeout_s) -> Awaitable[int]:
+                return strategy(folder_id=folder_id, local_path=local_path, name=name, timeout_s=timeout_s)
+
             try:
-                file_id = await strategy(
-                    folder_id=folder_id,
-                    local_path=local_path,
-                    name=name,
-                    timeout_s=timeout_s,
-                )
+                if small_file and strategy_name == "fileContent":
+                    file_id = await self._hedged(latency_key, run, scale=scale, discard=self._delete_hedged_upload)
+                else:
+                    file_id = await run()
                 elapsed_ms = int((time.monotonic() - started) * 1000)
+                self.set_capability(_STRATEGY_CAPABILITIES[strategy_name], True)
+                self._record_strategy_outcome(strategy_name, size_bytes, True, elapsed_ms)
+                self._latency.observe(latency_key, (elapsed_ms / 1000.0) / scale)
                 log.info(
                     "Bitrix disk upload strategy=%s success file=%s size=%sB elapsed_ms=%s timeout_s=%s attempt=%s/%s",
                     strategy_name,
@@ -282,6 +2491,9 @@ class BitrixClient:
             except Exception as exc:
                 elapsed_ms = int((time.monotonic() - started) * 1000)
                 err = self._exc_brief(exc)
+                self._record_strategy_outcome(strategy_name, size_bytes, False, elapsed_ms)
+                if isinstance(exc, httpx.TimeoutException):
+                    self._latency.observe(latency_key, timeout_s / scale)
                 log.warning(
                     "Bitrix disk upload strategy=%s failed file=%s size=%sB elapsed_ms=%s timeout_s=%s attempt=%s/%s error=%s",
                     strategy_name,
@@ -294,43 +2506,120 @@ class BitrixClient:
                     err,
                 )
                 failures.append(f"{strategy_name}: {err}")
+                last_error = exc
+
+        if failures and all(CIRCUIT_OPEN in failure for failure in failures):
+            raise BitrixError(CIRCUIT_OPEN, " | ".join(failures)) from last_error
+        raise BitrixError("All disk upload strategies failed", " | ".join(failures)) from last_error
 
-        raise BitrixError("All disk upload strategies failed", " | ".join(failures))
+    async def delete_disk_file(self, file_id: int) -> None:
+        # Moves the file to the Bitrix Disk recycle bin.
+        await self.call("disk.file.delete", [("id", str(int(file_id)))])
+        if self.upload_index is not None:
+            await self.upload_index.aforget_disk_upload(int(file_id))
+
+    async def get_users(self, user_ids: Iterable[int], call_priority: str = PRIORITY_HIGH) -> dict[int, dict[str, Any]]:
+        """Users by ID; IDs unknown to the portal are absent from the result."""
+        ids = sorted({int(uid) for uid in user_ids if int(uid) > 0})
+        commands: list[BatchCommand] = []
+        for start in range(0, len(ids), USER_GET_PAGE_SIZE):
+            chunk = ids[start:start + USER_GET_PAGE_SIZE]
+            commands.append(("user.get", [(f"FILTER[ID][{idx}]", str(uid)) for idx, uid in enumerate(chunk)]))
+        users: dict[int, dict[str, Any]] = {}
+        for item in await self.batch(commands, priority=call_priority):
+            if isinstance(item, BitrixError):
+                raise item
+            for user in self._user_list(item):
+                try:
+                    users[int(user.get("ID"))] = user
+                except (TypeError, ValueError):
+                    continue
+        return users
+
+    @staticmethod
+    def _user_list(payload: dict[str, Any]) -> list[dict[str, Any]]:
+        result = payload.get("result")
+        return [user for user in result if isinstance(user, dict)] if isinstance(result, list) else []
+
+    async def list_all_users(self) -> list[dict[str, Any]]:
+        """Every portal user: the first user.get page gives the total, the rest come in batches."""
+        order = [("sort", "ID"), ("order", "ASC")]
+        first = await self.call("user.get", [*order, ("start", "0")], priority=PRIORITY_LOW)
+        users = self._user_list(first)
+        try:
+            total = int(first.get("total") or len(users))
+        except (TypeError, ValueError):
+            total = len(users)
+        commands: list[BatchCommand] = [
+            ("user.get", [*order, ("start", str(start))])
+            for start in range(USER_GET_PAGE_SIZE, total, USER_GET_PAGE_SIZE)
+        ]
+        for item in await self.batch(commands, priority=PRIORITY_LOW):
+            if isinstance(item, BitrixError):
+                raise item
+            users.extend(self._user_list(item))
+        return users
+
+    async def list_newest_users(self, known_ids: Container[int], max_pages: int = 5) -> list[dict[str, Any]]:
+        """Users by descending ID, page by page, until a page reaches an already known ID."""
+        users: list[dict[str, Any]] = []
+        for page in range(max(1, max_pages)):
+            payload = await self.call(
+                "user.get",
+                [("sort", "ID"), ("order", "DESC"), ("start", str(page * USER_GET_PAGE_SIZE))],
+                priority=PRIORITY_LOW,
+            )
+            chunk = self._user_list(payload)
+            users.extend(chunk)
+            seen_known = False
+            for user in chunk:
+                try:
+                    seen_known = seen_known or int(user.get("ID")) in known_ids
+                except (TypeError, ValueError):
+                    continue
+            if seen_known or len(chunk) < USER_GET_PAGE_SIZE:
+                break
+        return users
 
     async def list_tasks_created_by(
         self,
         created_by: int,
         limit: int = 10,
+        call_priority: str = PRIORITY_HIGH,
     ) -> list[dict[str, Any]]:
         safe_limit = max(1, min(int(limit), 20))
         base_fields: list[tuple[str, str]] = [
             ("filter[CREATED_BY]", str(int(created_by))),
-            ("select[]", "ID"),
-            ("select[]", "TITLE"),
-            ("select[]", "STATUS"),
-            ("select[]", "REAL_STATUS"),
-            ("select[]", "DEADLINE"),
-            ("select[]", "CREATED_DATE"),
-            ("select[]", "id"),
-            ("select[]", "title"),
-            ("select[]", "status"),
-            ("select[]", "realStatus"),
-            ("select[]", "deadline"),
-            ("select[]", "createdDate"),
+            *self._task_select(TASK_SELECT_FIELDS),
         ]
 
-        try:
-            payload = await self.call(
-                "tasks.task.list",
-                [("order[CREATED_DATE]", "desc"), *base_fields],
-            )
-        except BitrixError:
+        payload: dict[str, Any] | None = None
+        if self.capabilities.get(CAP_ORDER_CREATED_DATE) is not False:
+            try:
+                payload = await self.call(
+                    "tasks.task.list",
+                    [("order[CREATED_DATE]", "desc"), *base_fields],
+                    priority=call_priority,
+                )
+                if self.capabilities.get(CAP_ORDER_CREATED_DATE) is None:
+                    self.set_capability(CAP_ORDER_CREATED_DATE, True)
+            except BitrixError as exc:
+                if not is_order_rejection(exc):
+                    raise
+                log.info("tasks.task.list rejected order[CREATED_DATE], falling back to order[ID]: %s", exc.message)
+                self.set_capability(CAP_ORDER_CREATED_DATE, False)
+        if payload is None:
             # Compatibility fallback for portals that do not support CREATED_DATE ordering.
             payload = await self.call(
                 "tasks.task.list",
                 [("order[ID]", "desc"), *base_fields],
+                priority=call_priority,
             )
 
+        return self._task_list(payload)[:safe_limit]
+
+    @staticmethod
+    def _task_list(payload: dict[str, Any]) -> list[dict[str, Any]]:
         result = payload.get("result")
         tasks: list[Any]
         if isinstance(result, dict):
@@ -340,12 +2629,76 @@ class BitrixClient:
             tasks = result
         else:
             tasks = []
+        return [item for item in tasks if isinstance(item, dict)]
 
-        normalized: list[dict[str, Any]] = []
-        for item in tasks:
-            if isinstance(item, dict):
-                normalized.append(item)
-        return normalized[:safe_limit]
+    async def list_recent_tasks_by_creators(
+        self,
+        creator_ids: Iterable[int],
+        call_priority: str = PRIORITY_HIGH,
+    ) -> dict[int, list[dict[str, Any]]]:
+        """The newest page of tasks for each creator, one batched tasks.task.list per creator."""
+        ids = sorted({int(uid) for uid in creator_ids if int(uid) > 0})
+        commands: list[BatchCommand] = [
+            (
+                "tasks.task.list",
+                [
+                    ("order[ID]", "desc"),
+                    ("filter[CREATED_BY]", str(uid)),
+                    *self._task_select(TASK_SYNC_FIELDS),
+                ],
+            )
+            for uid in ids
+        ]
+        out: dict[int, list[dict[str, Any]]] = {}
+        for uid, item in zip(ids, await self.batch(commands, priority=call_priority)):
+            if isinstance(item, BitrixError):
+                raise item
+            out[uid] = self._task_list(item)
+        return out
+
+    async def list_tasks_changed_since(
+        self,
+        creator_ids: Iterable[int],
+        since: str,
+        call_priority: str = PRIORITY_HIGH,
+    ) -> list[dict[str, Any]]:
+        """Tasks of the given creators changed at or after `since` (the portal's CHANGED_DATE format).
+
+        One command per 50 creators; when a command has more than one page,
+        the remaining pages are fetched in a second batch.
+        """
+        ids = sorted({int(uid) for uid in creator_ids if int(uid) > 0})
+        queries: list[list[tuple[str, str]]] = []
+        for start in range(0, len(ids), TASK_LIST_PAGE_SIZE):
+            chunk = ids[start:start + TASK_LIST_PAGE_SIZE]
+            queries.append(
+                [
+                    ("order[ID]", "asc"),
+                    ("filter[>=CHANGED_DATE]", since),
+                    *((f"filter[CREATED_BY][{idx}]", str(uid)) for idx, uid in enumerate(chunk)),
+                    *self._task_select(TASK_SYNC_FIELDS),
+                ]
+            )
+        tasks: list[dict[str, Any]] = []
+        more: list[BatchCommand] = []
+        batched = await self.batch([("tasks.task.list", query) for query in queries], priority=call_priority)
+        for query, item in zip(queries, batched):
+            if isinstance(item, BitrixError):
+                raise item
+            tasks.extend(self._task_list(item))
+            try:
+                total = int(item.get("total") or 0)
+            except (TypeError, ValueError):
+                total = 0
+            more.extend(
+                ("tasks.task.list", [*query, ("start", str(offset))])
+                for offset in range(TASK_LIST_PAGE_SIZE, total, TASK_LIST_PAGE_SIZE)
+            )
+        for item in await self.batch(more, priority=call_priority):
+            if isinstance(item, BitrixError):
+                raise item
+            tasks.extend(self._task_list(item))
+        return tasks
 
     async def create_task(
         self,
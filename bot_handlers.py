@@ -1,14 +1,16 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import io
 import logging
 import datetime
 logger = logging.getLogger(__name__)
 import os
 import re
-import httpx
+import time
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterable, List, Optional
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, Update
 from telegram.constants import ChatAction
@@ -21,10 +23,27 @@ from telegram.ext import (
     filters,
 )
 
-from bitrix import BitrixClient, BitrixError
+from bitrix import (
+    CIRCUIT_OPEN,
+    CAP_UPLOAD_FILE_CONTENT,
+    OPERATING_BUDGET_EXHAUSTED,
+    OPERATION_TIME_LIMIT,
+    PRIORITY_LOW,
+    QUERY_LIMIT_EXCEEDED,
+    UPLOAD_DEFAULT_SMALL_BYTES,
+    BitrixClient,
+    BitrixError,
+    sha256_content_key,
+    telegram_content_key,
+)
 from config import Settings
+from links_admin import export_links_file, import_links
 from utils import make_ticket_id, safe_filename
-from storage import build_upload_dir, make_local_path, SavedFile
+from storage import build_upload_dir, iter_url_chunks, make_local_path, SavedFile
+from taskcache import TaskListCache
+from taskmirror import TaskMirror
+from uploadqueue import UploadScheduler
+from userdir import UserDirectory
 log = logging.getLogger(__name__)
 
 BTN_CREATE = "📝 Создать задачу"
@@ -38,6 +57,7 @@ MAIN_MENU = ReplyKeyboardMarkup(
 LINK_WAIT = 9901
 MAX_ATTACHMENTS_PER_TASK = 10
 MAX_ATTACHMENT_BYTES = 20 * 1024 * 1024  # 20 MB
+MAX_LINKS_CSV_BYTES = 5 * 1024 * 1024
 UPLOAD_PARALLELISM = 2
 
 def parse_bitrix_user_id(text: str) -> int | None:
@@ -325,6 +345,7 @@ async def cmd_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
 
 async def cmd_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    _discard_eager_uploads(context)
     context.user_data.clear()
     if update.message:
         await update.message.reply_text("\u041e\u0442\u043c\u0435\u043d\u0435\u043d\u043e.", reply_markup=MAIN_MENU_START)
@@ -336,6 +357,7 @@ async def cb_start_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     await query.answer()
     fake_update = update
     # Запускаем как /task
+    _discard_eager_uploads(context)
     context.user_data.clear()
     ticket_id = make_ticket_id()
     context.user_data["ticket_id"] = ticket_id
@@ -368,6 +390,47 @@ async def on_description(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return WAIT_ATTACHMENTS
 
 
+def _use_upload_passthrough(context: ContextTypes.DEFAULT_TYPE) -> bool:
+    settings = context.application.bot_data["settings"]
+    if not settings.bitrix_upload_passthrough:
+        return False
+    # Streaming needs fileContent; on portals where it is known to fail keep the local copy.
+    bitrix: BitrixClient = context.application.bot_data["bitrix"]
+    return bitrix.capabilities.get(CAP_UPLOAD_FILE_CONTENT) is not False
+
+
+def _passthrough_saved_file(original_name: str, file) -> SavedFile | None:
+    # A local Bot API server returns a filesystem path instead of a URL: download as usual.
+    source_url = getattr(file, "file_path", None) or ""
+    if not source_url.startswith(("http://", "https://")):
+        return None
+    return SavedFile(
+        original_name=original_name,
+        local_path="",
+        source_url=source_url,
+        size_bytes=getattr(file, "file_size", None),
+    )
+
+
+def _already_attached(saved: List[SavedFile], file_unique_id: str) -> bool:
+    return any(f.file_unique_id == file_unique_id for f in saved)
+
+
+async def _known_attachment(
+    context: ContextTypes.DEFAULT_TYPE,
+    original_name: str,
+    file_unique_id: str,
+) -> SavedFile | None:
+    # A file already on Bitrix Disk is neither downloaded from Telegram nor uploaded again.
+    settings = context.application.bot_data["settings"]
+    bitrix: BitrixClient = context.application.bot_data["bitrix"]
+    file_id = await bitrix.find_uploaded(settings.bitrix_disk_folder_id, [telegram_content_key(file_unique_id)])
+    if file_id is None:
+        return None
+    log.info("Attachment %s already on Bitrix Disk file_id=%s, skipping download", original_name, file_id)
+    return SavedFile(original_name=original_name, local_path="", disk_file_id=file_id)
+
+
 async def on_attachment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     settings = context.application.bot_data["settings"]
     tg_user_id = update.effective_user.id
@@ -396,12 +459,22 @@ async def on_attachment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
                 "Файл слишком большой. Максимальный размер вложения: 20 MB."
             )
             return WAIT_ATTACHMENTS
-        file = await context.bot.get_file(photo.file_id)
         filename = f"photo_{photo.file_unique_id}.jpg"
-        local_path = make_local_path(upload_dir, filename)
-        await file.download_to_drive(custom_path=local_path)
-        saved.append(SavedFile(original_name=filename, local_path=local_path))
+        if _already_attached(saved, photo.file_unique_id):
+            await update.message.reply_text(f"Это фото уже добавлено: {filename}")
+            return WAIT_ATTACHMENTS
+        saved_file = await _known_attachment(context, filename, photo.file_unique_id)
+        if saved_file is None:
+            file = await context.bot.get_file(photo.file_id)
+            saved_file = _passthrough_saved_file(filename, file) if _use_upload_passthrough(context) else None
+        if saved_file is None:
+            local_path = make_local_path(upload_dir, filename)
+            await file.download_to_drive(custom_path=local_path)
+            saved_file = SavedFile(original_name=filename, local_path=local_path)
+        saved_file.file_unique_id = photo.file_unique_id
+        saved.append(saved_file)
         context.user_data["files"] = saved
+        _start_eager_upload(context, saved[-1], tg_user_id)
         await update.message.reply_text(f"Ок, сохранил фото: {filename}")
         return WAIT_ATTACHMENTS
 
@@ -413,13 +486,23 @@ async def on_attachment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
                 "Файл слишком большой. Максимальный размер вложения: 20 MB."
             )
             return WAIT_ATTACHMENTS
-        file = await context.bot.get_file(doc.file_id)
         original = doc.file_name or f"document_{doc.file_unique_id}"
-        filename = safe_filename(original)
-        local_path = make_local_path(upload_dir, filename)
-        await file.download_to_drive(custom_path=local_path)
-        saved.append(SavedFile(original_name=original, local_path=local_path))
+        if _already_attached(saved, doc.file_unique_id):
+            await update.message.reply_text(f"Этот файл уже добавлен: {original}")
+            return WAIT_ATTACHMENTS
+        saved_file = await _known_attachment(context, original, doc.file_unique_id)
+        if saved_file is None:
+            file = await context.bot.get_file(doc.file_id)
+            saved_file = _passthrough_saved_file(original, file) if _use_upload_passthrough(context) else None
+        if saved_file is None:
+            filename = safe_filename(original)
+            local_path = make_local_path(upload_dir, filename)
+            await file.download_to_drive(custom_path=local_path)
+            saved_file = SavedFile(original_name=original, local_path=local_path)
+        saved_file.file_unique_id = doc.file_unique_id
+        saved.append(saved_file)
         context.user_data["files"] = saved
+        _start_eager_upload(context, saved[-1], tg_user_id)
         await update.message.reply_text(f"Ок, сохранил файл: {original}")
         return WAIT_ATTACHMENTS
 
@@ -444,6 +527,7 @@ async def cb_attachments_done(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def cb_cancel_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
+    _discard_eager_uploads(context)
     context.user_data.clear()
     await query.message.reply_text("\u041e\u0442\u043c\u0435\u043d\u0435\u043d\u043e.", reply_markup=MAIN_MENU_START)
     return ConversationHandler.END
@@ -1090,107 +1174,6 @@ def _kb_link_required() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup([[BTN_LINK], [BTN_HELP]], resize_keyboard=True)
 
 
-def get_linked_bitrix_id(context: ContextTypes.DEFAULT_TYPE, tg_id: int) -> int | None:
-    """
-    Single source of truth.
-    Всегда читает sqlite через UserMap (tg_bitrix_map).
-    Может мягко кэшировать в context.user_data (но это НЕ источник истины).
-    """
-    try:
-        usermap = context.application.bot_data.get("usermap")
-        linked = usermap.get(int(tg_id)) if usermap else None
-    except Exception:
-        linked = None
-
-    # мягкий кэш (не источник истины)
-    try:
-        if linked is not None:
-            context.user_data["bitrix_user_id"] = int(linked)
-        else:
-            context.user_data.pop("bitrix_user_id", None)
-    except Exception:
-        pass
-
-    return int(linked) if linked is not None else None
-
-
-def is_linked(context, tg_id: int) -> int | None:
-    # совместимость: старое имя, но теперь работает корректно
-    return get_linked_bitrix_id(context, tg_id)
-
-
-async def show_link_required(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = update.effective_user.id if update and update.effective_user else None
-    log.info("HIT show_link_required tg_id=%s linked=%s", uid, get_linked_bitrix_id(context, uid) if uid else None)
-    await update.message.reply_text(
-        "\n".join(
-            [
-                "Сначала привяжите профиль Bitrix24 ✅",
-                "",
-                "Нажмите «🔗 Привязать профиль» и пришлите ссылку на ваш профиль или число ID.",
-            ]
-        ),
-        reply_markup=_kb_link_required(),
-    )
-
-
-async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    settings = context.application.bot_data["settings"]
-    if not _is_allowed(settings, update.effective_user.id):
-        await update.message.reply_text("Доступ запрещён.")
-        return
-    await update.message.reply_text("Выберите действие:", reply_markup=_kb_main_menu())
-
-
-async def cmd_me(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    tg_id = update.effective_user.id
-    bid = get_linked_bitrix_id(context, tg_id)
-    await update.message.reply_text(f"TG ID: {tg_id}\nBitrix ID (linked): {bid}", reply_markup=_kb_main_menu())
-
-
-async def menu_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    uid = update.effective_user.id if update and update.effective_user else None
-    text = (update.message.text or "").strip()
-    linked = get_linked_bitrix_id(context, uid) if uid else None
-    log.info("HIT menu_router tg_id=%s linked=%s", uid, linked)
-
-    if text == BTN_HELP:
-        await help_find_id(update, context)
-        return
-
-    if text == BTN_CREATE:
-        # единая точка входа в создание (cmd_task сам проверит привязку)
-        await cmd_task(update, context)
-        return
-
-    # BTN_LINK не обрабатываем здесь специально:
-    # его должен ловить link ConversationHandler, иначе будет двойной prompt.
-    await update.message.reply_text("Выберите действие кнопкой 👇", reply_markup=_kb_main_menu())
-
-
-async def cmd_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    uid = update.effective_user.id
-    linked = get_linked_bitrix_id(context, uid)
-    log.info("HIT cmd_task tg_id=%s linked=%s", uid, linked)
-
-    if not linked:
-        await show_link_required(update, context)
-        return ConversationHandler.END
-
-    # дальше — ваша существующая логика диалога задач (минимально меняем)
-    settings = context.application.bot_data["settings"]
-    if not _is_allowed(settings, uid):
-        await update.message.reply_text("Доступ запрещён.")
-        return ConversationHandler.END
-
-    context.user_data.clear()
-    ticket_id = make_ticket_id()
-    context.user_data["ticket_id"] = ticket_id
-    context.user_data["files"] = []
-    await update.message.reply_text("Ок. Введи *Название* задачи:", parse_mode="Markdown")
-    return WAIT_TITLE
-
-
 # ВАЖНО: confirm_create у вас всегда упирался в блок "created_by is None" до вычисления usermap.
 # Исправляем минимально: берём created_by из sqlite через единый helper.
 def _saved_file_label(saved_file: SavedFile) -> str:
@@ -1200,29 +1183,30 @@ def _saved_file_label(saved_file: SavedFile) -> str:
     return os.path.basename(saved_file.local_path) or "file"
 
 
-def _is_retryable_upload_error(exc: Exception) -> bool:
-    if isinstance(exc, httpx.TransportError):
-        return True
-    if isinstance(exc, BitrixError):
-        details = f"{exc.message} {exc.details}".lower()
-        markers = (
-            "timeout",
-            "readtimeout",
-            "connecttimeout",
-            "remoteprotocolerror",
-            "all disk upload strategies failed",
-            "temporar",
-            "service unavailable",
-            "gateway timeout",
-            "too many request",
-            "internal",
-            "network",
-            "502",
-            "503",
-            "504",
-        )
-        return any(marker in details for marker in markers)
-    return False
+def _bitrix_unavailable_text(bitrix: BitrixClient) -> str | None:
+    retry_in = bitrix.unavailable_for()
+    if retry_in is None:
+        return None
+    minutes = max(1, int(retry_in // 60) + 1)
+    return (
+        "Bitrix24 сейчас недоступен: запросы к порталу подряд завершаются ошибками.\n"
+        f"Задача не создана. Попробуйте снова примерно через {minutes} мин."
+    )
+
+
+# Words Bitrix uses when tasks.task.add refuses the author itself.
+_CREATED_BY_ERROR_MARKERS = ("created_by", "createdby", "постановщик", "автор", "creator", "author")
+
+
+def _is_created_by_rejection(exc: BitrixError) -> bool:
+    # Limits, 5xx and an open circuit say nothing about CREATED_BY; only an
+    # error naming the author justifies retrying and remembering the rejection.
+    if exc.status_code is not None and (exc.status_code == 429 or exc.status_code >= 500):
+        return False
+    if exc.message in (QUERY_LIMIT_EXCEEDED, OPERATION_TIME_LIMIT, OPERATING_BUDGET_EXHAUSTED, CIRCUIT_OPEN):
+        return False
+    text = f"{exc.message} {exc.details}".lower()
+    return any(marker in text for marker in _CREATED_BY_ERROR_MARKERS)
 
 
 def _format_exception_brief(exc: Exception) -> str:
@@ -1235,72 +1219,193 @@ def _format_exception_brief(exc: Exception) -> str:
     return exc.__class__.__name__
 
 
+async def _attachment_content_keys(saved_file: SavedFile) -> list[str]:
+    keys: list[str] = []
+    if saved_file.file_unique_id:
+        keys.append(telegram_content_key(saved_file.file_unique_id))
+    if saved_file.local_path:
+        try:
+            keys.append(await asyncio.to_thread(sha256_content_key, saved_file.local_path))
+        except OSError:
+            pass
+    return keys
+
+
+def _saved_file_size(saved_file: SavedFile) -> int:
+    if saved_file.size_bytes is not None:
+        return saved_file.size_bytes
+    try:
+        return os.path.getsize(saved_file.local_path)
+    except OSError:
+        return 0
+
+
+def _upload_slot(scheduler: UploadScheduler | None, tg_user_id: int, saved_file: SavedFile):
+    # The slot covers one attempt only: retry back-off does not hold up other users.
+    if scheduler is None:
+        return contextlib.nullcontext()
+    return scheduler.slot(tg_user_id, _saved_file_size(saved_file))
+
+
+async def _upload_one_to_bitrix_disk(
+    bitrix: BitrixClient,
+    folder_id: int,
+    saved_file: SavedFile,
+    max_attempts: int,
+    stream_buffer_chunks: int = 8,
+    scheduler: UploadScheduler | None = None,
+    tg_user_id: int = 0,
+) -> tuple[int | None, str | None]:
+    file_label = _saved_file_label(saved_file)
+    if saved_file.disk_file_id is not None:
+        return saved_file.disk_file_id, None
+    content_keys = await _attachment_content_keys(saved_file) if bitrix.upload_index is not None else []
+    reused = await bitrix.find_uploaded(folder_id, content_keys)
+    if reused is not None:
+        # Mark as pre-existing: a cancelled draft must not delete a file other tasks may use.
+        saved_file.disk_file_id = reused
+        log.info("Disk upload skipped name=%s: reusing file_id=%s", file_label, reused)
+        return reused, None
+    source_url = saved_file.source_url
+    # Early attempts on a small local file probe one strategy; only the final one runs them all.
+    partial_ladder = bool(saved_file.local_path) and _saved_file_size(saved_file) <= UPLOAD_DEFAULT_SMALL_BYTES
+    attempt = 0
+    while attempt < max_attempts:
+        attempt += 1
+        attempt_started = time.time()
+        log.info(
+            "Disk upload start name=%s attempt=%s/%s folder_id=%s",
+            file_label,
+            attempt,
+            max_attempts,
+            folder_id,
+        )
+        try:
+            if source_url and not saved_file.local_path:
+                async with _upload_slot(scheduler, tg_user_id, saved_file):
+                    # Pass-through: every attempt re-reads the file from Telegram.
+                    file_id = await bitrix.upload_stream_to_folder(
+                        folder_id=folder_id,
+                        name=file_label,
+                        open_stream=lambda: iter_url_chunks(source_url, stream_buffer_chunks),
+                        content_keys=content_keys,
+                        dedup_lookup=False,
+                    )
+            else:
+                # The client takes the slot inside a shared upload, which may outlive this caller.
+                file_id = await bitrix.upload_to_folder(
+                    folder_id=folder_id,
+                    local_path=saved_file.local_path,
+                    filename=file_label,
+                    upload_attempt=attempt,
+                    upload_max_attempts=max_attempts,
+                    content_keys=content_keys,
+                    dedup_lookup=False,
+                    slot=lambda: _upload_slot(scheduler, tg_user_id, saved_file),
+                )
+            log.info(
+                "Disk upload success name=%s file_id=%s attempt=%s/%s",
+                file_label,
+                file_id,
+                attempt,
+                max_attempts,
+            )
+            return int(file_id), None
+        except Exception as exc:
+            # A timeout may hide a stored file, and a blind re-upload would add "name (1)":
+            # retry as idempotent only once the folder shows the file is not there.
+            idempotent = True
+            if bitrix.retry_policy.outcome_unknown(exc):
+                landed = None
+                size_bytes = _saved_file_size(saved_file)
+                try:
+                    if size_bytes > 0:
+                        landed = await bitrix.find_landed_upload(
+                            folder_id, file_label, size_bytes, attempt_started, content_keys
+                        )
+                    else:
+                        idempotent = False
+                except Exception as lookup_exc:
+                    log.warning("Disk upload name=%s: cannot check for a landed file: %s", file_label, lookup_exc)
+                    idempotent = False
+                if landed is not None:
+                    return landed, None
+            delay = bitrix.retry_policy.next_delay(exc, attempt, idempotent) if attempt < max_attempts else None
+            if delay is not None:
+                log.warning(
+                    "Disk upload retry name=%s attempt=%s/%s in %.2fs error=%s",
+                    file_label,
+                    attempt,
+                    max_attempts,
+                    delay,
+                    _format_exception_brief(exc),
+                )
+                await asyncio.sleep(delay)
+                continue
+            if partial_ladder and idempotent and attempt < max_attempts:
+                # Not retryable for this strategy (or no retry budget): the others have not been tried yet.
+                log.warning(
+                    "Disk upload name=%s attempt=%s/%s not retried (%s), going to the all-strategies attempt",
+                    file_label,
+                    attempt,
+                    max_attempts,
+                    _format_exception_brief(exc),
+                )
+                attempt = max_attempts - 1
+                continue
+            log.exception(
+                "Disk upload failed name=%s attempt=%s/%s error=%s",
+                file_label,
+                attempt,
+                max_attempts,
+                _format_exception_brief(exc),
+            )
+            return None, file_label
+    return None, file_label
+
+
 async def _upload_files_to_bitrix_disk(
     bitrix: BitrixClient,
     folder_id: int,
     files: List[SavedFile],
     max_attempts: int = 2,
     upload_parallelism: int = UPLOAD_PARALLELISM,
+    eager_uploads: dict[str, asyncio.Task] | None = None,
+    stream_buffer_chunks: int = 8,
+    scheduler: UploadScheduler | None = None,
+    tg_user_id: int = 0,
 ) -> tuple[list[int], list[str]]:
     if not files:
         return [], []
 
-    semaphore = asyncio.Semaphore(max(1, min(upload_parallelism, len(files))))
+    # Without the process-wide scheduler fall back to a per-call cap.
+    semaphore = (
+        asyncio.Semaphore(max(1, min(upload_parallelism, len(files))))
+        if scheduler is None
+        else contextlib.nullcontext()
+    )
+    eager_uploads = eager_uploads or {}
 
     async def _upload_one(saved_file: SavedFile) -> tuple[int | None, str | None]:
-        file_label = _saved_file_label(saved_file)
+        eager = eager_uploads.get(saved_file.key)
+        if eager is not None:
+            # Started in WAIT_ATTACHMENTS: only wait for what is still running.
+            await asyncio.wait({eager})
+            if not eager.cancelled() and eager.exception() is None:
+                return eager.result()
+            log.warning("Eager upload unusable name=%s, uploading now", _saved_file_label(saved_file))
         async with semaphore:
-            for attempt in range(1, max_attempts + 1):
-                log.info(
-                    "Disk upload start name=%s attempt=%s/%s folder_id=%s",
-                    file_label,
-                    attempt,
-                    max_attempts,
-                    folder_id,
-                )
-                try:
-                    file_id = await bitrix.upload_to_folder(
-                        folder_id=folder_id,
-                        local_path=saved_file.local_path,
-                        filename=file_label,
-                        upload_attempt=attempt,
-                        upload_max_attempts=max_attempts,
-                    )
-                    log.info(
-                        "Disk upload success name=%s file_id=%s attempt=%s/%s",
-                        file_label,
-                        file_id,
-                        attempt,
-                        max_attempts,
-                    )
-                    return int(file_id), None
-                except Exception as exc:
-                    retryable = attempt < max_attempts and _is_retryable_upload_error(exc)
-                    if retryable:
-                        log.warning(
-                            "Disk upload retry name=%s attempt=%s/%s error=%s",
-                            file_label,
-                            attempt,
-                            max_attempts,
-                            _format_exception_brief(exc),
-                        )
-                        continue
-                    log.exception(
-                        "Disk upload failed name=%s attempt=%s/%s error=%s",
-                        file_label,
-                        attempt,
-                        max_attempts,
-                        _format_exception_brief(exc),
-                    )
-                    return None, file_label
-            return None, file_label
+            return await _upload_one_to_bitrix_disk(
+                bitrix, folder_id, saved_file, max_attempts, stream_buffer_chunks, scheduler, tg_user_id
+            )
 
     results = await asyncio.gather(*(_upload_one(saved_file) for saved_file in files))
 
     uploaded_ids: list[int] = []
     failed_files: list[str] = []
     for file_id, failed in results:
-        if file_id is not None:
+        # The same content attached twice resolves to one Disk file: attach it once.
+        if file_id is not None and file_id not in uploaded_ids:
             uploaded_ids.append(file_id)
         if failed:
             failed_files.append(failed)
@@ -1308,6 +1413,59 @@ async def _upload_files_to_bitrix_disk(
     return uploaded_ids, failed_files
 
 
+def _start_eager_upload(context: ContextTypes.DEFAULT_TYPE, saved_file: SavedFile, tg_user_id: int) -> None:
+    settings = context.application.bot_data["settings"]
+    if not settings.bitrix_eager_uploads or saved_file.disk_file_id is not None:
+        return
+    bitrix: BitrixClient = context.application.bot_data["bitrix"]
+    scheduler: UploadScheduler | None = context.application.bot_data.get("upload_scheduler")
+
+    async def _run() -> tuple[int | None, str | None]:
+        return await _upload_one_to_bitrix_disk(
+            bitrix,
+            settings.bitrix_disk_folder_id,
+            saved_file,
+            settings.bitrix_upload_max_attempts,
+            settings.bitrix_upload_passthrough_buffer,
+            scheduler,
+            tg_user_id,
+        )
+
+    eager: dict[str, asyncio.Task] = context.user_data.setdefault("eager_uploads", {})
+    eager[saved_file.key] = context.application.create_task(_run())
+
+
+async def _delete_orphan_uploads(
+    bitrix: BitrixClient,
+    tasks: list[asyncio.Task],
+    extra_file_ids: list[int],
+) -> None:
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    file_ids = [result[0] for result in results if isinstance(result, tuple) and result[0] is not None]
+    # Files uploaded for this draft outside the eager path (at confirmation time).
+    file_ids.extend(file_id for file_id in extra_file_ids if file_id not in file_ids)
+    for file_id in file_ids:
+        try:
+            # Shared, reused and already attached files are only released, not deleted.
+            if await bitrix.release_upload(file_id):
+                log.info("Deleted orphan disk upload file_id=%s", file_id)
+        except Exception as exc:
+            log.warning("Cannot delete orphan disk upload file_id=%s: %s", file_id, _format_exception_brief(exc))
+
+
+def _discard_eager_uploads(context: ContextTypes.DEFAULT_TYPE, extra_file_ids: Iterable[int] = ()) -> None:
+    """Cancel uploads of an abandoned draft and remove what only this draft uploaded to Bitrix Disk."""
+    eager: dict[str, asyncio.Task] = context.user_data.pop("eager_uploads", None) or {}
+    extra = list(extra_file_ids)
+    if not eager and not extra:
+        return
+    for task in eager.values():
+        if not task.done():
+            task.cancel()
+    bitrix: BitrixClient = context.application.bot_data["bitrix"]
+    context.application.create_task(_delete_orphan_uploads(bitrix, list(eager.values()), extra))
+
+
 async def cb_confirm_create(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     query = update.callback_query
     await query.answer()
@@ -1321,6 +1479,7 @@ async def cb_confirm_create(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     if not title or not user_desc:
         await query.message.reply_text("Не хватает данных. Запусти /task заново.")
+        _discard_eager_uploads(context)
         context.user_data.clear()
         return ConversationHandler.END
 
@@ -1328,7 +1487,7 @@ async def cb_confirm_create(update: Update, context: ContextTypes.DEFAULT_TYPE)
     attachments = build_attachments_block(files, settings.upload_dir)
     full_desc = build_task_description(user_desc, initiator, attachments)
 
-    created_by = get_linked_bitrix_id(context, update.effective_user.id)
+    created_by = await _aget_linked_bitrix_id(context, update.effective_user.id, use_cache=False)
     log.info("HIT cb_confirm_create tg_id=%s created_by=%s", update.effective_user.id, created_by)
 
     if created_by is None:
@@ -1336,27 +1495,45 @@ async def cb_confirm_create(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "Нельзя создать задачу без привязки профиля Bitrix24.\n"
             "Сначала нажмите «🔗 Привязать профиль» и пришлите ID/ссылку."
         )
+        _discard_eager_uploads(context)
         context.user_data.clear()
         return ConversationHandler.END
 
     uploaded_ids: list[int] = []
     failed_files: list[str] = []
     if files:
-        await query.message.reply_text(f"Загружаю вложения в Bitrix24 Disk: {len(files)} шт.")
+        eager_uploads: dict[str, asyncio.Task] = context.user_data.get("eager_uploads") or {}
+        pending = sum(1 for f in files if not (f.key in eager_uploads and eager_uploads[f.key].done()))
+        if pending:
+            await query.message.reply_text(f"Загружаю вложения в Bitrix24 Disk: {pending} шт.")
+            scheduler: UploadScheduler | None = context.application.bot_data.get("upload_scheduler")
+            if scheduler is not None and scheduler.stats()["queue_depth"]:
+                log.info("Upload scheduler busy: %s", scheduler.stats())
         uploaded_ids, failed_files = await _upload_files_to_bitrix_disk(
             bitrix=bitrix,
             folder_id=settings.bitrix_disk_folder_id,
             files=files,
             max_attempts=settings.bitrix_upload_max_attempts,
             upload_parallelism=settings.bitrix_upload_parallelism,
+            eager_uploads=eager_uploads,
+            stream_buffer_chunks=settings.bitrix_upload_passthrough_buffer,
+            scheduler=context.application.bot_data.get("upload_scheduler"),
+            tg_user_id=update.effective_user.id,
         )
         if failed_files and not uploaded_ids:
+            unavailable = _bitrix_unavailable_text(bitrix)
+            if unavailable:
+                await query.message.reply_text(unavailable)
+                _discard_eager_uploads(context)
+                context.user_data.clear()
+                return ConversationHandler.END
             failed_list = "\n".join(f"- {name}" for name in failed_files)
             await query.message.reply_text(
                 "Не удалось загрузить ни одно вложение, задача не создана.\n"
                 "Проверьте доступ к папке Bitrix Disk и попробуйте снова.\n\n"
                 f"Неуспешные файлы:\n{failed_list}"
             )
+            _discard_eager_uploads(context)
             context.user_data.clear()
             return ConversationHandler.END
         if failed_files:
@@ -1368,6 +1545,11 @@ async def cb_confirm_create(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     await query.message.reply_text("Создаю задачу в Bitrix24…")
 
+    # Skip the doomed first attempt when the portal recently rejected CREATED_BY for this user.
+    created_by_accepted = await _aget_created_by_accepted(context, created_by)
+    send_created_by = created_by if created_by_accepted is not False else None
+    if send_created_by is None:
+        _count_created_by_skip(context)
     try:
         task_id = await bitrix.create_task(
             title=title,
@@ -1375,10 +1557,21 @@ async def cb_confirm_create(update: Update, context: ContextTypes.DEFAULT_TYPE)
             responsible_id=settings.bitrix_default_responsible_id,
             group_id=settings.bitrix_group_id,
             priority=settings.bitrix_priority,
-            created_by=created_by,
+            created_by=send_created_by,
             webdav_file_ids=uploaded_ids,
         )
+        if send_created_by is not None and created_by_accepted is None:
+            await _arecord_created_by_accepted(context, created_by, True)
     except BitrixError as e:
+        if send_created_by is None or not _is_created_by_rejection(e):
+            log.exception("Bitrix error")
+            await query.message.reply_text(
+                _bitrix_unavailable_text(bitrix)
+                or "Не получилось создать задачу из-за ошибки Bitrix24. Попробуйте позже."
+            )
+            _discard_eager_uploads(context, uploaded_ids)
+            context.user_data.clear()
+            return ConversationHandler.END
         log.warning("Bitrix rejected CREATED_BY=%s, retrying without it: %s", created_by, e.message)
         try:
             task_id = await bitrix.create_task(
@@ -1390,21 +1583,35 @@ async def cb_confirm_create(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 created_by=None,
                 webdav_file_ids=uploaded_ids,
             )
+            await _arecord_created_by_accepted(context, created_by, False)
         except Exception:
             log.exception("Bitrix error (retry without CREATED_BY)")
             await query.message.reply_text(
-                "Не получилось создать задачу из-за ошибки Bitrix24. Попробуйте позже."
+                _bitrix_unavailable_text(bitrix)
+                or "Не получилось создать задачу из-за ошибки Bitrix24. Попробуйте позже."
             )
+            _discard_eager_uploads(context, uploaded_ids)
             context.user_data.clear()
             return ConversationHandler.END
     except Exception:
         log.exception("Unexpected error")
         await query.message.reply_text(
-            "Не получилось создать задачу из-за ошибки Bitrix24. Попробуйте позже."
+            _bitrix_unavailable_text(bitrix)
+            or "Не получилось создать задачу из-за ошибки Bitrix24. Попробуйте позже."
         )
+        _discard_eager_uploads(context, uploaded_ids)
         context.user_data.clear()
         return ConversationHandler.END
 
+    bitrix.adopt_uploads(uploaded_ids)
+    cache: TaskListCache | None = context.application.bot_data.get("mytasks_cache")
+    if cache:
+        # Next /mytasks must include the task we just created.
+        cache.invalidate(int(created_by))
+    mirror: TaskMirror | None = context.application.bot_data.get("task_mirror")
+    if mirror is not None:
+        mirror.mark_stale(int(created_by))
+
     link = _task_link(settings, task_id)
     result_lines = ["Задача создана ✅", f"ID: {task_id}"]
     if link:
@@ -1420,26 +1627,22 @@ async def cb_confirm_create(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return ConversationHandler.END
 
 
-# hydrate_link: оставляем, но делаем опору на sqlite через единый helper
-async def hydrate_link(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if not getattr(update, "effective_user", None):
-        return
-    tg_id = int(update.effective_user.id)
-    bid = get_linked_bitrix_id(context, tg_id)
-    log.debug("HIT hydrate_link tg_id=%s linked=%s", tg_id, bid)
-
 # =========================
 # === CLEAN_LAYER_V1 ======
 # =========================
 # Этот блок intentionally переопределяет (exports) ключевые обработчики,
 # чтобы устранить дубли/патчи выше по файлу и иметь однозначную архитектуру.
 
-from linking import get_linked_bitrix_id as _get_linked_bitrix_id
-from linking import set_linked_bitrix_id as _set_linked_bitrix_id
+from linking import count_created_by_skip as _count_created_by_skip
+from linking import aget_linked_bitrix_id as _aget_linked_bitrix_id
+from linking import aset_linked_bitrix_id as _aset_linked_bitrix_id
+from linking import aget_created_by_accepted as _aget_created_by_accepted
+from linking import arecord_created_by_accepted as _arecord_created_by_accepted
 
 _CLEAN_LOG = logging.getLogger("clean")
 BTN_MY_TASKS = "📋 Мои задачи"
-MYTASKS_LIMIT = 5
+LINK_MATCH_LIMIT = 5
+LINK_CONFIRM = 9902
 _REAL_STATUS_LABELS = {
     1: "Новая",
     2: "Ждёт выполнения",
@@ -1456,7 +1659,7 @@ MAIN_MENU_LINK_REQUIRED = ReplyKeyboardMarkup([[BTN_CREATE, BTN_LINK], [BTN_MY_T
 
 async def show_link_required(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     tg_id = update.effective_user.id if update.effective_user else None
-    bid = _get_linked_bitrix_id(context, int(tg_id)) if tg_id else None
+    bid = await _aget_linked_bitrix_id(context, int(tg_id)) if tg_id else None
     _CLEAN_LOG.info("HIT show_link_required tg_id=%s linked=%s", tg_id, bid)
     await update.message.reply_text(
         "\n".join([
@@ -1478,7 +1681,7 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def cmd_me(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     tg_id = update.effective_user.id
-    bid = _get_linked_bitrix_id(context, tg_id)
+    bid = await _aget_linked_bitrix_id(context, tg_id)
     _CLEAN_LOG.info("HIT cmd_me tg_id=%s linked=%s", tg_id, bid)
     await update.message.reply_text(f"TG ID: {tg_id}\nBitrix ID (linked): {bid}", reply_markup=MAIN_MENU_START)
 
@@ -1520,6 +1723,40 @@ def _task_id(task: dict) -> int | None:
         return None
 
 
+def _responsible_label(directory: UserDirectory | None, task: dict) -> str | None:
+    # Имя берём из локального справочника пользователей, без user.get на каждую задачу.
+    raw = task.get("responsibleId", task.get("RESPONSIBLE_ID"))
+    try:
+        responsible_id = int(raw)
+    except Exception:
+        return None
+    name = directory.display_name(responsible_id) if directory is not None else None
+    return name or f"ID {responsible_id}"
+
+
+async def _refresh_mytasks_cache(
+    bitrix: BitrixClient,
+    cache: TaskListCache,
+    bitrix_user_id: int,
+    limit: int,
+) -> None:
+    try:
+        tasks = await bitrix.list_tasks_created_by(
+            bitrix_user_id,
+            limit=limit,
+            call_priority=PRIORITY_LOW,
+        )
+        cache.put(bitrix_user_id, tasks)
+    except Exception as exc:
+        _CLEAN_LOG.warning(
+            "mytasks background refresh failed bitrix_user_id=%s error=%s",
+            bitrix_user_id,
+            _format_exception_brief(exc),
+        )
+    finally:
+        cache.end_refresh(bitrix_user_id)
+
+
 async def cmd_mytasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     context.user_data["_menu_shown"] = True
     settings = context.application.bot_data["settings"]
@@ -1535,23 +1772,51 @@ async def cmd_mytasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         )
         return
 
-    bitrix_user_id = _get_linked_bitrix_id(context, tg_id)
+    bitrix_user_id = await _aget_linked_bitrix_id(context, tg_id)
     _CLEAN_LOG.info("HIT cmd_mytasks tg_id=%s linked=%s", tg_id, bitrix_user_id)
     if not bitrix_user_id:
         await show_link_required(update, context)
         return
 
     bitrix: BitrixClient = context.application.bot_data["bitrix"]
-    await update.message.reply_text("Смотрю задачи, которые вы создали в Bitrix24…")
-    try:
-        tasks = await bitrix.list_tasks_created_by(int(bitrix_user_id), limit=MYTASKS_LIMIT)
-    except Exception:
-        _CLEAN_LOG.exception("cmd_mytasks failed tg_id=%s bitrix_user_id=%s", tg_id, bitrix_user_id)
-        await update.message.reply_text(
-            "Не удалось получить список задач из Bitrix24. Попробуйте позже.",
-            reply_markup=MAIN_MENU_START,
-        )
-        return
+    limit = settings.mytasks_limit
+    # The synced mirror answers without touching the portal; the cache and a live call are the fallback.
+    mirror: TaskMirror | None = context.application.bot_data.get("task_mirror")
+    tasks = mirror.tasks_for(int(bitrix_user_id), limit) if mirror is not None else None
+    cache: TaskListCache | None = context.application.bot_data.get("mytasks_cache")
+    stale = False
+    if tasks is None and cache:
+        tasks, stale = cache.get(int(bitrix_user_id))
+    if tasks is not None and stale and cache.begin_refresh(int(bitrix_user_id)):
+        context.application.create_task(_refresh_mytasks_cache(bitrix, cache, int(bitrix_user_id), limit))
+
+    if tasks is None:
+        await update.message.reply_text("Смотрю задачи, которые вы создали в Bitrix24…")
+        try:
+            tasks = await bitrix.list_tasks_created_by(
+                int(bitrix_user_id),
+                limit=limit,
+                call_priority=PRIORITY_LOW,
+            )
+        except Exception as exc:
+            if isinstance(exc, BitrixError) and exc.message in (OPERATING_BUDGET_EXHAUSTED, OPERATION_TIME_LIMIT):
+                # Low-priority read deferred so tasks.task.add keeps its operating budget.
+                _CLEAN_LOG.warning("cmd_mytasks deferred tg_id=%s reason=%s", tg_id, exc.message)
+                await update.message.reply_text(
+                    "Bitrix24 сейчас перегружен, список задач временно недоступен. Попробуйте через несколько минут.",
+                    reply_markup=MAIN_MENU_START,
+                )
+                return
+            _CLEAN_LOG.exception("cmd_mytasks failed tg_id=%s bitrix_user_id=%s", tg_id, bitrix_user_id)
+            await update.message.reply_text(
+                "Не удалось получить список задач из Bitrix24. Попробуйте позже.",
+                reply_markup=MAIN_MENU_START,
+            )
+            return
+        if cache:
+            cache.put(int(bitrix_user_id), tasks)
+        if mirror is not None:
+            await mirror.forget_missing(context.application.bot_data["usermap"], int(bitrix_user_id), tasks)
 
     if not tasks:
         await update.message.reply_text(
@@ -1560,6 +1825,7 @@ async def cmd_mytasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         )
         return
 
+    directory: UserDirectory | None = context.application.bot_data.get("user_directory")
     lines = ["📋 Ваши последние задачи (вы автор):"]
     for index, task in enumerate(tasks, start=1):
         task_id = _task_id(task)
@@ -1569,6 +1835,9 @@ async def cmd_mytasks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         status = _status_label(task)
         deadline = _deadline_label(task)
         row = [f"{index}. #{task_id if task_id is not None else '?'} — {title}", f"Статус: {status}"]
+        responsible = _responsible_label(directory, task)
+        if responsible:
+            row.append(f"Ответственный: {responsible}")
         if deadline != "-":
             row.append(f"Срок: {deadline}")
         if task_id is not None:
@@ -1587,7 +1856,7 @@ async def hydrate_link(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         tg_id = int(update.effective_user.id)
     except Exception:
         return
-    bid = _get_linked_bitrix_id(context, tg_id)
+    bid = await _aget_linked_bitrix_id(context, tg_id)
     if bid:
         try:
             context.user_data["bitrix_user_id"] = int(bid)
@@ -1599,11 +1868,12 @@ async def link_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text(
         "\n".join([
             "Привязать профиль Bitrix24:",
-            "Пришлите ссылку на ваш профиль или просто число ID.",
+            "Пришлите ссылку на ваш профиль, число ID, рабочий e-mail или «Имя Фамилия».",
             "",
             "Пример:",
             "https://<portal>.bitrix24.ru/company/personal/user/123/",
             "или: 123",
+            "или: ivan.petrov@company.ru",
         ]),
         reply_markup=MAIN_MENU_START
     )
@@ -1616,26 +1886,130 @@ async def link_receive(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
         await update.message.reply_text("Доступ запрещён.", reply_markup=MAIN_MENU_START)
         return ConversationHandler.END
 
-    bitrix_user_id = parse_bitrix_user_id(update.message.text)
+    text = update.message.text or ""
+    context.user_data.pop("link_candidate", None)
+    bitrix_user_id = parse_bitrix_user_id(text)
+    directory: UserDirectory | None = context.application.bot_data.get("user_directory")
+    profile = ""
+    if directory is not None and bitrix_user_id:
+        try:
+            user = await directory.resolve_id(
+                context.application.bot_data["bitrix"],
+                context.application.bot_data["usermap"],
+                int(bitrix_user_id),
+            )
+        except Exception as exc:
+            # Портал недоступен — не блокируем привязку, ID проверит следующая синхронизация.
+            _CLEAN_LOG.warning(
+                "link_receive could not verify bitrix_user_id=%s error=%s",
+                bitrix_user_id,
+                _format_exception_brief(exc),
+            )
+        else:
+            if user is None:
+                await update.message.reply_text(
+                    f"Пользователь с ID {bitrix_user_id} в Bitrix24 не найден. Проверьте ссылку или ID.",
+                    reply_markup=MAIN_MENU_START
+                )
+                return LINK_WAIT
+            if not user.active:
+                await update.message.reply_text(
+                    f"Профиль {user.display_name} (ID {user.id}) в Bitrix24 деактивирован. Пришлите другой.",
+                    reply_markup=MAIN_MENU_START
+                )
+                return LINK_WAIT
+            profile = f" {user.display_name} (ID {user.id})"
+    elif directory is not None:
+        # E-mail ищется точно, а имя может совпасть с чужим профилем (в том числе по части
+        # имени), поэтому по имени привязываем только после подтверждения кнопкой.
+        matches = directory.find(text, limit=LINK_MATCH_LIMIT)
+        if len(matches) > 1:
+            await update.message.reply_text(
+                "\n".join([
+                    "Нашлось несколько сотрудников — пришлите ID или ссылку на свой профиль:",
+                    *(f"{user.display_name} — ID {user.id}" for user in matches),
+                ]),
+                reply_markup=MAIN_MENU_START
+            )
+            return LINK_WAIT
+        if matches and "@" in text:
+            bitrix_user_id = matches[0].id
+            profile = f" {matches[0].display_name} (ID {matches[0].id})"
+        elif matches:
+            context.user_data["link_candidate"] = matches[0].id
+            await update.message.reply_text(
+                f"Это ваш профиль: {matches[0].display_name} (ID {matches[0].id})?",
+                reply_markup=_link_confirm_keyboard(matches[0].id),
+            )
+            return LINK_CONFIRM
     if not bitrix_user_id:
         await update.message.reply_text(
-            "Не понял ID. Пришлите ссылку вида .../user/123/ или просто число 123.",
+            "Не нашёл профиль. Пришлите ссылку вида .../user/123/, число 123, e-mail или «Имя Фамилия».",
             reply_markup=MAIN_MENU_START
         )
         return LINK_WAIT
 
-    _set_linked_bitrix_id(context, tg_id, int(bitrix_user_id))
+    await _finish_link(update.message, context, tg_id, int(bitrix_user_id), profile)
+    return ConversationHandler.END
+
+
+def _link_confirm_keyboard(bitrix_user_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [
+            [InlineKeyboardButton("Да, это я ✅", callback_data=f"link_confirm:{bitrix_user_id}")],
+            [InlineKeyboardButton("Нет ❌", callback_data="link_reject")],
+        ]
+    )
+
+
+async def _finish_link(message, context: ContextTypes.DEFAULT_TYPE, tg_id: int, bitrix_user_id: int, profile: str) -> None:
+    await _aset_linked_bitrix_id(context, tg_id, bitrix_user_id)
     _CLEAN_LOG.info("HIT link_receive tg_id=%s linked=%s", tg_id, bitrix_user_id)
+    mirror: TaskMirror | None = context.application.bot_data.get("task_mirror")
+    if mirror is not None:
+        mirror.mark_stale(bitrix_user_id)
 
-    await update.message.reply_text(
-        f"Готово ✅ Профиль привязан.\nТеперь нажмите «{BTN_CREATE}».",
+    await message.reply_text(
+        f"Готово ✅ Профиль{profile} привязан.\nТеперь нажмите «{BTN_CREATE}».",
         reply_markup=MAIN_MENU_START
     )
+
+
+async def cb_link_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    candidate = context.user_data.pop("link_candidate", None)
+    try:
+        bitrix_user_id = int((query.data or "").split(":", 1)[1])
+    except (IndexError, ValueError):
+        bitrix_user_id = None
+    # Кнопка из старого сообщения не должна привязать другой профиль.
+    if candidate is None or bitrix_user_id != candidate:
+        await query.message.reply_text(
+            "Подтверждение устарело. Пришлите ссылку, ID, e-mail или «Имя Фамилия» ещё раз.",
+            reply_markup=MAIN_MENU_START
+        )
+        return LINK_WAIT
+    directory: UserDirectory | None = context.application.bot_data.get("user_directory")
+    name = directory.display_name(bitrix_user_id) if directory is not None else None
+    profile = f" {name} (ID {bitrix_user_id})" if name else f" ID {bitrix_user_id}"
+    await _finish_link(query.message, context, int(update.effective_user.id), bitrix_user_id, profile)
     return ConversationHandler.END
 
+
+async def cb_link_reject(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    await query.answer()
+    context.user_data.pop("link_candidate", None)
+    await query.message.reply_text(
+        "Пришлите ссылку на ваш профиль, ID или рабочий e-mail.",
+        reply_markup=MAIN_MENU_START
+    )
+    return LINK_WAIT
+
 async def cmd_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     tg_id = update.effective_user.id
-    bid = _get_linked_bitrix_id(context, tg_id)
+    bid = await _aget_linked_bitrix_id(context, tg_id)
     _CLEAN_LOG.info("HIT cmd_task tg_id=%s linked=%s", tg_id, bid)
 
     if not bid:
@@ -1648,6 +2022,7 @@ async def cmd_task(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         await update.message.reply_text("Доступ запрещён.")
         return ConversationHandler.END
 
+    _discard_eager_uploads(context)
     context.user_data.clear()
     ticket_id = make_ticket_id()
     context.user_data["ticket_id"] = ticket_id
@@ -1659,7 +2034,7 @@ async def menu_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     # В main.py сейчас сюда попадает только HELP, но на всякий случай — держим полный роутер.
     text = (update.message.text or "").strip()
     tg_id = update.effective_user.id if update.effective_user else None
-    bid = _get_linked_bitrix_id(context, int(tg_id)) if tg_id else None
+    bid = await _aget_linked_bitrix_id(context, int(tg_id)) if tg_id else None
     _CLEAN_LOG.info("HIT menu_router tg_id=%s linked=%s", tg_id, bid)
 
     if text == BTN_HELP:
@@ -1680,6 +2055,63 @@ async def menu_router(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
     await update.message.reply_text("Выберите действие кнопкой 👇", reply_markup=MAIN_MENU_START)
 
+def _is_admin(settings, tg_user_id: int) -> bool:
+    return tg_user_id in settings.admin_tg_users
+
+async def cmd_exportlinks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    settings = context.application.bot_data["settings"]
+    if not _is_admin(settings, update.effective_user.id):
+        await update.message.reply_text("Доступ запрещён.", reply_markup=MAIN_MENU_START)
+        return
+    usermap = context.application.bot_data["usermap"]
+    spool, count = await usermap.run(export_links_file, usermap)
+    _CLEAN_LOG.info("HIT cmd_exportlinks tg_id=%s links=%s", update.effective_user.id, count)
+    with spool:
+        await update.message.reply_document(
+            document=spool,
+            filename="tg_bitrix_links.csv",
+            caption=f"Привязок: {count}",
+        )
+
+async def on_links_csv(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # CSV-документ с подписью /importlinks: массовая привязка (только для ADMIN_TG_USERS).
+    settings = context.application.bot_data["settings"]
+    if not _is_admin(settings, update.effective_user.id):
+        await update.message.reply_text("Доступ запрещён.", reply_markup=MAIN_MENU_START)
+        return
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_LINKS_CSV_BYTES:
+        await update.message.reply_text("Файл слишком большой: максимум 5 MB.")
+        return
+    tg_file = await document.get_file()
+    raw = bytes(await tg_file.download_as_bytearray())
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # Excel на русской Windows сохраняет CSV в cp1251.
+        text = raw.decode("cp1251", errors="replace")
+    try:
+        report = await import_links(
+            context.application.bot_data["usermap"],
+            io.StringIO(text, newline=""),
+            bitrix=context.application.bot_data["bitrix"],
+        )
+    except BitrixError as e:
+        log.warning("Link import: Bitrix user check failed: %s", e.message)
+        await update.message.reply_text(
+            _bitrix_unavailable_text(context.application.bot_data["bitrix"])
+            or f"Не удалось проверить ID в Bitrix24 ({e.message}). Файл не импортирован."
+        )
+        return
+    _CLEAN_LOG.info(
+        "HIT on_links_csv tg_id=%s rows=%s imported=%s elapsed_s=%.3f",
+        update.effective_user.id,
+        report.rows,
+        report.imported,
+        report.elapsed_s,
+    )
+    await update.message.reply_text(report.summary())
+
 def build_conversation_handler() -> ConversationHandler:
     # ✅ BTN_CREATE как entry_point ConversationHandler (ключевой фикс)
     return ConversationHandler(
@@ -1712,7 +2144,14 @@ def build_link_conversation_handler() -> ConversationHandler:
             CommandHandler("link", link_start),
             MessageHandler(filters.Regex(r"^🔗 Привязать профиль$"), link_start),
         ],
-        states={LINK_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, link_receive)]},
+        states={
+            LINK_WAIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, link_receive)],
+            LINK_CONFIRM: [
+                CallbackQueryHandler(cb_link_confirm, pattern=r"^link_confirm:\d+$"),
+                CallbackQueryHandler(cb_link_reject, pattern="^link_reject$"),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, link_receive),
+            ],
+        },
         fallbacks=[CommandHandler("cancel", cmd_cancel)],
         per_message=False,
     )
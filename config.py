@@ -68,8 +68,15 @@ class Settings:
     bitrix_portal_base: str
     bitrix_task_url_template: str
     allowed_tg_users: set[int]
+    admin_tg_users: set[int]
     upload_dir: str
     usermap_db: str
+    usermap_cache_max: int
+    usermap_negative_ttl_s: float
+    usermap_positive_ttl_s: float
+    user_directory: bool
+    user_directory_refresh_s: float
+    user_directory_full_sync_s: float
     bitrix_http_timeout: float
     bitrix_upload_timeout: float
     bitrix_upload_url_timeout: float
@@ -77,7 +84,58 @@ class Settings:
     bitrix_small_upload_final_timeout: float
     bitrix_upload_max_attempts: int
     bitrix_upload_parallelism: int
+    bitrix_upload_global_parallelism: int
+    bitrix_eager_uploads: bool
+    bitrix_upload_passthrough: bool
+    bitrix_upload_passthrough_buffer: int
+    bitrix_upload_dedup: bool
+    bitrix_upload_dedup_verify_s: float
+    bitrix_upload_dedup_ttl_s: float
+    bitrix_upload_strategy_explore: float
+    bitrix_adaptive_timeouts: bool
+    bitrix_timeout_quantile: float
+    bitrix_timeout_safety: float
+    bitrix_timeout_floor_s: float
+    bitrix_timeout_min_samples: int
+    bitrix_hedging: bool
+    bitrix_hedge_quantile: float
+    bitrix_hedge_budget: float
+    bitrix_circuit_failures: int
+    bitrix_circuit_cooldown_s: float
+    bitrix_circuit_max_cooldown_s: float
+    bitrix_http_max_connections: int
+    bitrix_http_keepalive_s: float
+    bitrix_upload_max_connections: int
+    bitrix_upload_keepalive_s: float
+    bitrix_warm_connections: int
+    bitrix_warm_upload_connections: int
+    bitrix_heartbeat_interval_s: float
+    bitrix_dns_cache_ttl_s: float
+    bitrix_http2: bool
+    bitrix_retry_max_attempts: int
+    bitrix_retry_base_delay_s: float
+    bitrix_retry_max_delay_s: float
+    bitrix_retry_budget: float
+    bitrix_batch_window_ms: float
+    bitrix_rate_limit_rps: float
+    bitrix_rate_limit_burst: int
+    bitrix_rate_limit_max_retries: int
+    bitrix_operating_limit_s: float
+    bitrix_operating_slowdown_ratio: float
+    bitrix_operating_defer_ratio: float
+    bitrix_singleflight: bool
+    bitrix_capability_probe: bool
+    bitrix_capability_probe_interval_s: float
+    bitrix_capability_probe_uploads: bool
+    created_by_memory_ttl_s: float
     enable_mytasks: bool
+    mytasks_cache_ttl_s: float
+    mytasks_cache_stale_s: float
+    mytasks_cache_max_users: int
+    mytasks_limit: int
+    task_mirror: bool
+    task_mirror_interval_s: float
+    task_mirror_full_sync_s: float
     log_level: str
 
 
@@ -107,9 +165,16 @@ def load_settings() -> Settings:
     task_url_tpl = _getenv("BITRIX_TASK_URL_TEMPLATE")
 
     allowed = _parse_csv_ints(_getenv("ALLOWED_TG_USERS"))
+    admins = _parse_csv_ints(_getenv("ADMIN_TG_USERS"))
 
     upload_dir = _getenv("UPLOAD_DIR", "./uploads")
     usermap_db = _getenv("USERMAP_DB", "./data/users.db")
+    usermap_cache_max = _getenv_int("USERMAP_CACHE_MAX", 10000)
+    usermap_negative_ttl_s = _getenv_float("USERMAP_NEGATIVE_TTL", 60.0)
+    usermap_positive_ttl_s = _getenv_float("USERMAP_POSITIVE_TTL", 600.0)
+    user_directory = _getenv_bool("USER_DIRECTORY", True)
+    user_directory_refresh_s = _getenv_float("USER_DIRECTORY_REFRESH", 900.0)
+    user_directory_full_sync_s = _getenv_float("USER_DIRECTORY_FULL_SYNC", 86400.0)
     bitrix_http_timeout = _getenv_float("BITRIX_HTTP_TIMEOUT", 20.0) or 20.0
     bitrix_upload_timeout = _getenv_float("BITRIX_UPLOAD_TIMEOUT", 90.0) or 90.0
     bitrix_upload_url_timeout = _getenv_float("BITRIX_UPLOAD_URL_TIMEOUT", 25.0) or 25.0
@@ -117,11 +182,144 @@ def load_settings() -> Settings:
     bitrix_small_upload_final_timeout = _getenv_float("BITRIX_SMALL_UPLOAD_FINAL_TIMEOUT", 5.0) or 5.0
     bitrix_upload_max_attempts = _getenv_int("BITRIX_UPLOAD_MAX_ATTEMPTS", 4) or 4
     bitrix_upload_parallelism = _getenv_int("BITRIX_UPLOAD_PARALLELISM", 2) or 2
+    bitrix_upload_global_parallelism = _getenv_int("BITRIX_UPLOAD_GLOBAL_PARALLELISM", 4) or 4
+    bitrix_eager_uploads = _getenv_bool("BITRIX_EAGER_UPLOADS", True)
+    bitrix_upload_passthrough = _getenv_bool("BITRIX_UPLOAD_PASSTHROUGH", False)
+    bitrix_upload_passthrough_buffer = _getenv_int("BITRIX_UPLOAD_PASSTHROUGH_BUFFER", 8) or 8
+    bitrix_upload_dedup = _getenv_bool("BITRIX_UPLOAD_DEDUP", True)
+    bitrix_upload_dedup_verify_s = _getenv_float("BITRIX_UPLOAD_DEDUP_VERIFY", 3600.0)
+    bitrix_upload_dedup_ttl_s = _getenv_float("BITRIX_UPLOAD_DEDUP_TTL", 30 * 24 * 3600.0)
+    bitrix_upload_strategy_explore = _getenv_float("BITRIX_UPLOAD_STRATEGY_EXPLORE", 0.05)
+    bitrix_adaptive_timeouts = _getenv_bool("BITRIX_ADAPTIVE_TIMEOUTS", True)
+    bitrix_timeout_quantile = _getenv_float("BITRIX_TIMEOUT_QUANTILE", 0.99)
+    bitrix_timeout_safety = _getenv_float("BITRIX_TIMEOUT_SAFETY", 3.0)
+    bitrix_timeout_floor_s = _getenv_float("BITRIX_TIMEOUT_FLOOR", 2.0)
+    bitrix_timeout_min_samples = _getenv_int("BITRIX_TIMEOUT_MIN_SAMPLES", 20) or 20
+    bitrix_hedging = _getenv_bool("BITRIX_HEDGING", False)
+    bitrix_hedge_quantile = _getenv_float("BITRIX_HEDGE_QUANTILE", 0.95)
+    bitrix_hedge_budget = _getenv_float("BITRIX_HEDGE_BUDGET", 0.1)
+    bitrix_circuit_failures = _getenv_int("BITRIX_CIRCUIT_FAILURES", 5)
+    bitrix_circuit_cooldown_s = _getenv_float("BITRIX_CIRCUIT_COOLDOWN", 30.0)
+    bitrix_circuit_max_cooldown_s = _getenv_float("BITRIX_CIRCUIT_MAX_COOLDOWN", 300.0)
+    bitrix_http_max_connections = _getenv_int("BITRIX_HTTP_MAX_CONNECTIONS", 20) or 20
+    bitrix_http_keepalive_s = _getenv_float("BITRIX_HTTP_KEEPALIVE", 30.0)
+    bitrix_upload_max_connections = _getenv_int("BITRIX_UPLOAD_MAX_CONNECTIONS", 8) or 8
+    bitrix_upload_keepalive_s = _getenv_float("BITRIX_UPLOAD_KEEPALIVE", 10.0)
+    bitrix_warm_connections = _getenv_int("BITRIX_WARM_CONNECTIONS", 2)
+    bitrix_warm_upload_connections = _getenv_int("BITRIX_WARM_UPLOAD_CONNECTIONS", 1)
+    bitrix_heartbeat_interval_s = _getenv_float("BITRIX_HEARTBEAT_INTERVAL", 0.0) or 0.0
+    bitrix_dns_cache_ttl_s = _getenv_float("BITRIX_DNS_CACHE_TTL", 300.0)
+    bitrix_http2 = _getenv_bool("BITRIX_HTTP2", False)
+    bitrix_retry_max_attempts = _getenv_int("BITRIX_RETRY_MAX_ATTEMPTS", 3) or 3
+    bitrix_retry_base_delay_s = _getenv_float("BITRIX_RETRY_BASE_DELAY", 0.5)
+    bitrix_retry_max_delay_s = _getenv_float("BITRIX_RETRY_MAX_DELAY", 10.0)
+    bitrix_retry_budget = _getenv_float("BITRIX_RETRY_BUDGET", 0.1)
+    bitrix_batch_window_ms = _getenv_float("BITRIX_BATCH_WINDOW_MS", 0.0) or 0.0
+    bitrix_rate_limit_rps = _getenv_float("BITRIX_RATE_LIMIT_RPS", 2.0)
+    bitrix_rate_limit_burst = _getenv_int("BITRIX_RATE_LIMIT_BURST", 50) or 50
+    bitrix_rate_limit_max_retries = _getenv_int("BITRIX_RATE_LIMIT_MAX_RETRIES", 3)
+    bitrix_operating_limit_s = _getenv_float("BITRIX_OPERATING_LIMIT_S", 480.0)
+    bitrix_operating_slowdown_ratio = _getenv_float("BITRIX_OPERATING_SLOWDOWN_RATIO", 0.5)
+    bitrix_operating_defer_ratio = _getenv_float("BITRIX_OPERATING_DEFER_RATIO", 0.8)
+    bitrix_singleflight = _getenv_bool("BITRIX_SINGLEFLIGHT", True)
+    bitrix_capability_probe = _getenv_bool("BITRIX_CAPABILITY_PROBE", True)
+    bitrix_capability_probe_interval_s = _getenv_float("BITRIX_CAPABILITY_PROBE_INTERVAL", 0.0) or 0.0
+    bitrix_capability_probe_uploads = _getenv_bool("BITRIX_CAPABILITY_PROBE_UPLOADS", False)
+    created_by_memory_ttl_s = _getenv_float("CREATED_BY_MEMORY_TTL", 7 * 24 * 3600.0)
     enable_mytasks = _getenv_bool("ENABLE_MYTASKS", True)
+    mytasks_cache_ttl_s = _getenv_float("MYTASKS_CACHE_TTL", 60.0)
+    mytasks_cache_stale_s = _getenv_float("MYTASKS_CACHE_STALE", 120.0)
+    mytasks_cache_max_users = _getenv_int("MYTASKS_CACHE_MAX_USERS", 1000) or 1000
+    mytasks_limit = _getenv_int("MYTASKS_LIMIT", 10)
+    task_mirror = _getenv_bool("TASK_MIRROR", True)
+    task_mirror_interval_s = _getenv_float("TASK_MIRROR_INTERVAL", 60.0)
+    task_mirror_full_sync_s = _getenv_float("TASK_MIRROR_FULL_SYNC", 1800.0)
+    if usermap_cache_max < 0:
+        usermap_cache_max = 0
+    if usermap_negative_ttl_s < 0:
+        usermap_negative_ttl_s = 0.0
+    if usermap_positive_ttl_s < 0:
+        usermap_positive_ttl_s = 0.0
+    if user_directory_refresh_s < 0:
+        user_directory_refresh_s = 0.0
+    if user_directory_full_sync_s < 0:
+        user_directory_full_sync_s = 0.0
     if bitrix_upload_max_attempts < 1:
         bitrix_upload_max_attempts = 1
     if bitrix_upload_parallelism < 1:
         bitrix_upload_parallelism = 1
+    if bitrix_upload_global_parallelism < 1:
+        bitrix_upload_global_parallelism = 1
+    if bitrix_upload_passthrough_buffer < 1:
+        bitrix_upload_passthrough_buffer = 1
+    if bitrix_upload_dedup_verify_s < 0:
+        bitrix_upload_dedup_verify_s = 0.0
+    if bitrix_upload_dedup_ttl_s <= 0:
+        bitrix_upload_dedup = False
+    bitrix_upload_strategy_explore = min(max(bitrix_upload_strategy_explore, 0.0), 1.0)
+    bitrix_timeout_quantile = min(max(bitrix_timeout_quantile, 0.5), 1.0)
+    if bitrix_timeout_safety < 1.0:
+        bitrix_timeout_safety = 1.0
+    if bitrix_timeout_floor_s <= 0:
+        bitrix_timeout_floor_s = 0.1
+    if bitrix_timeout_min_samples < 1:
+        bitrix_timeout_min_samples = 1
+    bitrix_hedge_quantile = min(max(bitrix_hedge_quantile, 0.5), 0.999)
+    if bitrix_hedge_budget <= 0:
+        bitrix_hedging = False
+    if bitrix_circuit_failures < 0:
+        bitrix_circuit_failures = 0
+    if bitrix_circuit_cooldown_s < 1:
+        bitrix_circuit_cooldown_s = 1.0
+    if bitrix_circuit_max_cooldown_s < bitrix_circuit_cooldown_s:
+        bitrix_circuit_max_cooldown_s = bitrix_circuit_cooldown_s
+    if bitrix_http_max_connections < 1:
+        bitrix_http_max_connections = 1
+    if bitrix_http_keepalive_s < 0:
+        bitrix_http_keepalive_s = 0.0
+    # Hedged duplicates need room beyond the scheduler's global cap.
+    if bitrix_upload_max_connections < bitrix_upload_global_parallelism:
+        bitrix_upload_max_connections = bitrix_upload_global_parallelism
+    if bitrix_upload_keepalive_s < 0:
+        bitrix_upload_keepalive_s = 0.0
+    bitrix_warm_connections = min(max(bitrix_warm_connections, 0), bitrix_http_max_connections)
+    bitrix_warm_upload_connections = min(max(bitrix_warm_upload_connections, 0), bitrix_upload_max_connections)
+    if bitrix_heartbeat_interval_s < 0:
+        bitrix_heartbeat_interval_s = 0.0
+    if bitrix_dns_cache_ttl_s < 0:
+        bitrix_dns_cache_ttl_s = 0.0
+    if bitrix_retry_max_attempts < 1:
+        bitrix_retry_max_attempts = 1
+    if bitrix_retry_base_delay_s < 0:
+        bitrix_retry_base_delay_s = 0.0
+    if bitrix_retry_max_delay_s < bitrix_retry_base_delay_s:
+        bitrix_retry_max_delay_s = bitrix_retry_base_delay_s
+    if bitrix_retry_budget < 0:
+        bitrix_retry_budget = 0.0
+    if bitrix_batch_window_ms < 0:
+        bitrix_batch_window_ms = 0.0
+    if bitrix_rate_limit_rps < 0:
+        bitrix_rate_limit_rps = 0.0
+    if bitrix_rate_limit_burst < 1:
+        bitrix_rate_limit_burst = 1
+    if bitrix_rate_limit_max_retries < 0:
+        bitrix_rate_limit_max_retries = 0
+    if bitrix_operating_limit_s < 0:
+        bitrix_operating_limit_s = 0.0
+    bitrix_operating_slowdown_ratio = min(max(bitrix_operating_slowdown_ratio, 0.0), 1.0)
+    bitrix_operating_defer_ratio = min(max(bitrix_operating_defer_ratio, bitrix_operating_slowdown_ratio), 1.0)
+    if mytasks_cache_ttl_s < 0:
+        mytasks_cache_ttl_s = 0.0
+    if mytasks_cache_stale_s < 0:
+        mytasks_cache_stale_s = 0.0
+    if mytasks_cache_max_users < 1:
+        mytasks_cache_max_users = 1
+    # One Telegram message fits about 20 rendered tasks.
+    mytasks_limit = min(max(mytasks_limit, 1), 20)
+    if task_mirror_interval_s <= 0:
+        task_mirror = False
+    if task_mirror_full_sync_s < task_mirror_interval_s:
+        task_mirror_full_sync_s = task_mirror_interval_s
     log_level = _getenv("LOG_LEVEL", "INFO").upper()
 
     return Settings(
@@ -134,8 +332,15 @@ def load_settings() -> Settings:
         bitrix_portal_base=portal_base,
         bitrix_task_url_template=task_url_tpl,
         allowed_tg_users=allowed,
+        admin_tg_users=admins,
         upload_dir=upload_dir,
         usermap_db=usermap_db,
+        usermap_cache_max=usermap_cache_max,
+        usermap_negative_ttl_s=usermap_negative_ttl_s,
+        usermap_positive_ttl_s=usermap_positive_ttl_s,
+        user_directory=user_directory,
+        user_directory_refresh_s=user_directory_refresh_s,
+        user_directory_full_sync_s=user_directory_full_sync_s,
         bitrix_http_timeout=bitrix_http_timeout,
         bitrix_upload_timeout=bitrix_upload_timeout,
         bitrix_upload_url_timeout=bitrix_upload_url_timeout,
@@ -143,6 +348,57 @@ def load_settings() -> Settings:
         bitrix_small_upload_final_timeout=bitrix_small_upload_final_timeout,
         bitrix_upload_max_attempts=bitrix_upload_max_attempts,
         bitrix_upload_parallelism=bitrix_upload_parallelism,
+        bitrix_upload_global_parallelism=bitrix_upload_global_parallelism,
+        bitrix_eager_uploads=bitrix_eager_uploads,
+        bitrix_upload_passthrough=bitrix_upload_passthrough,
+        bitrix_upload_passthrough_buffer=bitrix_upload_passthrough_buffer,
+        bitrix_upload_dedup=bitrix_upload_dedup,
+        bitrix_upload_dedup_verify_s=bitrix_upload_dedup_verify_s,
+        bitrix_upload_dedup_ttl_s=bitrix_upload_dedup_ttl_s,
+        bitrix_upload_strategy_explore=bitrix_upload_strategy_explore,
+        bitrix_adaptive_timeouts=bitrix_adaptive_timeouts,
+        bitrix_timeout_quantile=bitrix_timeout_quantile,
+        bitrix_timeout_safety=bitrix_timeout_safety,
+        bitrix_timeout_floor_s=bitrix_timeout_floor_s,
+        bitrix_timeout_min_samples=bitrix_timeout_min_samples,
+        bitrix_hedging=bitrix_hedging,
+        bitrix_hedge_quantile=bitrix_hedge_quantile,
+        bitrix_hedge_budget=bitrix_hedge_budget,
+        bitrix_circuit_failures=bitrix_circuit_failures,
+        bitrix_circuit_cooldown_s=bitrix_circuit_cooldown_s,
+        bitrix_circuit_max_cooldown_s=bitrix_circuit_max_cooldown_s,
+        bitrix_http_max_connections=bitrix_http_max_connections,
+        bitrix_http_keepalive_s=bitrix_http_keepalive_s,
+        bitrix_upload_max_connections=bitrix_upload_max_connections,
+        bitrix_upload_keepalive_s=bitrix_upload_keepalive_s,
+        bitrix_warm_connections=bitrix_warm_connections,
+        bitrix_warm_upload_connections=bitrix_warm_upload_connections,
+        bitrix_heartbeat_interval_s=bitrix_heartbeat_interval_s,
+        bitrix_dns_cache_ttl_s=bitrix_dns_cache_ttl_s,
+        bitrix_http2=bitrix_http2,
+        bitrix_retry_max_attempts=bitrix_retry_max_attempts,
+        bitrix_retry_base_delay_s=bitrix_retry_base_delay_s,
+        bitrix_retry_max_delay_s=bitrix_retry_max_delay_s,
+        bitrix_retry_budget=bitrix_retry_budget,
+        bitrix_batch_window_ms=bitrix_batch_window_ms,
+        bitrix_rate_limit_rps=bitrix_rate_limit_rps,
+        bitrix_rate_limit_burst=bitrix_rate_limit_burst,
+        bitrix_rate_limit_max_retries=bitrix_rate_limit_max_retries,
+        bitrix_operating_limit_s=bitrix_operating_limit_s,
+        bitrix_operating_slowdown_ratio=bitrix_operating_slowdown_ratio,
+        bitrix_operating_defer_ratio=bitrix_operating_defer_ratio,
+        bitrix_singleflight=bitrix_singleflight,
+        bitrix_capability_probe=bitrix_capability_probe,
+        bitrix_capability_probe_interval_s=max(0.0, bitrix_capability_probe_interval_s),
+        bitrix_capability_probe_uploads=bitrix_capability_probe_uploads,
+        created_by_memory_ttl_s=max(0.0, created_by_memory_ttl_s),
         enable_mytasks=enable_mytasks,
+        mytasks_cache_ttl_s=mytasks_cache_ttl_s,
+        mytasks_cache_stale_s=mytasks_cache_stale_s,
+        mytasks_cache_max_users=mytasks_cache_max_users,
+        mytasks_limit=mytasks_limit,
+        task_mirror=task_mirror,
+        task_mirror_interval_s=task_mirror_interval_s,
+        task_mirror_full_sync_s=task_mirror_full_sync_s,
         log_level=log_level,
     )
@@ -5,45 +5,83 @@ from typing import Optional
 
 log = logging.getLogger(__name__)
 
-def get_linked_bitrix_id(context, tg_id: int) -> Optional[int]:
-    """
-    Single source of truth: читаем из sqlite через UserMap.
-    Допускаем мягкий memory-cache в context.user_data["bitrix_user_id"].
-    """
-    try:
-        # cache (не обязателен)
-        ud = getattr(context, "user_data", None)
-        if isinstance(ud, dict):
-            cached = ud.get("bitrix_user_id")
-            if isinstance(cached, int) and cached > 0:
-                return cached
-    except Exception:
-        pass
+def _cached_bitrix_id(context) -> Optional[int]:
+    ud = getattr(context, "user_data", None)
+    if isinstance(ud, dict):
+        cached = ud.get("bitrix_user_id")
+        if isinstance(cached, int) and cached > 0:
+            return cached
+    return None
+
+
+def _cache_bitrix_id(context, bitrix_user_id: int) -> None:
+    ud = getattr(context, "user_data", None)
+    if isinstance(ud, dict):
+        ud["bitrix_user_id"] = int(bitrix_user_id)
+
 
+async def aget_linked_bitrix_id(context, tg_id: int, use_cache: bool = True) -> Optional[int]:
+    """Bitrix ID, привязанный к tg_id; sqlite читается в потоке UserMap, а не в event loop."""
+    if use_cache:
+        cached = _cached_bitrix_id(context)
+        if cached is not None:
+            return cached
     try:
         usermap = context.application.bot_data.get("usermap")
         if not usermap:
             return None
-        bid = usermap.get(int(tg_id))
+        bid = await usermap.aget(int(tg_id))
         if bid:
-            try:
-                if isinstance(getattr(context, "user_data", None), dict):
-                    context.user_data["bitrix_user_id"] = int(bid)
-            except Exception:
-                pass
+            _cache_bitrix_id(context, bid)
             return int(bid)
         return None
     except Exception:
-        log.exception("get_linked_bitrix_id failed tg_id=%s", tg_id)
+        log.exception("aget_linked_bitrix_id failed tg_id=%s", tg_id)
         return None
 
 
-def set_linked_bitrix_id(context, tg_id: int, bitrix_user_id: int) -> None:
-    """Запись только в sqlite (UserMap), затем обновляем cache."""
+async def aset_linked_bitrix_id(context, tg_id: int, bitrix_user_id: int) -> None:
     usermap = context.application.bot_data["usermap"]
-    usermap.set(int(tg_id), int(bitrix_user_id))
+    await usermap.aset(int(tg_id), int(bitrix_user_id))
+    _cache_bitrix_id(context, bitrix_user_id)
+
+
+async def aget_created_by_accepted(context, bitrix_user_id: int) -> Optional[bool]:
+    """Принимал ли портал CREATED_BY для этого Bitrix ID (None — неизвестно или запись устарела)."""
+    settings = context.application.bot_data["settings"]
+    if settings.created_by_memory_ttl_s <= 0:
+        return None
     try:
-        if isinstance(getattr(context, "user_data", None), dict):
-            context.user_data["bitrix_user_id"] = int(bitrix_user_id)
+        usermap = context.application.bot_data.get("usermap")
+        if not usermap:
+            return None
+        return await usermap.aget_created_by_accepted(int(bitrix_user_id), settings.created_by_memory_ttl_s)
     except Exception:
-        pass
+        log.exception("aget_created_by_accepted failed bitrix_user_id=%s", bitrix_user_id)
+        return None
+
+
+async def arecord_created_by_accepted(context, bitrix_user_id: int, accepted: bool) -> None:
+    """Запоминаем исход tasks.task.add с CREATED_BY и ведём счётчики."""
+    stats = context.application.bot_data.setdefault(
+        "created_by_stats",
+        {"accepted": 0, "rejected": 0, "skipped_double_submits": 0},
+    )
+    stats["accepted" if accepted else "rejected"] += 1
+    log.info("CREATED_BY %s for bitrix_user_id=%s, created_by_stats=%s",
+             "accepted" if accepted else "rejected", bitrix_user_id, stats)
+    try:
+        usermap = context.application.bot_data.get("usermap")
+        if usermap:
+            await usermap.aset_created_by_accepted(int(bitrix_user_id), bool(accepted))
+    except Exception:
+        log.exception("arecord_created_by_accepted failed bitrix_user_id=%s", bitrix_user_id)
+
+
+def count_created_by_skip(context) -> None:
+    stats = context.application.bot_data.setdefault(
+        "created_by_stats",
+        {"accepted": 0, "rejected": 0, "skipped_double_submits": 0},
+    )
+    stats["skipped_double_submits"] += 1
+    log.info("CREATED_BY skipped for a known rejection, created_by_stats=%s", stats)
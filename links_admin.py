@@ -0,0 +1,207 @@
+"""Bulk import/export of Telegram <-> Bitrix links.
+
+CLI (uses the same .env as the bot):
+
+    python links_admin.py import users.csv [--no-validate] [--dry-run]
+    python links_admin.py export [links.csv]
+
+The CSV has two columns, `tg_id` and `bitrix_user_id`; a header row, a `;`
+delimiter and extra columns are accepted. The bot exposes the same paths to
+ADMIN_TG_USERS: a CSV document captioned /importlinks, and /exportlinks.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import io
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import BinaryIO, Iterable, Optional, TextIO
+
+from bitrix import BitrixClient
+from userdir import is_active_flag
+from usermap import UserMap
+
+CSV_HEADER = ("tg_id", "bitrix_user_id", "linked_at")
+MAX_REPORTED_ERRORS = 10
+
+
+@dataclass
+class LinkImportReport:
+    rows: int = 0
+    imported: int = 0
+    errors: list[str] = field(default_factory=list)
+    unknown_bitrix_ids: list[int] = field(default_factory=list)
+    inactive_bitrix_ids: list[int] = field(default_factory=list)
+    validated: bool = False
+    dry_run: bool = False
+    elapsed_s: float = 0.0
+
+    def summary(self) -> str:
+        verb = "Проверено (без записи)" if self.dry_run else "Импортировано"
+        lines = [f"{verb}: {self.imported} из {self.rows} строк за {self.elapsed_s:.2f} с."]
+        if not self.validated:
+            lines.append("Bitrix ID не проверялись.")
+        if self.unknown_bitrix_ids:
+            lines.append(f"Нет в Bitrix24: {_preview(self.unknown_bitrix_ids)}")
+        if self.inactive_bitrix_ids:
+            lines.append(f"Уволены/неактивны: {_preview(self.inactive_bitrix_ids)}")
+        if self.errors:
+            lines.append(f"Ошибки в файле ({len(self.errors)}):")
+            lines.extend(self.errors[:MAX_REPORTED_ERRORS])
+            if len(self.errors) > MAX_REPORTED_ERRORS:
+                lines.append("…")
+        return "\n".join(lines)
+
+
+def _preview(ids: list[int]) -> str:
+    shown = ", ".join(str(x) for x in ids[:MAX_REPORTED_ERRORS])
+    return shown + (f" и ещё {len(ids) - MAX_REPORTED_ERRORS}" if len(ids) > MAX_REPORTED_ERRORS else "")
+
+
+def parse_links_csv(lines: Iterable[str], report: LinkImportReport) -> dict[int, int]:
+    """tg_id -> bitrix_user_id; for a repeated tg_id the last row wins."""
+    iterator = iter(lines)
+    first = next(iterator, None)
+    if first is None:
+        return {}
+    delimiter = ";" if first.count(";") > first.count(",") else ","
+    links: dict[int, int] = {}
+    for line_no, row in enumerate(csv.reader(_chain(first, iterator), delimiter=delimiter), start=1):
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            continue
+        if line_no == 1 and cells and not cells[0].lstrip("\ufeff").isdigit():
+            continue  # header
+        report.rows += 1
+        if len(cells) < 2:
+            report.errors.append(f"строка {line_no}: нужно два столбца")
+            continue
+        try:
+            tg_id = int(cells[0].lstrip("\ufeff"))
+            bitrix_user_id = int(cells[1])
+        except ValueError:
+            report.errors.append(f"строка {line_no}: ID должны быть числами")
+            continue
+        if tg_id <= 0 or bitrix_user_id <= 0:
+            report.errors.append(f"строка {line_no}: ID должны быть положительными")
+            continue
+        links[tg_id] = bitrix_user_id
+    return links
+
+
+def _chain(first: str, rest: Iterable[str]) -> Iterable[str]:
+    yield first
+    yield from rest
+
+
+async def import_links(
+    usermap: UserMap,
+    lines: Iterable[str],
+    bitrix: Optional[BitrixClient] = None,
+    dry_run: bool = False,
+) -> LinkImportReport:
+    """Parse, validate against the portal (when a client is given) and write in one transaction."""
+    started = time.perf_counter()
+    report = LinkImportReport(validated=bitrix is not None, dry_run=dry_run)
+    links = parse_links_csv(lines, report)
+    if bitrix is not None and links:
+        users = await bitrix.get_users(links.values())
+        for bitrix_user_id in sorted(set(links.values())):
+            user = users.get(bitrix_user_id)
+            if user is None:
+                report.unknown_bitrix_ids.append(bitrix_user_id)
+            elif not is_active_flag(user.get("ACTIVE", True)):
+                report.inactive_bitrix_ids.append(bitrix_user_id)
+        rejected = set(report.unknown_bitrix_ids) | set(report.inactive_bitrix_ids)
+        links = {tg_id: bid for tg_id, bid in links.items() if bid not in rejected}
+    if dry_run:
+        report.imported = len(links)
+    else:
+        report.imported = await usermap.run(usermap.set_many, links.items())
+    report.elapsed_s = time.perf_counter() - started
+    return report
+
+
+def export_links(usermap: UserMap, out: TextIO) -> int:
+    """Write tg_bitrix_map as CSV in tg_id order without loading it whole; returns the row count."""
+    writer = csv.writer(out)
+    writer.writerow(CSV_HEADER)
+    count = 0
+    for row in usermap.iter_links():
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def export_links_file(usermap: UserMap) -> tuple[BinaryIO, int]:
+    """Export into a spooled temp file (memory up to 1 MB, disk beyond), rewound for sending."""
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    # utf-8-sig so Excel opens the file without mangling Cyrillic.
+    text = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+    count = export_links(usermap, text)
+    text.flush()
+    text.detach()
+    spool.seek(0)
+    return spool, count
+
+
+async def _cli_import(args: argparse.Namespace) -> int:
+    from config import load_settings
+
+    settings = load_settings()
+    usermap = UserMap(settings.usermap_db)
+    usermap.init()
+    bitrix = None
+    if not args.no_validate:
+        bitrix = BitrixClient(settings.bitrix_webhook_base, timeout=settings.bitrix_http_timeout)
+    try:
+        with open(args.path, encoding="utf-8-sig", newline="") as handle:
+            report = await import_links(usermap, handle, bitrix=bitrix, dry_run=args.dry_run)
+    finally:
+        if bitrix is not None:
+            await bitrix.aclose()
+        usermap.close()
+    print(report.summary())
+    return 1 if report.errors or report.unknown_bitrix_ids or report.inactive_bitrix_ids else 0
+
+
+def _cli_export(args: argparse.Namespace) -> int:
+    from config import load_settings
+
+    settings = load_settings()
+    usermap = UserMap(settings.usermap_db)
+    usermap.init()
+    try:
+        if args.path in (None, "-"):
+            count = export_links(usermap, sys.stdout)
+        else:
+            with open(args.path, "w", encoding="utf-8-sig", newline="") as handle:
+                count = export_links(usermap, handle)
+    finally:
+        usermap.close()
+    print(f"Exported {count} links", file=sys.stderr)
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import/export Telegram <-> Bitrix24 links")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_cmd = commands.add_parser("import", help="upsert links from a CSV file")
+    import_cmd.add_argument("path")
+    import_cmd.add_argument("--no-validate", action="store_true", help="skip the user.get check")
+    import_cmd.add_argument("--dry-run", action="store_true", help="parse and validate only")
+    export_cmd = commands.add_parser("export", help="write all links as CSV")
+    export_cmd.add_argument("path", nargs="?", help="output file, stdout by default")
+    args = parser.parse_args(argv)
+    if args.command == "import":
+        return asyncio.run(_cli_import(args))
+    return _cli_export(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
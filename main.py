@@ -1,25 +1,33 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import re
+from typing import Awaitable
 
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 
-from bitrix import BitrixClient
+from bitrix import BitrixClient, RetryPolicy, encode_capability
 from bot_handlers import (
     BTN_MY_TASKS,
     BTN_HELP,
     build_conversation_handler,
     build_link_conversation_handler,
     cmd_cancel,
+    cmd_exportlinks,
     cmd_me,
     cmd_mytasks,
     cmd_start,
     hydrate_link,
     maybe_show_menu,
     menu_router,
+    on_links_csv,
 )
 from config import load_settings
+from taskcache import TaskListCache
+from taskmirror import TaskMirror
+from uploadqueue import UploadScheduler
+from userdir import UserDirectory
 from usermap import UserMap
 from utils import ensure_dir
 
@@ -31,6 +39,106 @@ def setup_logging(level: str) -> None:
     )
 
 
+def start_background(app: Application, name: str, coro: Awaitable[None]) -> None:
+    tasks: dict[str, asyncio.Task] = app.bot_data.setdefault("background_tasks", {})
+    tasks[name] = asyncio.get_running_loop().create_task(coro, name=name)
+
+
+async def probe_bitrix_capabilities(app: Application) -> None:
+    settings = app.bot_data["settings"]
+    bitrix: BitrixClient = app.bot_data["bitrix"]
+    folder_id = settings.bitrix_disk_folder_id if settings.bitrix_capability_probe_uploads else None
+    try:
+        found = await bitrix.probe_capabilities(upload_folder_id=folder_id)
+        logging.getLogger(__name__).info("Bitrix capabilities probed: %s", found)
+    except Exception:
+        logging.getLogger(__name__).exception("Bitrix capability probe failed")
+
+
+async def capability_probe_loop(app: Application, interval_s: float) -> None:
+    while True:
+        await asyncio.sleep(interval_s)
+        await probe_bitrix_capabilities(app)
+
+
+async def refresh_user_directory(app: Application) -> None:
+    directory: UserDirectory = app.bot_data["user_directory"]
+    try:
+        changed = await directory.refresh(app.bot_data["bitrix"], app.bot_data["usermap"])
+        logging.getLogger(__name__).info("User directory refreshed: %s changed, %s", changed, directory.stats())
+    except Exception:
+        logging.getLogger(__name__).exception("User directory refresh failed")
+
+
+async def user_directory_loop(app: Application, interval_s: float) -> None:
+    while True:
+        await refresh_user_directory(app)
+        await asyncio.sleep(interval_s)
+
+
+async def task_mirror_loop(app: Application, interval_s: float) -> None:
+    mirror: TaskMirror = app.bot_data["task_mirror"]
+    while True:
+        try:
+            changed = await mirror.sync(app.bot_data["bitrix"], app.bot_data["usermap"])
+            logging.getLogger(__name__).debug("Task mirror synced: %s changed, %s", changed, mirror.stats())
+        except Exception:
+            logging.getLogger(__name__).exception("Task mirror sync failed")
+        await mirror.wait(interval_s)
+
+
+async def warm_bitrix_connections(app: Application) -> None:
+    settings = app.bot_data["settings"]
+    bitrix: BitrixClient = app.bot_data["bitrix"]
+    try:
+        await bitrix.warm_up(settings.bitrix_warm_connections, settings.bitrix_warm_upload_connections)
+    except Exception:
+        logging.getLogger(__name__).exception("Bitrix connection warm-up failed")
+
+
+async def post_init(app: Application) -> None:
+    settings = app.bot_data["settings"]
+    bitrix: BitrixClient = app.bot_data["bitrix"]
+    if settings.bitrix_warm_connections or settings.bitrix_warm_upload_connections:
+        await warm_bitrix_connections(app)
+    if settings.bitrix_heartbeat_interval_s > 0:
+        start_background(
+            app,
+            "bitrix_heartbeat",
+            bitrix.heartbeat(
+                settings.bitrix_heartbeat_interval_s,
+                settings.bitrix_warm_connections,
+                settings.bitrix_warm_upload_connections,
+            ),
+        )
+    if "user_directory" in app.bot_data:
+        if settings.user_directory_refresh_s > 0:
+            start_background(app, "user_directory", user_directory_loop(app, settings.user_directory_refresh_s))
+        else:
+            start_background(app, "user_directory", refresh_user_directory(app))
+    if "task_mirror" in app.bot_data:
+        start_background(app, "task_mirror", task_mirror_loop(app, settings.task_mirror_interval_s))
+    if settings.bitrix_capability_probe:
+        await probe_bitrix_capabilities(app)
+        if settings.bitrix_capability_probe_interval_s > 0:
+            start_background(
+                app,
+                "capability_probe",
+                capability_probe_loop(app, settings.bitrix_capability_probe_interval_s),
+            )
+
+
+async def post_shutdown(app: Application) -> None:
+    tasks: dict[str, asyncio.Task] = app.bot_data.get("background_tasks", {})
+    for task in tasks.values():
+        task.cancel()
+    await asyncio.gather(*tasks.values(), return_exceptions=True)
+    bitrix: BitrixClient = app.bot_data["bitrix"]
+    await bitrix.aclose()
+    usermap: UserMap = app.bot_data["usermap"]
+    await asyncio.to_thread(usermap.close)
+
+
 def main() -> None:
     settings = load_settings()
     setup_logging(settings.log_level)
@@ -42,7 +150,13 @@ def main() -> None:
 
     ensure_dir(settings.upload_dir)
 
-    app = Application.builder().token(settings.tg_bot_token).build()
+    app = (
+        Application.builder()
+        .token(settings.tg_bot_token)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     app.bot_data["settings"] = settings
     app.bot_data["bitrix"] = BitrixClient(
@@ -52,12 +166,86 @@ def main() -> None:
         upload_url_timeout=settings.bitrix_upload_url_timeout,
         small_upload_probe_timeout=settings.bitrix_small_upload_probe_timeout,
         small_upload_final_timeout=settings.bitrix_small_upload_final_timeout,
+        batch_window_ms=settings.bitrix_batch_window_ms,
+        rate_limit_rps=settings.bitrix_rate_limit_rps,
+        rate_limit_burst=settings.bitrix_rate_limit_burst,
+        rate_limit_max_retries=settings.bitrix_rate_limit_max_retries,
+        operating_limit_s=settings.bitrix_operating_limit_s,
+        operating_slowdown_ratio=settings.bitrix_operating_slowdown_ratio,
+        operating_defer_ratio=settings.bitrix_operating_defer_ratio,
+        singleflight=settings.bitrix_singleflight,
+        dedup_verify_s=settings.bitrix_upload_dedup_verify_s,
+        dedup_ttl_s=settings.bitrix_upload_dedup_ttl_s,
+        upload_strategy_explore=settings.bitrix_upload_strategy_explore,
+        adaptive_timeouts=settings.bitrix_adaptive_timeouts,
+        timeout_quantile=settings.bitrix_timeout_quantile,
+        timeout_safety=settings.bitrix_timeout_safety,
+        timeout_floor_s=settings.bitrix_timeout_floor_s,
+        timeout_min_samples=settings.bitrix_timeout_min_samples,
+        hedging=settings.bitrix_hedging,
+        hedge_quantile=settings.bitrix_hedge_quantile,
+        hedge_budget_ratio=settings.bitrix_hedge_budget,
+        circuit_failures=settings.bitrix_circuit_failures,
+        circuit_cooldown_s=settings.bitrix_circuit_cooldown_s,
+        circuit_max_cooldown_s=settings.bitrix_circuit_max_cooldown_s,
+        control_max_connections=settings.bitrix_http_max_connections,
+        control_keepalive_s=settings.bitrix_http_keepalive_s,
+        upload_max_connections=settings.bitrix_upload_max_connections,
+        upload_keepalive_s=settings.bitrix_upload_keepalive_s,
+        dns_cache_ttl_s=settings.bitrix_dns_cache_ttl_s,
+        http2=settings.bitrix_http2,
+        retry_policy=RetryPolicy(
+            max_attempts=settings.bitrix_retry_max_attempts,
+            base_delay_s=settings.bitrix_retry_base_delay_s,
+            max_delay_s=settings.bitrix_retry_max_delay_s,
+            budget_ratio=settings.bitrix_retry_budget,
+        ),
     )
 
-    usermap = UserMap(settings.usermap_db)
+    usermap = UserMap(
+        settings.usermap_db,
+        cache_max_entries=settings.usermap_cache_max,
+        negative_ttl_s=settings.usermap_negative_ttl_s,
+        positive_ttl_s=settings.usermap_positive_ttl_s,
+    )
     usermap.init()
+    logging.getLogger(__name__).info("UserMap cache preloaded: %s links", usermap.preload_links())
     app.bot_data["usermap"] = usermap
 
+    # Known portal capabilities apply immediately; post_init re-probes them.
+    bitrix: BitrixClient = app.bot_data["bitrix"]
+    bitrix.load_capabilities(usermap.get_capabilities())
+    # Listener writes fire on the event loop; queue them to the SQLite thread.
+    bitrix.capability_listener = lambda name, value: usermap.submit(
+        usermap.set_capability, name, encode_capability(value)
+    )
+    bitrix.load_strategy_stats(usermap.get_upload_strategy_stats())
+    bitrix.strategy_stats_listener = lambda *row: usermap.submit(usermap.set_upload_strategy_stats, *row)
+    if settings.bitrix_upload_dedup:
+        bitrix.upload_index = usermap
+    app.bot_data["upload_scheduler"] = UploadScheduler(
+        max_concurrency=settings.bitrix_upload_global_parallelism,
+        per_user_limit=settings.bitrix_upload_parallelism,
+    )
+    if settings.user_directory:
+        directory = UserDirectory(full_sync_interval_s=settings.user_directory_full_sync_s)
+        logging.getLogger(__name__).info("User directory loaded: %s users", directory.load(usermap))
+        app.bot_data["user_directory"] = directory
+    app.bot_data["mytasks_cache"] = TaskListCache(
+        ttl_s=settings.mytasks_cache_ttl_s,
+        stale_s=settings.mytasks_cache_stale_s,
+        max_entries=settings.mytasks_cache_max_users,
+    )
+
+    if settings.task_mirror:
+        mirror = TaskMirror(
+            full_sync_interval_s=settings.task_mirror_full_sync_s,
+            # A missed round is tolerated; after two, /mytasks goes live again.
+            max_staleness_s=2 * settings.task_mirror_interval_s + settings.bitrix_http_timeout,
+        )
+        logging.getLogger(__name__).info("Task mirror loaded: %s tasks", mirror.load(usermap))
+        app.bot_data["task_mirror"] = mirror
+
     # Hydrate linked Bitrix profile from sqlite into user_data before checks.
     app.add_handler(MessageHandler(filters.ALL, hydrate_link), group=-1)
 
@@ -65,6 +253,10 @@ def main() -> None:
     app.add_handler(CommandHandler("me", cmd_me))
     app.add_handler(CommandHandler("mytasks", cmd_mytasks))
     app.add_handler(CommandHandler("cancel", cmd_cancel))
+    app.add_handler(CommandHandler("exportlinks", cmd_exportlinks))
+    app.add_handler(
+        MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/importlinks\b"), on_links_csv)
+    )
 
     # Route only helper/menu buttons here. Link/create are handled by conversations.
     app.add_handler(
@@ -1,15 +1,32 @@
 from __future__ import annotations
 
+import asyncio
 import os
 from dataclasses import dataclass
+from typing import AsyncIterator
+
+import httpx
 
 from utils import ensure_dir, safe_filename
 
+STREAM_CHUNK_BYTES = 64 * 1024
+
 
 @dataclass
 class SavedFile:
     original_name: str
     local_path: str
+    # Pass-through attachments are not written to UPLOAD_DIR: local_path is empty
+    # and the bytes are streamed from source_url when the file is uploaded.
+    source_url: str | None = None
+    size_bytes: int | None = None
+    # Telegram file_unique_id; a disk_file_id set on receipt means the file is already on Disk.
+    file_unique_id: str | None = None
+    disk_file_id: int | None = None
+
+    @property
+    def key(self) -> str:
+        return self.local_path or self.source_url or self.file_unique_id or self.original_name
 
 
 def build_upload_dir(base_dir: str, date_str: str, tg_user_id: int, ticket_id: str) -> str:
@@ -21,3 +38,42 @@ def build_upload_dir(base_dir: str, date_str: str, tg_user_id: int, ticket_id: s
 def make_local_path(upload_dir: str, filename: str) -> str:
     filename = safe_filename(filename)
     return os.path.join(upload_dir, filename)
+
+
+async def iter_url_chunks(
+    url: str,
+    max_buffered_chunks: int = 8,
+    chunk_size: int = STREAM_CHUNK_BYTES,
+    timeout: float = 60.0,
+) -> AsyncIterator[bytes]:
+    """Stream a download through a bounded queue.
+
+    The download runs at most `max_buffered_chunks` chunks ahead of the
+    consumer; a slow upload blocks the download instead of growing memory.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_buffered_chunks))
+
+    async def _produce() -> None:
+        try:
+            async with httpx.AsyncClient(timeout=timeout) as client:
+                async with client.stream("GET", url) as response:
+                    if response.status_code >= 400:
+                        # Telegram file URLs embed the bot token: do not let it reach the logs.
+                        raise RuntimeError(f"Attachment download failed: HTTP {response.status_code}")
+                    async for chunk in response.aiter_bytes(chunk_size):
+                        await queue.put(chunk)
+            await queue.put(None)
+        except Exception as exc:
+            await queue.put(exc)
+
+    producer = asyncio.get_running_loop().create_task(_produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass
+class _Entry:
+    tasks: list[dict[str, Any]]
+    fetched_at: float
+
+
+@dataclass
+class TaskListCache:
+    """Bounded LRU+TTL cache of /mytasks lists keyed by Bitrix user ID.
+
+    Entries younger than `ttl_s` are fresh. Entries younger than
+    `ttl_s + stale_s` may still be served while a background refresh runs.
+    """
+
+    ttl_s: float = 60.0
+    stale_s: float = 120.0
+    max_entries: int = 1000
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    _entries: OrderedDict[int, _Entry] = field(default_factory=OrderedDict, repr=False)
+    _refreshing: set[int] = field(default_factory=set, repr=False)
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_s > 0
+
+    def get(self, bitrix_user_id: int) -> tuple[list[dict[str, Any]] | None, bool]:
+        """Return (tasks, is_stale); tasks is None on a miss."""
+        if not self.enabled:
+            return None, False
+        key = int(bitrix_user_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, False
+        age = time.monotonic() - entry.fetched_at
+        if age > self.ttl_s + self.stale_s:
+            del self._entries[key]
+            self.misses += 1
+            return None, False
+        self._entries.move_to_end(key)
+        if age > self.ttl_s:
+            self.stale_hits += 1
+            return list(entry.tasks), True
+        self.hits += 1
+        return list(entry.tasks), False
+
+    def put(self, bitrix_user_id: int, tasks: list[dict[str, Any]]) -> None:
+        if not self.enabled:
+            return
+        key = int(bitrix_user_id)
+        self._entries[key] = _Entry(tasks=list(tasks), fetched_at=time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > max(1, self.max_entries):
+            self._entries.popitem(last=False)
+
+    def invalidate(self, bitrix_user_id: int) -> None:
+        self._entries.pop(int(bitrix_user_id), None)
+
+    def begin_refresh(self, bitrix_user_id: int) -> bool:
+        key = int(bitrix_user_id)
+        if key in self._refreshing:
+            return False
+        self._refreshing.add(key)
+        return True
+
+    def end_refresh(self, bitrix_user_id: int) -> None:
+        self._refreshing.discard(int(bitrix_user_id))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshing": len(self._refreshing),
+        }
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from bitrix import PRIORITY_LOW, TASK_LIST_PAGE_SIZE, BitrixClient
+from usermap import UserMap
+
+WATERMARK_STATE = "task_mirror.watermark"
+FULL_SYNC_STATE = "task_mirror.full_sync_at"
+# Without a CHANGED_DATE seen yet, incremental syncs look back this far from the
+# last full sync, so a clock skew between the bot and the portal loses nothing.
+WATERMARK_SLACK_S = 3600.0
+
+
+def _task_field(task: dict[str, Any], camel: str, upper: str) -> Any:
+    value = task.get(camel)
+    return task.get(upper) if value is None else value
+
+
+def _task_int(task: dict[str, Any], camel: str, upper: str) -> Optional[int]:
+    try:
+        return int(_task_field(task, camel, upper))
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_moment(value: Any) -> Optional[dt.datetime]:
+    # Portals send CHANGED_DATE in their own UTC offset, so strings do not compare; UTC datetimes do.
+    try:
+        moment = dt.datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return moment.astimezone(dt.timezone.utc)
+
+
+@dataclass
+class TaskMirror:
+    """Local copy of the newest tasks created by every linked Bitrix user.
+
+    A full sync fetches the newest page (50 tasks) for each creator, one
+    batched tasks.task.list per creator. Later syncs ask only for tasks whose
+    CHANGED_DATE is at or after the watermark (the newest CHANGED_DATE seen),
+    50 creators per command. Creators linked since the last sync, or marked
+    stale after creating a task, get a full fetch of their own. Tasks deleted on
+    the portal disappear at the next full sync, or earlier when a live fetch
+    for their creator no longer returns them (see `forget_missing`).
+
+    /mytasks is served from memory while the last successful sync is at most
+    `max_staleness_s` old; otherwise callers fall back to a live request.
+    """
+
+    full_sync_interval_s: float = 1800.0
+    max_staleness_s: float = 120.0
+    keep_per_user: int = TASK_LIST_PAGE_SIZE
+    full_syncs: int = 0
+    incremental_syncs: int = 0
+    tasks_changed: int = 0
+    last_sync_at: float = 0.0
+    _watermark: Optional[dt.datetime] = field(default=None, repr=False)
+    _full_sync_at: float = field(default=0.0, repr=False)
+    _by_creator: dict[int, dict[int, dict[str, Any]]] = field(default_factory=dict, repr=False)
+    _creator_of: dict[int, int] = field(default_factory=dict, repr=False)
+    _synced: set[int] = field(default_factory=set, repr=False)
+    _stale: set[int] = field(default_factory=set, repr=False)
+    _wakeup: Optional[asyncio.Event] = field(default=None, repr=False)
+
+    def load(self, usermap: UserMap) -> int:
+        for task_id, created_by, payload in usermap.get_mirrored_tasks():
+            try:
+                task = json.loads(payload)
+            except ValueError:
+                continue
+            self._by_creator.setdefault(created_by, {})[task_id] = task
+            self._creator_of[task_id] = created_by
+        self._synced = set(self._by_creator)
+        self._watermark = _parse_moment(usermap.get_sync_state(WATERMARK_STATE) or "")
+        try:
+            self._full_sync_at = float(usermap.get_sync_state(FULL_SYNC_STATE) or 0.0)
+        except ValueError:
+            self._full_sync_at = 0.0
+        return len(self._creator_of)
+
+    def is_fresh(self) -> bool:
+        return bool(self.last_sync_at) and time.time() - self.last_sync_at <= self.max_staleness_s
+
+    def tasks_for(self, bitrix_user_id: int, limit: int) -> Optional[list[dict[str, Any]]]:
+        """Newest tasks first, or None when the mirror cannot vouch for this user right now."""
+        uid = int(bitrix_user_id)
+        if uid not in self._synced or not self.is_fresh():
+            return None
+        tasks = self._by_creator.get(uid, {})
+        return [tasks[task_id] for task_id in sorted(tasks, reverse=True)[:max(1, limit)]]
+
+    def mark_stale(self, bitrix_user_id: int) -> None:
+        """Serve this user live until the next sync has re-read their newest tasks."""
+        self._synced.discard(int(bitrix_user_id))
+        self._stale.add(int(bitrix_user_id))
+        self.request_sync()
+
+    def request_sync(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait(self, timeout_s: float) -> None:
+        """Sleep until the next scheduled sync or an earlier request_sync()."""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout_s)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def _since(self) -> str:
+        moment = self._watermark
+        if moment is None:
+            moment = dt.datetime.fromtimestamp(self._full_sync_at - WATERMARK_SLACK_S, dt.timezone.utc)
+        return moment.isoformat(timespec="seconds")
+
+    def _put(self, task: dict[str, Any], upserts: dict[int, dict[str, Any]]) -> Optional[int]:
+        task_id = _task_int(task, "id", "ID")
+        created_by = _task_int(task, "createdBy", "CREATED_BY")
+        if task_id is None or created_by is None:
+            return None
+        changed = _parse_moment(_task_field(task, "changedDate", "CHANGED_DATE") or "")
+        if changed is not None and (self._watermark is None or changed > self._watermark):
+            self._watermark = changed
+        previous = self._creator_of.get(task_id)
+        if previous is not None and previous != created_by:
+            self._by_creator.get(previous, {}).pop(task_id, None)
+        tasks = self._by_creator.setdefault(created_by, {})
+        if previous != created_by or tasks.get(task_id) != task:
+            upserts[task_id] = task
+        tasks[task_id] = task
+        self._creator_of[task_id] = created_by
+        return created_by
+
+    def _drop(self, task_id: int, deletes: set[int]) -> None:
+        created_by = self._creator_of.pop(task_id, None)
+        if created_by is not None:
+            self._by_creator.get(created_by, {}).pop(task_id, None)
+        deletes.add(task_id)
+
+    async def forget_missing(self, usermap: UserMap, bitrix_user_id: int, live: list[dict[str, Any]]) -> int:
+        """Drop this creator's mirrored tasks that a live newest-first fetch skipped.
+
+        Only IDs between the oldest and the newest returned task are judged:
+        older ones fell off the page, newer ones may postdate the fetch.
+        """
+        uid = int(bitrix_user_id)
+        live_ids = {task_id for task_id in (_task_int(task, "id", "ID") for task in live) if task_id is not None}
+        if not live_ids:
+            return 0
+        low, high = min(live_ids), max(live_ids)
+        deletes: set[int] = set()
+        for task_id in [task_id for task_id in self._by_creator.get(uid, {}) if low < task_id < high]:
+            if task_id not in live_ids:
+                self._drop(task_id, deletes)
+        if deletes:
+            await usermap.run(usermap.update_mirrored_tasks, [], sorted(deletes))
+            self.tasks_changed += len(deletes)
+        return len(deletes)
+
+    async def sync(self, bitrix: BitrixClient, usermap: UserMap) -> int:
+        """One sync round; returns how many tasks were added, changed or removed."""
+        now = time.time()
+        # Stale marks set from here on arrive after the fetch started and must survive this round.
+        self._stale = set()
+        creators = set(await usermap.run(usermap.get_linked_bitrix_ids))
+        full = not self._full_sync_at or now - self._full_sync_at >= self.full_sync_interval_s
+        incremental = set() if full else self._synced & creators
+        fetched = await bitrix.list_recent_tasks_by_creators(
+            creators if full else creators - incremental,
+            call_priority=PRIORITY_LOW,
+        )
+        changed: list[dict[str, Any]] = []
+        if incremental:
+            changed = await bitrix.list_tasks_changed_since(incremental, self._since(), call_priority=PRIORITY_LOW)
+
+        upserts: dict[int, dict[str, Any]] = {}
+        deletes: set[int] = set()
+        touched: set[int] = set()
+        for uid, tasks in fetched.items():
+            keep = {_task_int(task, "id", "ID") for task in tasks}
+            for task_id in set(self._by_creator.get(uid, {})) - keep:
+                self._drop(task_id, deletes)
+            for task in tasks:
+                self._put(task, upserts)
+            touched.add(uid)
+        for task in changed:
+            uid = self._put(task, upserts)
+            if uid is not None:
+                touched.add(uid)
+        # Unlinked creators and anything beyond the newest page per creator are not served.
+        for uid in [uid for uid in self._by_creator if uid not in creators]:
+            for task_id in list(self._by_creator.pop(uid)):
+                self._creator_of.pop(task_id, None)
+                deletes.add(task_id)
+        for uid in touched & creators:
+            tasks = self._by_creator.get(uid, {})
+            for task_id in sorted(tasks, reverse=True)[self.keep_per_user:]:
+                self._drop(task_id, deletes)
+        deletes = {task_id for task_id in deletes if task_id not in self._creator_of}
+        for task_id in deletes:
+            upserts.pop(task_id, None)
+
+        if upserts or deletes:
+            rows = [
+                (
+                    task_id,
+                    self._creator_of[task_id],
+                    str(_task_field(task, "changedDate", "CHANGED_DATE") or ""),
+                    json.dumps(task, ensure_ascii=False),
+                )
+                for task_id, task in upserts.items()
+            ]
+            await usermap.run(usermap.update_mirrored_tasks, rows, sorted(deletes))
+        if self._watermark is not None:
+            await usermap.run(usermap.set_sync_state, WATERMARK_STATE, self._watermark.isoformat())
+        if full:
+            self._full_sync_at = now
+            self.full_syncs += 1
+            await usermap.run(usermap.set_sync_state, FULL_SYNC_STATE, repr(now))
+        else:
+            self.incremental_syncs += 1
+        self._synced = (set(fetched) | incremental) - self._stale
+        self.last_sync_at = now
+        self.tasks_changed += len(upserts) + len(deletes)
+        return len(upserts) + len(deletes)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "creators": len(self._synced),
+            "tasks": len(self._creator_of),
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "tasks_changed": self.tasks_changed,
+            "watermark": self._watermark.isoformat() if self._watermark is not None else None,
+            "sync_age_s": round(time.time() - self.last_sync_at, 1) if self.last_sync_at else None,
+        }
@@ -0,0 +1,24 @@
+import asyncio
+
+from bitrix import OPERATION_TIME_LIMIT, BitrixClient, BitrixError
+
+
+def test_blocked_command_marks_its_method():
+    client = BitrixClient("https://portal.invalid/rest/1/token/")
+
+    async def fake_request(method, data, timeout=None):
+        return {
+            "result": {
+                "result": {"c0": [{"ID": "1"}]},
+                "result_error": {"c1": {"error": OPERATION_TIME_LIMIT, "error_description": "Method is blocked"}},
+                "result_time": {"c0": {"operating": 1.0}},
+            }
+        }
+
+    client._request = fake_request
+    out = asyncio.run(client.batch([("user.get", {"ID": "1"}), ("tasks.task.list", {})]))
+
+    assert out[0]["result"] == [{"ID": "1"}]
+    assert isinstance(out[1], BitrixError) and out[1].message == OPERATION_TIME_LIMIT
+    assert client._operating.usage("tasks.task.list") == 1.0
+    assert client._operating.usage("user.get") < 1.0
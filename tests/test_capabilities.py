@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from bitrix import CAP_ORDER_CREATED_DATE, CIRCUIT_OPEN, BitrixClient, BitrixError, RetryPolicy
+
+REJECTION = BitrixError("ERROR_CORE", "Invalid order field CREATED_DATE")
+
+
+def _client(error):
+    client = BitrixClient("https://portal.invalid/rest/1/token/", retry_policy=RetryPolicy(base_delay_s=0.0))
+    sent = []
+
+    async def fake_request(method, data, timeout=None):
+        by_created_date = "order[CREATED_DATE]" in dict(data)
+        sent.append("CREATED_DATE" if by_created_date else "ID")
+        if by_created_date and error is not None:
+            raise error
+        return {"result": {"tasks": [{"id": "1", "title": "t"}]}}
+
+    client._request = fake_request
+    return client, sent
+
+
+@pytest.mark.parametrize(
+    "error",
+    [BitrixError("http_error", status_code=503), BitrixError(CIRCUIT_OPEN), BitrixError("INTERNAL_SERVER_ERROR")],
+)
+def test_probe_outage_records_nothing(error):
+    client, _sent = _client(error)
+    found = asyncio.run(client.probe_capabilities())
+    assert CAP_ORDER_CREATED_DATE not in found
+    assert CAP_ORDER_CREATED_DATE not in client.capabilities
+
+
+def test_probe_records_a_rejected_order_field():
+    client, sent = _client(REJECTION)
+    found = asyncio.run(client.probe_capabilities())
+    assert found[CAP_ORDER_CREATED_DATE] is False
+    assert sent == ["CREATED_DATE", "ID"]
+
+
+def test_live_outage_is_raised_without_touching_the_capability():
+    client, _sent = _client(BitrixError("http_error", status_code=502))
+    with pytest.raises(BitrixError):
+        asyncio.run(client.list_tasks_created_by(5))
+    assert CAP_ORDER_CREATED_DATE not in client.capabilities
+
+
+def test_live_rejection_falls_back_to_id_order_and_is_remembered():
+    client, sent = _client(REJECTION)
+    tasks = asyncio.run(client.list_tasks_created_by(5))
+    assert [task["id"] for task in tasks] == ["1"]
+    assert sent == ["CREATED_DATE", "ID"]
+    assert client.capabilities[CAP_ORDER_CREATED_DATE] is False
+    asyncio.run(client.list_tasks_created_by(5))
+    assert sent[-1] == "ID" and len(sent) == 3
@@ -0,0 +1,55 @@
+import pytest
+
+import bitrix
+from bitrix import CIRCUIT_OPEN, BitrixError, _CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(bitrix.time, "monotonic", lambda: now[0])
+    return now
+
+
+def _reject(breaker, key="user.get"):
+    with pytest.raises(BitrixError) as exc_info:
+        breaker.before(key)
+    assert exc_info.value.message == CIRCUIT_OPEN
+
+
+def test_opens_after_threshold_and_lets_one_probe_through(clock):
+    breaker = _CircuitBreaker(failure_threshold=2, cooldown_s=10.0, max_cooldown_s=15.0)
+    breaker.failure("user.get")
+    breaker.before("user.get")
+    breaker.failure("user.get")
+    _reject(breaker)
+    breaker.before("batch")
+
+    clock[0] += 10.0
+    breaker.before("user.get")
+    # Only one probe while it is in flight.
+    _reject(breaker)
+    breaker.failure("user.get")
+    assert breaker.retry_in("user.get") == 15.0
+
+    clock[0] += 15.0
+    breaker.before("user.get")
+    breaker.success("user.get")
+    breaker.before("user.get")
+    assert breaker.open_circuits() == {}
+
+
+def test_released_probe_frees_the_half_open_slot(clock):
+    breaker = _CircuitBreaker(failure_threshold=1, cooldown_s=5.0)
+    breaker.failure("user.get")
+    clock[0] += 5.0
+    breaker.before("user.get")
+    breaker.release("user.get")
+    breaker.before("user.get")
+
+
+def test_zero_threshold_disables_the_breaker(clock):
+    breaker = _CircuitBreaker(failure_threshold=0)
+    for _ in range(10):
+        breaker.failure("user.get")
+    breaker.before("user.get")
@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+
+from bitrix import RetryPolicy
+from bot_handlers import _upload_one_to_bitrix_disk
+from storage import SavedFile
+
+
+class FakeBitrix:
+    upload_index = None
+
+    def __init__(self, outcomes, landed=None):
+        self.retry_policy = RetryPolicy(base_delay_s=0.0)
+        self.outcomes = list(outcomes)
+        self.landed = landed
+        self.uploads = 0
+        self.lookups = 0
+
+    async def find_uploaded(self, folder_id, content_keys):
+        return None
+
+    async def upload_to_folder(self, **kwargs):
+        self.uploads += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def find_landed_upload(self, folder_id, name, size_bytes, since, content_keys=None):
+        self.lookups += 1
+        if isinstance(self.landed, Exception):
+            raise self.landed
+        return self.landed
+
+
+def _timeout():
+    return httpx.ReadTimeout("slow", request=httpx.Request("POST", "https://portal.invalid/"))
+
+
+def _saved_file(tmp_path, size=10):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"x" * size)
+    return SavedFile(original_name="a.txt", local_path=str(path))
+
+
+def test_timed_out_upload_that_landed_is_not_sent_again(tmp_path):
+    bitrix = FakeBitrix([_timeout(), 55], landed=42)
+    result = asyncio.run(_upload_one_to_bitrix_disk(bitrix, 7, _saved_file(tmp_path), 3))
+    assert result == (42, None)
+    assert bitrix.uploads == 1
+
+
+def test_timed_out_upload_is_retried_once_the_folder_shows_it_missing(tmp_path):
+    bitrix = FakeBitrix([_timeout(), 55], landed=None)
+    result = asyncio.run(_upload_one_to_bitrix_disk(bitrix, 7, _saved_file(tmp_path), 3))
+    assert result == (55, None)
+    assert bitrix.uploads == 2
+
+
+def test_timed_out_upload_is_not_retried_when_the_folder_cannot_be_checked(tmp_path):
+    bitrix = FakeBitrix([_timeout(), 55], landed=RuntimeError("portal down"))
+    result = asyncio.run(_upload_one_to_bitrix_disk(bitrix, 7, _saved_file(tmp_path), 3))
+    assert result == (None, "a.txt")
+    assert bitrix.uploads == 1
+
+
+def test_landed_upload_matches_name_size_and_creation_time():
+    import datetime as dt
+    import time
+
+    from bitrix import BitrixClient
+
+    now = time.time()
+    stamp = dt.datetime.fromtimestamp(now).astimezone().isoformat(timespec="seconds")
+    old = dt.datetime.fromtimestamp(now - 3600).astimezone().isoformat(timespec="seconds")
+    children = [
+        {"ID": "1", "NAME": "a.txt", "SIZE": "11", "CREATE_TIME": stamp},
+        {"ID": "2", "NAME": "a.txt", "SIZE": "10", "CREATE_TIME": old},
+        {"ID": "3", "NAME": "b (1).txt", "SIZE": "10", "CREATE_TIME": stamp},
+        {"ID": "4", "NAME": "a (2).txt", "SIZE": "10", "CREATE_TIME": stamp},
+    ]
+    client = BitrixClient("https://portal.invalid/rest/1/token/")
+
+    async def fake_call(method, data, **kwargs):
+        assert method == "disk.folder.getchildren"
+        return {"result": children}
+
+    client.call = fake_call
+    assert asyncio.run(client.find_landed_upload(7, "a.txt", 10, now)) == 4
+    assert client._upload_holders == {4: 1}
@@ -0,0 +1,44 @@
+import asyncio
+import socket
+
+import httpx
+import pytest
+
+from bitrix import _DnsCache, _DnsCachingTransport
+
+
+async def _serve(reader, writer):
+    await reader.readuntil(b"\r\n\r\n")
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok")
+    await writer.drain()
+    writer.close()
+
+
+def test_connections_reuse_cached_addresses():
+    async def scenario():
+        server = await asyncio.start_server(_serve, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        cache = _DnsCache(ttl_s=60.0)
+        transport = _DnsCachingTransport(cache, httpx.Limits(max_connections=2), http2=False)
+        async with server, httpx.AsyncClient(transport=transport) as client:
+            for _ in range(2):
+                response = await client.get(f"http://localhost:{port}/")
+                assert response.text == "ok"
+        return cache.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert (snapshot["misses"], snapshot["hits"]) == (1, 1)
+
+
+def test_connect_failure_surfaces_as_httpx_error():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+
+    async def scenario():
+        transport = _DnsCachingTransport(_DnsCache(ttl_s=60.0), httpx.Limits(), http2=False)
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.get(f"http://127.0.0.1:{port}/")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(scenario())
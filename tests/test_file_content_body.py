@@ -0,0 +1,30 @@
+import asyncio
+import base64
+import os
+from email.parser import BytesParser
+
+import pytest
+
+from bitrix import file_content_body_length, file_content_body_parts, iter_file_chunks, iter_file_content_body
+
+
+async def _collect(head, path, tail, chunk_size):
+    return b"".join([part async for part in iter_file_content_body(head, iter_file_chunks(path, chunk_size), tail)])
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 4, 1000, 200_003])
+def test_declared_length_matches_body(tmp_path, size):
+    data = os.urandom(size)
+    path = tmp_path / "файл.bin"
+    path.write_bytes(data)
+    head, tail = file_content_body_parts(42, "отчет (1).pdf", "b0undary")
+
+    body = asyncio.run(_collect(head, str(path), tail, chunk_size=1000))
+
+    assert len(body) == file_content_body_length(head, tail, size)
+    message = BytesParser().parsebytes(b"Content-Type: multipart/form-data; boundary=b0undary\r\n\r\n" + body)
+    fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True) for part in message.get_payload()}
+    assert fields["id"] == b"42"
+    assert fields["data[NAME]"].decode("utf-8") == "отчет (1).pdf"
+    assert fields["generateUniqueName"] == b"true"
+    assert base64.b64decode(fields["fileContent[1]"]) == data
@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram.ext import ConversationHandler
+
+from bot_handlers import LINK_CONFIRM, LINK_WAIT, cb_link_confirm, link_receive
+from userdir import BitrixUser, UserDirectory
+
+
+class FakeUsermap:
+    def __init__(self):
+        self.links = {}
+
+    async def aset(self, tg_id, bitrix_user_id):
+        self.links[tg_id] = bitrix_user_id
+
+
+class FakeMessage:
+    def __init__(self, text=""):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, reply_markup=None):
+        self.replies.append((text, reply_markup))
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.message = FakeMessage()
+
+    async def answer(self):
+        pass
+
+
+def _context():
+    directory = UserDirectory()
+    directory.apply([
+        BitrixUser(7, "Иван", "Петров", "ivan.petrov@company.ru", True),
+        BitrixUser(8, "Иван", "Петровский", "i.petrovsky@company.ru", True),
+        BitrixUser(9, "Анна", "Сидорова", "anna@company.ru", True),
+    ])
+    bot_data = {
+        "settings": SimpleNamespace(allowed_tg_users=set()),
+        "user_directory": directory,
+        "usermap": FakeUsermap(),
+    }
+    return SimpleNamespace(application=SimpleNamespace(bot_data=bot_data), user_data={})
+
+
+def _message_update(text):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=100), message=FakeMessage(text))
+
+
+def _callback_update(data):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=100), callback_query=FakeQuery(data))
+
+
+def test_exact_email_links_at_once():
+    context = _context()
+    state = asyncio.run(link_receive(_message_update("Anna@Company.ru"), context))
+    assert state == ConversationHandler.END
+    assert context.application.bot_data["usermap"].links == {100: 9}
+
+
+def test_name_match_waits_for_confirmation():
+    context = _context()
+    update = _message_update("Сидорова")
+    assert asyncio.run(link_receive(update, context)) == LINK_CONFIRM
+    assert context.application.bot_data["usermap"].links == {}
+
+    assert asyncio.run(cb_link_confirm(_callback_update("link_confirm:9"), context)) == ConversationHandler.END
+    assert context.application.bot_data["usermap"].links == {100: 9}
+
+
+def test_stale_confirmation_does_not_link():
+    context = _context()
+    asyncio.run(link_receive(_message_update("Сидорова"), context))
+    assert asyncio.run(cb_link_confirm(_callback_update("link_confirm:7"), context)) == LINK_WAIT
+    assert context.application.bot_data["usermap"].links == {}
+
+
+def test_several_name_matches_are_rejected():
+    context = _context()
+    update = _message_update("Иван")
+    assert asyncio.run(link_receive(update, context)) == LINK_WAIT
+    assert context.application.bot_data["usermap"].links == {}
+    assert "несколько" in update.message.replies[0][0]
@@ -0,0 +1,41 @@
+import asyncio
+import io
+
+from links_admin import LinkImportReport, export_links, import_links, parse_links_csv
+from usermap import UserMap
+
+
+def test_semicolon_file_with_bom_header():
+    report = LinkImportReport()
+    lines = ["﻿tg_id;bitrix_user_id\n", "100;7\n", "\n", "200;8\n", "100;9\n"]
+    assert parse_links_csv(lines, report) == {100: 9, 200: 8}
+    assert report.rows == 3 and report.errors == []
+
+
+def test_bad_rows_are_reported_by_line():
+    report = LinkImportReport()
+    lines = ["100,7", "200", "abc,8", "300,-1", "400,9"]
+    assert parse_links_csv(lines, report) == {100: 7, 400: 9}
+    assert report.rows == 5
+    assert [error.split(":")[0] for error in report.errors] == ["строка 2", "строка 3", "строка 4"]
+
+
+def test_empty_input():
+    assert parse_links_csv([], LinkImportReport()) == {}
+
+
+class FakeBitrix:
+    async def get_users(self, ids):
+        return {7: {"ID": "7", "ACTIVE": True}, 8: {"ID": "8", "ACTIVE": False}}
+
+
+def test_import_skips_unknown_and_inactive_then_exports(tmp_path):
+    usermap = UserMap(str(tmp_path / "users.db"))
+    usermap.init()
+    report = asyncio.run(import_links(usermap, ["100;7", "200;8", "300;9"], bitrix=FakeBitrix()))
+    assert report.imported == 1
+    assert (report.inactive_bitrix_ids, report.unknown_bitrix_ids) == ([8], [9])
+
+    out = io.StringIO()
+    assert export_links(usermap, out) == 1
+    assert out.getvalue().splitlines()[1].startswith("100,7,")
@@ -0,0 +1,66 @@
+import httpx
+
+from bitrix import CIRCUIT_OPEN, BitrixError, RetryPolicy
+
+
+def _request():
+    return httpx.Request("POST", "https://portal.invalid/rest/1/token/tasks.task.add")
+
+
+def test_failures_before_sending_are_retried_for_writes():
+    policy = RetryPolicy()
+    exc = httpx.ConnectError("refused", request=_request())
+    assert policy.classify(exc, idempotent=False) == "connect"
+    assert not policy.outcome_unknown(exc)
+
+
+def test_failures_after_sending_are_retried_only_for_reads():
+    policy = RetryPolicy()
+    for exc in (
+        httpx.ReadTimeout("slow", request=_request()),
+        BitrixError("http_error", status_code=500),
+        BitrixError("http_error", status_code=502),
+        BitrixError("http_error", status_code=504),
+    ):
+        assert policy.classify(exc, idempotent=True) is not None
+        assert policy.classify(exc, idempotent=False) is None
+        assert policy.outcome_unknown(exc)
+
+
+def test_throttling_is_retried_for_any_method():
+    policy = RetryPolicy()
+    for status in (429, 503):
+        assert policy.classify(BitrixError("http_error", status_code=status), idempotent=False) == f"http_{status}"
+
+
+def test_errors_handled_elsewhere_are_not_retried():
+    assert RetryPolicy().classify(BitrixError(CIRCUIT_OPEN), idempotent=True) is None
+
+
+def test_wrapped_strategy_error_is_classified_by_its_cause():
+    policy = RetryPolicy()
+    try:
+        try:
+            raise httpx.ReadTimeout("slow", request=_request())
+        except httpx.ReadTimeout as cause:
+            raise BitrixError("All disk upload strategies failed") from cause
+    except BitrixError as exc:
+        assert policy.outcome_unknown(exc)
+
+
+def test_retry_after_sets_the_minimum_delay():
+    policy = RetryPolicy(base_delay_s=0.01)
+    assert policy.next_delay(BitrixError("http_error", status_code=429, retry_after=3.0), 1) == 3.0
+
+
+def test_retries_stop_when_the_budget_is_spent():
+    policy = RetryPolicy(budget_ratio=0.1)
+    exc = BitrixError("http_error", status_code=503)
+    delays = [policy.next_delay(exc, 1) for _ in range(11)]
+    assert all(delay is not None for delay in delays[:10])
+    assert delays[10] is None
+    assert policy.denied_by_budget == 1
+    # Every request earns a tenth of a retry.
+    for _ in range(11):
+        policy.record_request()
+    assert policy.next_delay(exc, 1) is not None
@@ -0,0 +1,61 @@
+import asyncio
+
+from bitrix import PRIORITY_HIGH, PRIORITY_LOW, BitrixClient
+
+
+def _client():
+    client = BitrixClient("https://portal.invalid/rest/1/token/", singleflight=True)
+    sent = []
+
+    async def fake_dispatch(method, data, timeout, priority):
+        sent.append(priority)
+        await asyncio.sleep(0.01)
+        return {"result": priority}
+
+    client._dispatch = fake_dispatch
+    return client, sent
+
+
+def test_identical_reads_share_one_request():
+    async def scenario():
+        client, sent = _client()
+        results = await asyncio.gather(*(client.call("user.get", [("ID", "1")]) for _ in range(3)))
+        assert sent == [PRIORITY_HIGH]
+        assert client.singleflight_hits == 2
+        assert all(result == {"result": PRIORITY_HIGH} for result in results)
+
+    asyncio.run(scenario())
+
+
+def test_high_priority_call_does_not_join_a_low_priority_flight():
+    async def scenario():
+        client, sent = _client()
+        low, high = await asyncio.gather(
+            client.call("user.get", [("ID", "1")], priority=PRIORITY_LOW),
+            client.call("user.get", [("ID", "1")], priority=PRIORITY_HIGH),
+        )
+        assert sorted(sent) == sorted([PRIORITY_LOW, PRIORITY_HIGH])
+        assert high == {"result": PRIORITY_HIGH}
+
+    asyncio.run(scenario())
+
+
+def test_different_timeouts_do_not_share_a_flight():
+    async def scenario():
+        client, sent = _client()
+        await asyncio.gather(
+            client.call("user.get", [("ID", "1")], timeout=1.0),
+            client.call("user.get", [("ID", "1")], timeout=20.0),
+        )
+        assert len(sent) == 2
+
+    asyncio.run(scenario())
+
+
+def test_writes_are_never_shared():
+    async def scenario():
+        client, sent = _client()
+        await asyncio.gather(*(client.call("tasks.task.add", [("fields[TITLE]", "x")]) for _ in range(2)))
+        assert len(sent) == 2
+
+    asyncio.run(scenario())
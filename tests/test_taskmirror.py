@@ -0,0 +1,59 @@
+import asyncio
+
+from taskmirror import TaskMirror
+from usermap import UserMap
+
+
+class FakeBitrix:
+    def __init__(self, pages, changed=()):
+        self.pages = pages
+        self.changed = list(changed)
+        self.since = []
+
+    async def list_recent_tasks_by_creators(self, creator_ids, call_priority=None):
+        return {uid: self.pages.get(uid, []) for uid in creator_ids}
+
+    async def list_tasks_changed_since(self, creator_ids, since, call_priority=None):
+        self.since.append(since)
+        return self.changed
+
+
+def _task(task_id, changed, created_by=5):
+    return {"id": str(task_id), "createdBy": str(created_by), "changedDate": changed}
+
+
+def _usermap(tmp_path):
+    usermap = UserMap(str(tmp_path / "users.db"))
+    usermap.init()
+    usermap.set(1, 5)
+    return usermap
+
+
+def test_watermark_compares_moments_not_strings(tmp_path):
+    usermap = _usermap(tmp_path)
+    # 12:00+03:00 sorts after 10:30+00:00 as text but is 09:00 UTC.
+    bitrix = FakeBitrix({5: [_task(2, "2026-01-01T12:00:00+03:00"), _task(1, "2026-01-01T10:30:00+00:00")]})
+    mirror = TaskMirror()
+
+    asyncio.run(mirror.sync(bitrix, usermap))
+    assert mirror._since() == "2026-01-01T10:30:00+00:00"
+
+    reloaded = TaskMirror()
+    reloaded.load(usermap)
+    assert reloaded._since() == "2026-01-01T10:30:00+00:00"
+    bitrix.changed = [_task(3, "2026-01-01T13:00:00+03:00")]
+    asyncio.run(reloaded.sync(bitrix, usermap))
+    assert bitrix.since == ["2026-01-01T10:30:00+00:00"]
+    assert reloaded._since() == "2026-01-01T10:30:00+00:00"
+
+
+def test_live_fetch_drops_tasks_deleted_on_the_portal(tmp_path):
+    usermap = _usermap(tmp_path)
+    mirror = TaskMirror()
+    asyncio.run(mirror.sync(FakeBitrix({5: [_task(i, "2026-01-01T10:00:00+00:00") for i in range(10, 15)]}), usermap))
+
+    live = [{"id": "15"}, {"id": "14"}, {"id": "12"}, {"id": "11"}]
+    assert asyncio.run(mirror.forget_missing(usermap, 5, live)) == 1
+
+    assert [int(t["id"]) for t in mirror.tasks_for(5, 10)] == [14, 12, 11, 10]
+    assert sorted(task_id for task_id, _uid, _payload in usermap.get_mirrored_tasks()) == [10, 11, 12, 14]
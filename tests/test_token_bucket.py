@@ -0,0 +1,34 @@
+import asyncio
+
+from bitrix import _TokenBucket
+
+
+def test_burst_passes_then_callers_wait_for_refill():
+    bucket = _TokenBucket(rate=100.0, capacity=2)
+
+    async def scenario():
+        return [await bucket.acquire() for _ in range(3)]
+
+    waits = asyncio.run(scenario())
+    assert waits[0] < 0.005 and waits[1] < 0.005
+    assert waits[2] >= 0.008
+    assert bucket.acquired == 3
+
+
+def test_penalize_halves_rate_down_to_floor_and_reward_recovers():
+    bucket = _TokenBucket(rate=2.0, capacity=2)
+    bucket.penalize()
+    assert bucket.current_rate == 1.0 and bucket.stats()["tokens"] < 0.1
+    for _ in range(10):
+        bucket.penalize()
+    assert bucket.current_rate == bucket.min_rate == 0.25
+    for _ in range(100):
+        bucket.reward()
+    assert bucket.current_rate == 2.0
+
+
+def test_zero_rate_disables_the_bucket():
+    bucket = _TokenBucket(rate=0.0, capacity=2)
+    assert asyncio.run(bucket.acquire()) == 0.0
+    bucket.penalize()
+    assert bucket.limit_hits == 0
@@ -0,0 +1,141 @@
+import asyncio
+import contextlib
+
+from bitrix import DEDUP_KEY_SHA256, BitrixClient
+
+
+class MemoryIndex:
+    def __init__(self):
+        self.entries = {}
+
+    async def afind_disk_upload(self, keys, folder_id, max_age_s):
+        for key in keys:
+            if (key, folder_id) in self.entries:
+                return self.entries[(key, folder_id)], 0.0
+        return None
+
+    async def aremember_disk_upload(self, keys, folder_id, file_id):
+        for key in keys:
+            self.entries[(key, folder_id)] = file_id
+
+    async def aforget_disk_upload(self, file_id):
+        self.entries = {k: v for k, v in self.entries.items() if v != file_id}
+
+
+def _client(upload):
+    client = BitrixClient("https://portal.invalid/rest/1/token/", upload_index=MemoryIndex())
+    deleted = []
+
+    async def fake_delete(file_id):
+        deleted.append(file_id)
+
+    client._upload_with_strategies = upload
+    client.delete_disk_file = fake_delete
+    return client, deleted
+
+
+def _upload(client, slot=None):
+    return client.upload_to_folder(
+        7, "unused", "a.txt", content_keys=[DEDUP_KEY_SHA256 + "abc"], dedup_lookup=False, slot=slot
+    )
+
+
+def test_cancelled_caller_leaves_the_shared_upload_to_the_others():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def upload(*args):
+            await release.wait()
+            return 101
+
+        client, deleted = _client(upload)
+        first = asyncio.create_task(_upload(client))
+        second = asyncio.create_task(_upload(client))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == 101
+        assert client._upload_holders == {101: 1}
+        assert deleted == []
+
+    asyncio.run(scenario())
+
+
+def test_last_cancelled_caller_cancels_the_upload():
+    async def scenario():
+        cancelled = asyncio.Event()
+
+        async def upload(*args):
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return 101
+
+        client, deleted = _client(upload)
+        caller = asyncio.create_task(_upload(client))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1.0)
+        assert not client._upload_inflight
+        assert deleted == []
+
+    asyncio.run(scenario())
+
+
+def test_upload_finishing_after_every_caller_left_is_deleted():
+    async def scenario():
+        async def upload(*args):
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                # The portal already had the file when the cancel arrived.
+                return 101
+            return 0
+
+        client, deleted = _client(upload)
+        caller = asyncio.create_task(_upload(client))
+        await asyncio.sleep(0)
+        caller.cancel()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert deleted == [101]
+        assert client._upload_holders == {}
+
+    asyncio.run(scenario())
+
+
+def test_scheduler_slot_is_held_by_the_upload_not_by_the_callers():
+    async def scenario():
+        release = asyncio.Event()
+        active = []
+
+        @contextlib.asynccontextmanager
+        async def slot():
+            active.append(1)
+            try:
+                yield
+            finally:
+                active.pop()
+
+        async def upload(*args):
+            await release.wait()
+            return 101
+
+        client, _deleted = _client(upload)
+        first = asyncio.create_task(_upload(client, slot))
+        second = asyncio.create_task(_upload(client, slot))
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        assert len(active) == 1
+        first.cancel()
+        await asyncio.sleep(0)
+        # The cancelled caller does not release the slot while the upload is still running.
+        assert len(active) == 1
+        release.set()
+        assert await second == 101
+        assert active == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import time
+
+from usermap import UserMap
+
+
+def _usermap(tmp_path, **kwargs) -> UserMap:
+    usermap = UserMap(str(tmp_path / "users.db"), **kwargs)
+    usermap.init()
+    return usermap
+
+
+def test_cached_link_does_not_wait_for_a_transaction(tmp_path):
+    usermap = _usermap(tmp_path)
+    usermap.set(1, 42)
+    held = threading.Event()
+    release = threading.Event()
+
+    def long_transaction():
+        with usermap._db():
+            held.set()
+            release.wait(5)
+
+    worker = threading.Thread(target=long_transaction)
+    worker.start()
+    held.wait(5)
+    try:
+        started = time.monotonic()
+        assert asyncio.run(usermap.aget(1)) == 42
+        assert time.monotonic() - started < 1.0
+    finally:
+        release.set()
+        worker.join()
+        usermap.close()
+
+
+def test_links_written_by_another_process_show_up_after_the_ttl(tmp_path):
+    usermap = _usermap(tmp_path, positive_ttl_s=0.0)
+    other = _usermap(tmp_path)
+    usermap.set(1, 42)
+    other.set(1, 43)
+    assert usermap.get(1) == 43
+    usermap.close()
+    other.close()
+
+
+def test_positive_entries_are_served_from_cache_within_the_ttl(tmp_path):
+    usermap = _usermap(tmp_path, positive_ttl_s=600.0)
+    other = _usermap(tmp_path)
+    usermap.set(1, 42)
+    other.set(1, 43)
+    assert usermap.get(1) == 42
+    usermap.invalidate(1)
+    assert usermap.get(1) == 43
+    usermap.close()
+    other.close()
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator
+
+
+@dataclass
+class _Waiter:
+    user_id: int
+    size_bytes: int
+    enqueued_at: float
+    seq: int
+    future: asyncio.Future = field(repr=False)
+
+
+@dataclass
+class UploadScheduler:
+    """Process-wide admission for Disk uploads.
+
+    At most `max_concurrency` uploads run at once and at most `per_user_limit`
+    of them for one Telegram user. A free slot goes to the user with the fewest
+    running uploads, then to the smallest file (shortest job first). Waiting
+    time counts as `aging_bytes_per_s` fewer bytes, so large files are not
+    starved by a stream of small ones.
+    """
+
+    max_concurrency: int = 4
+    per_user_limit: int = 2
+    aging_bytes_per_s: float = 1024 * 1024
+    granted: int = 0
+    _running: dict[int, int] = field(default_factory=dict, repr=False)
+    _waiting: list[_Waiter] = field(default_factory=list, repr=False)
+    _waits_s: deque[float] = field(default_factory=lambda: deque(maxlen=256), repr=False)
+    _seq: Any = field(default_factory=itertools.count, repr=False)
+
+    @property
+    def in_flight(self) -> int:
+        return sum(self._running.values())
+
+    def _eligible(self, user_id: int) -> bool:
+        return self._running.get(user_id, 0) < max(1, self.per_user_limit)
+
+    def _rank(self, waiter: _Waiter, now: float) -> tuple[int, float, int]:
+        aged_size = waiter.size_bytes - (now - waiter.enqueued_at) * self.aging_bytes_per_s
+        return self._running.get(waiter.user_id, 0), aged_size, waiter.seq
+
+    def _grant(self, user_id: int, enqueued_at: float) -> None:
+        self._running[user_id] = self._running.get(user_id, 0) + 1
+        self.granted += 1
+        self._waits_s.append(time.monotonic() - enqueued_at)
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        while self._waiting and self.in_flight < max(1, self.max_concurrency):
+            candidates = [w for w in self._waiting if self._eligible(w.user_id) and not w.future.done()]
+            if not candidates:
+                return
+            waiter = min(candidates, key=lambda w: self._rank(w, now))
+            self._waiting.remove(waiter)
+            self._grant(waiter.user_id, waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    def _release(self, user_id: int) -> None:
+        left = self._running.get(user_id, 0) - 1
+        if left > 0:
+            self._running[user_id] = left
+        else:
+            self._running.pop(user_id, None)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, size_bytes: int) -> AsyncIterator[None]:
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(user_id, max(0, int(size_bytes)), time.monotonic(), next(self._seq), loop.create_future())
+        self._waiting.append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted and cancelled in the same tick: hand the slot on.
+                self._release(user_id)
+            elif waiter in self._waiting:
+                self._waiting.remove(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self._release(user_id)
+
+    def stats(self) -> dict[str, Any]:
+        waits = sorted(self._waits_s)
+        now = time.monotonic()
+        return {
+            "in_flight": self.in_flight,
+            "queue_depth": len(self._waiting),
+            "queued_users": len({w.user_id for w in self._waiting}),
+            "oldest_wait_s": round(max((now - w.enqueued_at for w in self._waiting), default=0.0), 3),
+            "granted": self.granted,
+            "wait_avg_s": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "wait_p95_s": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 3) if waits else 0.0,
+        }
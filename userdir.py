@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Iterable, Optional
+
+from bitrix import BitrixClient
+from usermap import UserMap
+
+FULL_SYNC_STATE = "user_directory.full_sync_at"
+
+
+def normalize_name(value: str) -> str:
+    return " ".join(value.replace("ё", "е").replace("Ё", "Е").lower().split())
+
+
+def is_active_flag(value: Any) -> bool:
+    return value not in (False, "N", "false", 0, "0")
+
+
+@dataclass(frozen=True)
+class BitrixUser:
+    id: int
+    name: str
+    last_name: str
+    email: str
+    active: bool
+
+    @property
+    def display_name(self) -> str:
+        full = " ".join(part for part in (self.name, self.last_name) if part)
+        return full or self.email or f"ID {self.id}"
+
+    @classmethod
+    def from_api(cls, payload: dict[str, Any]) -> Optional[BitrixUser]:
+        try:
+            user_id = int(payload.get("ID"))
+        except (TypeError, ValueError):
+            return None
+        return cls(
+            id=user_id,
+            name=str(payload.get("NAME") or "").strip(),
+            last_name=str(payload.get("LAST_NAME") or "").strip(),
+            email=str(payload.get("EMAIL") or "").strip(),
+            active=is_active_flag(payload.get("ACTIVE", True)),
+        )
+
+    def row(self) -> tuple[int, str, str, str, bool]:
+        return (self.id, self.name, self.last_name, self.email, self.active)
+
+
+@dataclass
+class UserDirectory:
+    """Local mirror of the portal's users, indexed by ID, e-mail and name.
+
+    A full sync pages through user.get once (the pages after the first go in
+    batch calls) and marks users the portal no longer returns as inactive.
+    Between full syncs a refresh only reads the newest IDs, so it costs one
+    user.get unless many users were added. Only changed rows are written to
+    SQLite.
+    """
+
+    full_sync_interval_s: float = 86400.0
+    newest_pages: int = 5
+    full_syncs: int = 0
+    incremental_syncs: int = 0
+    on_demand_lookups: int = 0
+    _full_sync_at: float = field(default=0.0, repr=False)
+    _by_id: dict[int, BitrixUser] = field(default_factory=dict, repr=False)
+    _by_email: dict[str, set[int]] = field(default_factory=dict, repr=False)
+    _by_name: dict[str, set[int]] = field(default_factory=dict, repr=False)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def load(self, usermap: UserMap) -> int:
+        self.apply(BitrixUser(*row) for row in usermap.get_bitrix_users())
+        try:
+            self._full_sync_at = float(usermap.get_sync_state(FULL_SYNC_STATE) or 0.0)
+        except ValueError:
+            self._full_sync_at = 0.0
+        return len(self._by_id)
+
+    @staticmethod
+    def _name_keys(user: BitrixUser) -> set[str]:
+        keys = {
+            normalize_name(f"{user.name} {user.last_name}"),
+            normalize_name(f"{user.last_name} {user.name}"),
+            normalize_name(user.last_name),
+        }
+        keys.discard("")
+        return keys
+
+    def _index(self, user: BitrixUser) -> None:
+        self._by_id[user.id] = user
+        if user.email:
+            self._by_email.setdefault(user.email.lower(), set()).add(user.id)
+        for key in self._name_keys(user):
+            self._by_name.setdefault(key, set()).add(user.id)
+
+    def _unindex(self, user: BitrixUser) -> None:
+        self._by_id.pop(user.id, None)
+        for index, keys in (
+            (self._by_email, {user.email.lower()} if user.email else set()),
+            (self._by_name, self._name_keys(user)),
+        ):
+            for key in keys:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(user.id)
+                    if not ids:
+                        del index[key]
+
+    def apply(self, users: Iterable[BitrixUser]) -> list[BitrixUser]:
+        """Update the indexes; returns the users that were new or differed."""
+        changed: list[BitrixUser] = []
+        for user in users:
+            old = self._by_id.get(user.id)
+            if old == user:
+                continue
+            if old is not None:
+                self._unindex(old)
+            self._index(user)
+            changed.append(user)
+        return changed
+
+    def get(self, user_id: int) -> Optional[BitrixUser]:
+        return self._by_id.get(int(user_id))
+
+    def display_name(self, user_id: int) -> Optional[str]:
+        user = self._by_id.get(int(user_id))
+        return user.display_name if user is not None else None
+
+    def find(self, query: str, limit: int = 5) -> list[BitrixUser]:
+        """Active users matching an e-mail or a name ("Имя Фамилия", "Фамилия Имя", "Фамилия").
+
+        Exact index hits win; otherwise names containing the query are
+        scanned, which is fine for a directory of a few thousand users.
+        """
+        text = query.strip()
+        if not text:
+            return []
+        if "@" in text:
+            ids = self._by_email.get(text.lower(), set())
+        else:
+            key = normalize_name(text)
+            ids = self._by_name.get(key, set())
+            if not ids and len(key) >= 3:
+                ids = {
+                    user.id
+                    for user in self._by_id.values()
+                    if key in normalize_name(f"{user.name} {user.last_name}")
+                }
+        found = sorted((self._by_id[uid] for uid in ids if self._by_id[uid].active), key=lambda user: user.id)
+        return found[:max(1, limit)]
+
+    async def _persist(self, usermap: UserMap, changed: list[BitrixUser]) -> None:
+        if changed:
+            await usermap.run(usermap.upsert_bitrix_users, [user.row() for user in changed])
+
+    async def resolve_id(self, bitrix: BitrixClient, usermap: UserMap, user_id: int) -> Optional[BitrixUser]:
+        """The mirrored user, or one user.get for an ID the mirror has not seen yet."""
+        user = self._by_id.get(int(user_id))
+        if user is not None:
+            return user
+        self.on_demand_lookups += 1
+        payload = (await bitrix.get_users([int(user_id)])).get(int(user_id))
+        user = BitrixUser.from_api(payload) if payload is not None else None
+        if user is not None:
+            await self._persist(usermap, self.apply([user]))
+        return user
+
+    async def refresh(self, bitrix: BitrixClient, usermap: UserMap) -> int:
+        """Sync with the portal; returns how many users were added or changed."""
+        now = time.time()
+        full = not self._by_id or now - self._full_sync_at >= self.full_sync_interval_s
+        if full:
+            fetched = [user for user in map(BitrixUser.from_api, await bitrix.list_all_users()) if user]
+            seen = {user.id for user in fetched}
+            gone = [
+                replace(user, active=False)
+                for user in self._by_id.values()
+                if user.id not in seen and user.active
+            ]
+            changed = self.apply([*fetched, *gone])
+        else:
+            newest = await bitrix.list_newest_users(self._by_id, max_pages=self.newest_pages)
+            changed = self.apply(user for user in map(BitrixUser.from_api, newest) if user)
+        await self._persist(usermap, changed)
+        if full:
+            self._full_sync_at = now
+            self.full_syncs += 1
+            await usermap.run(usermap.set_sync_state, FULL_SYNC_STATE, repr(now))
+        else:
+            self.incremental_syncs += 1
+        return len(changed)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "users": len(self._by_id),
+            "active": sum(1 for user in self._by_id.values() if user.active),
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "on_demand_lookups": self.on_demand_lookups,
+            "full_sync_age_s": round(time.time() - self._full_sync_at, 1) if self._full_sync_at else None,
+        }
@@ -1,24 +1,111 @@
 from __future__ import annotations
 
+import asyncio
+import datetime as dt
+import functools
+import logging
 import os
 import sqlite3
-from dataclasses import dataclass
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
 from utils import ensure_dir, now_iso
 
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_UPSERT_LINK_SQL = """
+    INSERT INTO tg_bitrix_map (tg_id, bitrix_user_id, linked_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT(tg_id) DO UPDATE SET
+        bitrix_user_id=excluded.bitrix_user_id,
+        linked_at=excluded.linked_at
+"""
+
+_MISSING = object()
+
+
+def _log_failed_write(future: Future) -> None:
+    exc = future.exception()
+    if exc is not None:
+        log.error("UserMap background write failed", exc_info=exc)
+
 
 @dataclass
 class UserMap:
+    """SQLite-backed store behind one long-lived connection.
+
+    The sync methods are safe from any thread. Code on the event loop should use
+    the async wrappers (or `run`), which execute on a dedicated SQLite thread.
+
+    tg -> Bitrix links are served from a bounded LRU cache, including "not
+    linked" answers. Those expire after `negative_ttl_s`, links after
+    `positive_ttl_s`, so links written or overwritten by another process (e.g.
+    a CSV import) show up without a restart. Writes through this instance
+    update the cache at once.
+    """
+
     db_path: str
+    cache_max_entries: int = 10000
+    negative_ttl_s: float = 60.0
+    positive_ttl_s: float = 600.0
+    cache_hits: int = field(default=0, init=False)
+    cache_misses: int = field(default=0, init=False)
+    _links: OrderedDict = field(default_factory=OrderedDict, init=False, repr=False)
+    _conn: Optional[sqlite3.Connection] = field(default=None, init=False, repr=False)
+    _lock: Any = field(default_factory=threading.RLock, init=False, repr=False)
+    # The link cache has its own lock: the event loop must not wait behind a long transaction.
+    _cache_lock: Any = field(default_factory=threading.Lock, init=False, repr=False)
+    _executor: Optional[ThreadPoolExecutor] = field(default=None, init=False, repr=False)
 
     def _connect(self) -> sqlite3.Connection:
-        ensure_dir(os.path.dirname(self.db_path) or ".")
-        conn = sqlite3.connect(self.db_path)
-        conn.execute("PRAGMA journal_mode=WAL;")
-        return conn
+        # Opened once; sqlite3 keeps the prepared statements cached per connection.
+        if self._conn is None:
+            ensure_dir(os.path.dirname(self.db_path) or ".")
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _db(self) -> Iterator[sqlite3.Connection]:
+        # One transaction at a time on the shared connection.
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                yield conn
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="usermap")
+        return self._executor
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run a blocking UserMap method on the SQLite thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(fn, *args))
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> None:
+        """Queue a write from sync code on the event loop without waiting for it."""
+        self._get_executor().submit(fn, *args).add_done_callback(_log_failed_write)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
     def init(self) -> None:
-        with self._connect() as conn:
+        with self._db() as conn:
             conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS tg_bitrix_map (
@@ -28,27 +115,442 @@ class UserMap:
                 )
                 """
             )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS portal_capabilities (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    checked_at TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS created_by_status (
+                    bitrix_user_id INTEGER PRIMARY KEY,
+                    accepted INTEGER NOT NULL,
+                    checked_at TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS disk_upload_index (
+                    content_key TEXT NOT NULL,
+                    folder_id INTEGER NOT NULL,
+                    file_id INTEGER NOT NULL,
+                    checked_at TEXT NOT NULL,
+                    PRIMARY KEY (content_key, folder_id)
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_disk_upload_file ON disk_upload_index(file_id)")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS upload_strategy_stats (
+                    strategy TEXT NOT NULL,
+                    size_bucket INTEGER NOT NULL,
+                    successes REAL NOT NULL,
+                    failures REAL NOT NULL,
+                    ewma_ms REAL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (strategy, size_bucket)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS bitrix_users (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    last_name TEXT NOT NULL,
+                    email TEXT NOT NULL,
+                    active INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    name TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS task_mirror (
+                    task_id INTEGER PRIMARY KEY,
+                    created_by INTEGER NOT NULL,
+                    changed_date TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    synced_at TEXT NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_task_mirror_created_by ON task_mirror(created_by)")
             conn.commit()
 
+    @staticmethod
+    def _link_key(tg_id: int | str) -> int | str:
+        # Older handlers also store str(tg_id); sqlite keeps both as the same INTEGER key.
+        try:
+            return int(tg_id)
+        except (TypeError, ValueError):
+            return tg_id
+
+    def _cache_link(self, tg_id: int | str, bitrix_user_id: Optional[int]) -> None:
+        if self.cache_max_entries <= 0:
+            return
+        ttl_s = self.positive_ttl_s if bitrix_user_id is not None else self.negative_ttl_s
+        expires_at = time.monotonic() + ttl_s
+        with self._cache_lock:
+            key = self._link_key(tg_id)
+            self._links[key] = (bitrix_user_id, expires_at)
+            self._links.move_to_end(key)
+            while len(self._links) > self.cache_max_entries:
+                self._links.popitem(last=False)
+
+    def _cached_link(self, tg_id: int | str) -> Any:
+        """Cached bitrix_user_id (None = known unlinked), or _MISSING."""
+        with self._cache_lock:
+            key = self._link_key(tg_id)
+            entry = self._links.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._links[key]
+                self.cache_misses += 1
+                return _MISSING
+            self._links.move_to_end(key)
+            self.cache_hits += 1
+            return entry[0]
+
+    def invalidate(self, tg_id: int | str) -> None:
+        with self._cache_lock:
+            self._links.pop(self._link_key(tg_id), None)
+
+    def preload_links(self) -> int:
+        """Warm the link cache from tg_bitrix_map; returns how many rows were loaded."""
+        if self.cache_max_entries <= 0:
+            return 0
+        with self._db() as conn:
+            cur = conn.execute(
+                "SELECT tg_id, bitrix_user_id FROM tg_bitrix_map ORDER BY linked_at DESC LIMIT ?",
+                (self.cache_max_entries,),
+            )
+            rows = cur.fetchall()
+        # Oldest first, so the most recently linked users end up least likely to be evicted.
+        for tg_id, bitrix_user_id in reversed(rows):
+            self._cache_link(tg_id, int(bitrix_user_id))
+        return len(rows)
+
+    def cache_stats(self) -> dict[str, Any]:
+        with self._cache_lock:
+            return {
+                "entries": len(self._links),
+                "negative": sum(1 for value, _ in self._links.values() if value is None),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+            }
+
     def set(self, tg_id: int, bitrix_user_id: int) -> None:
-        with self._connect() as conn:
+        with self._db() as conn:
+            conn.execute(_UPSERT_LINK_SQL, (tg_id, bitrix_user_id, now_iso()))
+            conn.commit()
+            # Under the same lock as the write, so no reader sees the old entry afterwards.
+            self._cache_link(tg_id, int(bitrix_user_id))
+
+    def set_many(self, links: Iterable[tuple[int, int]]) -> int:
+        """Upsert links in one transaction; returns the number of rows written."""
+        linked_at = now_iso()
+        rows = [(int(tg_id), int(bitrix_user_id), linked_at) for tg_id, bitrix_user_id in links]
+        with self._db() as conn:
+            conn.executemany(_UPSERT_LINK_SQL, rows)
+            for tg_id, bitrix_user_id, _ in rows:
+                self._cache_link(tg_id, bitrix_user_id)
+        return len(rows)
+
+    def iter_links(self, batch_size: int = 1000) -> Iterator[tuple[int, int, str]]:
+        """Yield (tg_id, bitrix_user_id, linked_at) ordered by tg_id, one short read per batch."""
+        last_tg_id: Optional[int] = None
+        while True:
+            with self._db() as conn:
+                if last_tg_id is None:
+                    cur = conn.execute(
+                        "SELECT tg_id, bitrix_user_id, linked_at FROM tg_bitrix_map ORDER BY tg_id LIMIT ?",
+                        (batch_size,),
+                    )
+                else:
+                    cur = conn.execute(
+                        """
+                        SELECT tg_id, bitrix_user_id, linked_at FROM tg_bitrix_map
+                        WHERE tg_id > ? ORDER BY tg_id LIMIT ?
+                        """,
+                        (last_tg_id, batch_size),
+                    )
+                rows = cur.fetchall()
+            if not rows:
+                return
+            for tg_id, bitrix_user_id, linked_at in rows:
+                yield int(tg_id), int(bitrix_user_id), str(linked_at)
+            last_tg_id = int(rows[-1][0])
+
+    def get_linked_bitrix_ids(self) -> list[int]:
+        with self._db() as conn:
+            cur = conn.execute("SELECT DISTINCT bitrix_user_id FROM tg_bitrix_map")
+            return [int(row[0]) for row in cur.fetchall()]
+
+    def get(self, tg_id: int) -> Optional[int]:
+        cached = self._cached_link(tg_id)
+        if cached is not _MISSING:
+            return cached
+        return self._load_link(tg_id)
+
+    def _load_link(self, tg_id: int) -> Optional[int]:
+        with self._db() as conn:
+            cur = conn.execute(
+                "SELECT bitrix_user_id FROM tg_bitrix_map WHERE tg_id=?",
+                (tg_id,),
+            )
+            row = cur.fetchone()
+            bitrix_user_id = int(row[0]) if row else None
+            self._cache_link(tg_id, bitrix_user_id)
+            return bitrix_user_id
+
+    async def aget(self, tg_id: int) -> Optional[int]:
+        # Cached answers skip the thread hop entirely.
+        cached = self._cached_link(tg_id)
+        if cached is not _MISSING:
+            return cached
+        return await self.run(self._load_link, tg_id)
+
+    async def aset(self, tg_id: int, bitrix_user_id: int) -> None:
+        await self.run(self.set, tg_id, bitrix_user_id)
+
+    def get_capabilities(self) -> dict[str, str]:
+        with self._db() as conn:
+            cur = conn.execute("SELECT name, value FROM portal_capabilities")
+            return {str(name): str(value) for name, value in cur.fetchall()}
+
+    def set_capability(self, name: str, value: str) -> None:
+        with self._db() as conn:
             conn.execute(
                 """
-                INSERT INTO tg_bitrix_map (tg_id, bitrix_user_id, linked_at)
+                INSERT INTO portal_capabilities (name, value, checked_at)
                 VALUES (?, ?, ?)
-                ON CONFLICT(tg_id) DO UPDATE SET
-                    bitrix_user_id=excluded.bitrix_user_id,
-                    linked_at=excluded.linked_at
+                ON CONFLICT(name) DO UPDATE SET
+                    value=excluded.value,
+                    checked_at=excluded.checked_at
                 """,
-                (tg_id, bitrix_user_id, now_iso()),
+                (name, value, now_iso()),
             )
             conn.commit()
 
-    def get(self, tg_id: int) -> Optional[int]:
-        with self._connect() as conn:
+    def get_created_by_accepted(self, bitrix_user_id: int, max_age_s: float) -> Optional[bool]:
+        with self._db() as conn:
             cur = conn.execute(
-                "SELECT bitrix_user_id FROM tg_bitrix_map WHERE tg_id=?",
-                (tg_id,),
+                "SELECT accepted, checked_at FROM created_by_status WHERE bitrix_user_id=?",
+                (bitrix_user_id,),
             )
             row = cur.fetchone()
-            return int(row[0]) if row else None
+        if not row:
+            return None
+        try:
+            checked_at = dt.datetime.fromisoformat(row[1])
+        except ValueError:
+            return None
+        age_s = (dt.datetime.now().astimezone() - checked_at).total_seconds()
+        if age_s > max_age_s:
+            return None
+        return bool(row[0])
+
+    def set_created_by_accepted(self, bitrix_user_id: int, accepted: bool) -> None:
+        with self._db() as conn:
+            conn.execute(
+                """
+                INSERT INTO created_by_status (bitrix_user_id, accepted, checked_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(bitrix_user_id) DO UPDATE SET
+                    accepted=excluded.accepted,
+                    checked_at=excluded.checked_at
+                """,
+                (bitrix_user_id, 1 if accepted else 0, now_iso()),
+            )
+            conn.commit()
+
+    async def aget_created_by_accepted(self, bitrix_user_id: int, max_age_s: float) -> Optional[bool]:
+        return await self.run(self.get_created_by_accepted, bitrix_user_id, max_age_s)
+
+    async def aset_created_by_accepted(self, bitrix_user_id: int, accepted: bool) -> None:
+        await self.run(self.set_created_by_accepted, bitrix_user_id, accepted)
+
+    def find_disk_upload(self, keys: list[str], folder_id: int, max_age_s: float) -> Optional[tuple[int, float]]:
+        """Return (file_id, age_s) of the most recently checked entry for any of the keys."""
+        if not keys:
+            return None
+        placeholders = ",".join("?" for _ in keys)
+        with self._db() as conn:
+            cur = conn.execute(
+                f"""
+                SELECT content_key, file_id, checked_at FROM disk_upload_index
+                WHERE folder_id=? AND content_key IN ({placeholders})
+                """,
+                (folder_id, *keys),
+            )
+            rows = cur.fetchall()
+            now = dt.datetime.now().astimezone()
+            best: Optional[tuple[int, float]] = None
+            expired: list[str] = []
+            for content_key, file_id, checked_at in rows:
+                try:
+                    age_s = (now - dt.datetime.fromisoformat(checked_at)).total_seconds()
+                except ValueError:
+                    age_s = float("inf")
+                if age_s > max_age_s:
+                    expired.append(content_key)
+                    continue
+                if best is None or age_s < best[1]:
+                    best = (int(file_id), age_s)
+            if expired:
+                conn.executemany(
+                    "DELETE FROM disk_upload_index WHERE content_key=? AND folder_id=?",
+                    [(content_key, folder_id) for content_key in expired],
+                )
+                conn.commit()
+        return best
+
+    def remember_disk_upload(self, keys: list[str], folder_id: int, file_id: int) -> None:
+        checked_at = now_iso()
+        with self._db() as conn:
+            conn.executemany(
+                """
+                INSERT INTO disk_upload_index (content_key, folder_id, file_id, checked_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(content_key, folder_id) DO UPDATE SET
+                    file_id=excluded.file_id,
+                    checked_at=excluded.checked_at
+                """,
+                [(key, folder_id, file_id, checked_at) for key in keys],
+            )
+            conn.commit()
+
+    def forget_disk_upload(self, file_id: int) -> None:
+        with self._db() as conn:
+            conn.execute("DELETE FROM disk_upload_index WHERE file_id=?", (file_id,))
+            conn.commit()
+
+    async def afind_disk_upload(self, keys: list[str], folder_id: int, max_age_s: float) -> Optional[tuple[int, float]]:
+        return await self.run(self.find_disk_upload, keys, folder_id, max_age_s)
+
+    async def aremember_disk_upload(self, keys: list[str], folder_id: int, file_id: int) -> None:
+        await self.run(self.remember_disk_upload, keys, folder_id, file_id)
+
+    async def aforget_disk_upload(self, file_id: int) -> None:
+        await self.run(self.forget_disk_upload, file_id)
+
+    def get_upload_strategy_stats(self) -> list[tuple[str, int, float, float, Optional[float]]]:
+        with self._db() as conn:
+            cur = conn.execute(
+                "SELECT strategy, size_bucket, successes, failures, ewma_ms FROM upload_strategy_stats"
+            )
+            return [
+                (str(strategy), int(bucket), float(successes), float(failures), ewma_ms)
+                for strategy, bucket, successes, failures, ewma_ms in cur.fetchall()
+            ]
+
+    def set_upload_strategy_stats(
+        self,
+        strategy: str,
+        size_bucket: int,
+        successes: float,
+        failures: float,
+        ewma_ms: Optional[float],
+    ) -> None:
+        with self._db() as conn:
+            conn.execute(
+                """
+                INSERT INTO upload_strategy_stats (strategy, size_bucket, successes, failures, ewma_ms, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(strategy, size_bucket) DO UPDATE SET
+                    successes=excluded.successes,
+                    failures=excluded.failures,
+                    ewma_ms=excluded.ewma_ms,
+                    updated_at=excluded.updated_at
+                """,
+                (strategy, size_bucket, successes, failures, ewma_ms, now_iso()),
+            )
+            conn.commit()
+
+    def get_bitrix_users(self) -> list[tuple[int, str, str, str, bool]]:
+        with self._db() as conn:
+            cur = conn.execute("SELECT id, name, last_name, email, active FROM bitrix_users")
+            return [
+                (int(user_id), str(name), str(last_name), str(email), bool(active))
+                for user_id, name, last_name, email, active in cur.fetchall()
+            ]
+
+    def upsert_bitrix_users(self, users: Iterable[tuple[int, str, str, str, bool]]) -> int:
+        updated_at = now_iso()
+        rows = [
+            (int(user_id), name, last_name, email, 1 if active else 0, updated_at)
+            for user_id, name, last_name, email, active in users
+        ]
+        with self._db() as conn:
+            conn.executemany(
+                """
+                INSERT INTO bitrix_users (id, name, last_name, email, active, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    name=excluded.name,
+                    last_name=excluded.last_name,
+                    email=excluded.email,
+                    active=excluded.active,
+                    updated_at=excluded.updated_at
+                """,
+                rows,
+            )
+        return len(rows)
+
+    def get_sync_state(self, name: str) -> Optional[str]:
+        with self._db() as conn:
+            cur = conn.execute("SELECT value FROM sync_state WHERE name=?", (name,))
+            row = cur.fetchone()
+            return str(row[0]) if row else None
+
+    def set_sync_state(self, name: str, value: str) -> None:
+        with self._db() as conn:
+            conn.execute(
+                """
+                INSERT INTO sync_state (name, value, updated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    value=excluded.value,
+                    updated_at=excluded.updated_at
+                """,
+                (name, value, now_iso()),
+            )
+
+    def get_mirrored_tasks(self) -> list[tuple[int, int, str]]:
+        with self._db() as conn:
+            cur = conn.execute("SELECT task_id, created_by, payload FROM task_mirror")
+            return [(int(task_id), int(created_by), str(payload)) for task_id, created_by, payload in cur.fetchall()]
+
+    def update_mirrored_tasks(self, upserts: Iterable[tuple[int, int, str, str]], deletes: Iterable[int]) -> None:
+        """Apply one sync round in a single transaction: (task_id, created_by, changed_date, payload) rows."""
+        synced_at = now_iso()
+        with self._db() as conn:
+            conn.executemany(
+                """
+                INSERT INTO task_mirror (task_id, created_by, changed_date, payload, synced_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(task_id) DO UPDATE SET
+                    created_by=excluded.created_by,
+                    changed_date=excluded.changed_date,
+                    payload=excluded.payload,
+                    synced_at=excluded.synced_at
+                """,
+                [(*row, synced_at) for row in upserts],
+            )
+            conn.executemany("DELETE FROM task_mirror WHERE task_id=?", [(int(task_id),) for task_id in deletes])